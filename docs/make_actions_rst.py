@@ -54,7 +54,8 @@ with open(os.path.join(this_dir, 'actions.rst'), 'w') as h:
         h.write('\n\n')
 
         try:
-            spec = inspect.getargspec(member)
+            # Actions are wrapped for profiling
+            spec = inspect.getargspec(getattr(member, '__wrapped__', member))
         except TypeError:
             pass
         else:
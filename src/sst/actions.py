@@ -40,7 +40,9 @@ id, tag, text, class or other attributes. See the `get_element` documentation.
 """
 
 import codecs
+import collections
 import errno
+import inspect
 import logging
 import os
 import re
@@ -55,7 +57,6 @@ from urlparse import urljoin, urlparse
 from selenium.webdriver.common import keys
 from selenium.webdriver.remote.webelement import WebElement
 from selenium.common.exceptions import (
-    NoSuchAttributeException,
     NoSuchElementException,
     NoSuchFrameException,
     NoSuchWindowException,
@@ -63,7 +64,7 @@ from selenium.common.exceptions import (
     WebDriverException,
 )
 
-from sst import config
+from sst import config, profiling
 
 __all__ = [
     'accept_alert', 'add_cleanup', 'assert_attribute', 'assert_button',
@@ -77,16 +78,17 @@ __all__ = [
     'assert_url_contains', 'assert_url_network_location', 'check_flags',
     'clear_cookies', 'click_button', 'click_element', 'click_link',
     'close_window', 'debug', 'dismiss_alert', 'end_test', 'execute_script',
-    'exists_element', 'fails', 'get_argument', 'get_base_url',
+    'exists_element', 'fails', 'fill_form', 'get_argument', 'get_base_url',
     'get_cookies', 'get_current_url', 'get_element',
     'get_element_by_css', 'get_element_by_xpath', 'get_element_source',
     'get_elements', 'get_elements_by_css', 'get_elements_by_xpath',
-    'get_link_url', 'get_page_source', 'get_text', 'get_wait_timeout',
-    'get_window_size', 'go_back', 'go_to', 'refresh', 'reset_base_url',
+    'get_link_url', 'get_page_source', 'get_table_data', 'get_text',
+    'get_wait_timeout', 'get_window_size', 'go_back', 'go_to', 'refresh',
+    'reset_base_url',
     'retry_on_exception', 'run_test', 'save_page_source', 'set_base_url',
-    'set_checkbox_value', 'set_dropdown_value', 'set_radio_value',
-    'set_wait_timeout', 'set_window_size', 'simulate_keys', 'skip', 'sleep',
-    'switch_to_frame', 'switch_to_window',
+    'set_checkbox_value', 'set_dropdown_value', 'set_page_ready_check',
+    'set_radio_value', 'set_wait_timeout', 'set_window_size',
+    'simulate_keys', 'skip', 'sleep', 'switch_to_frame', 'switch_to_window',
     'take_screenshot', 'toggle_checkbox', 'wait_for',
     'wait_for_and_refresh', 'write_textfield'
 ]
@@ -134,6 +136,7 @@ def retry_on_exception(exception, retries=None):
         def inner(*args, **kwargs):
             tries = 0
             max_time = time.time() + _TIMEOUT - _POLL
+            delays = _poll_delays(_POLL)
 
             def retry():
                 return ((retries is None and time.time() < max_time) or
@@ -148,7 +151,8 @@ def retry_on_exception(exception, retries=None):
                         logger.warning('Retrying after catching: %r' % e)
                     else:
                         raise
-                time.sleep(_POLL)
+                profiling.record_poll()
+                time.sleep(next(delays))
 
         return inner
 
@@ -395,8 +399,7 @@ def assert_checkbox(id_or_elem):
     :return: The element object.
 
     """
-    elem = _get_elem(id_or_elem)
-    _elem_is_type(elem, id_or_elem, 'checkbox')
+    elem, _ = _get_elem_of_type(id_or_elem, 'checkbox')
     return elem
 
 
@@ -410,13 +413,25 @@ def assert_checkbox_value(id_or_elem, value):
         checkbox, or if the checkbox value is not the expected.
 
     """
-    checkbox = assert_checkbox(id_or_elem)
-    real = checkbox.is_selected()
-    msg = 'Checkbox: %r - Has Value: %r' % (_element_to_string(checkbox), real)
+    checkbox, snapshot = _get_elem_of_type(id_or_elem, 'checkbox')
+    real = snapshot['selected']
     if real != value:
+        msg = 'Checkbox: %r - Has Value: %r' % (_ElementString(checkbox),
+                                                real)
         _raise(msg)
 
 
+_element_description_script = '''
+var element = arguments[0];
+var text = element.innerText;
+if (text === undefined) {
+    text = element.textContent;
+}
+return [element.id, text ? text.trim() : text, element.value,
+        element.outerHTML];
+'''
+
+
 def _element_to_string(element):
     """Get a string that can be used to recognize the element.
 
@@ -424,20 +439,42 @@ def _element_to_string(element):
     Otherwise, fall back to the text. If it has no text, to the value.
     Fallback to outerHTML as a last resort.
 
+    The candidates are fetched with a single script call.
+
     """
-    element_id = element.get_attribute('id')
+    element_id, element_text, element_value, outer_html = (
+        _test.browser.execute_script(_element_description_script, element))
     if element_id:
         return element_id
+    elif element_text:
+        return element_text
+    elif element_value:
+        return element_value
     else:
-        element_text = get_text(element)
-        if element_text:
-            return element_text
-        else:
-            element_value = element.get_attribute('value')
-            if element_value:
-                return element_value
-            else:
-                return element.get_attribute('outerHTML')
+        return outer_html
+
+
+class _ElementString(object):
+    """The description of an element, built only when displayed.
+
+    Describing an element requires a browser round trip, messages that are
+    not displayed (log records below the logging level) don't pay for it.
+
+    This is meant for '%r' formats only. The description is not cached, it
+    reflects the element when the message is displayed even if an action
+    changed it in the meantime.
+
+    """
+
+    def __init__(self, element):
+        self.element = element
+
+    def __repr__(self):
+        try:
+            return repr(_element_to_string(self.element))
+        except WebDriverException:
+            # The element is gone (stale or the page changed)
+            return '<unavailable element>'
 
 
 def get_text(id_or_elem):
@@ -459,10 +496,10 @@ def toggle_checkbox(id_or_elem):
         checkbox.
 
     """
-    checkbox = assert_checkbox(id_or_elem)
-    element_string = _element_to_string(checkbox)
-    logger.debug('Toggling checkbox: %r' % element_string)
-    before = checkbox.is_selected()
+    checkbox, snapshot = _get_elem_of_type(id_or_elem, 'checkbox')
+    element_string = _ElementString(checkbox)
+    logger.debug('Toggling checkbox: %r', element_string)
+    before = snapshot['selected']
     checkbox.click()
     after = checkbox.is_selected()
     if before == after:
@@ -481,12 +518,11 @@ def set_checkbox_value(id_or_elem, new_value):
         checkbox.
 
     """
-    checkbox = assert_checkbox(id_or_elem)
-    logger.debug(
-        'Setting checkbox %r to %r' % (_element_to_string(checkbox),
-                                       new_value))
+    checkbox, snapshot = _get_elem_of_type(id_or_elem, 'checkbox')
+    logger.debug('Setting checkbox %r to %r', _ElementString(checkbox),
+                 new_value)
     # There is no method to 'unset' a checkbox in the browser object
-    current_value = checkbox.is_selected()
+    current_value = snapshot['selected']
     if new_value != current_value:
         toggle_checkbox(id_or_elem)
 
@@ -513,9 +549,8 @@ def simulate_keys(id_or_elem, key_to_press):
 
     """
     key_element = _get_elem(id_or_elem)
-    msg = 'Simulating keypress on %r with %r key' \
-        % (_element_to_string(key_element), key_to_press)
-    logger.debug(msg)
+    logger.debug('Simulating keypress on %r with %r key',
+                 _ElementString(key_element), key_to_press)
     key_code = _make_keycode(key_to_press)
     key_element.send_keys(key_code)
 
@@ -533,8 +568,7 @@ def assert_textfield(id_or_elem):
     :return: The element object.
 
     """
-    elem = _get_elem(id_or_elem)
-    _elem_is_type(elem, id_or_elem, *_textfields)  # see _textfields tuple
+    elem, _ = _get_elem_of_type(id_or_elem, *_textfields)
     return elem
 
 
@@ -571,9 +605,9 @@ def write_textfield(id_or_elem, new_text, check=True, clear=True):
 
     """
     textfield = assert_textfield(id_or_elem)
-    msg = 'Writing to textfield %r with text %r' \
-        % (_element_to_string(textfield), new_text)
-    logger.debug(msg)
+    element_string = _ElementString(textfield)
+    logger.debug('Writing to textfield %r with text %r', element_string,
+                 new_text)
 
     if clear:
         clear_textfield(textfield)
@@ -588,7 +622,7 @@ def write_textfield(id_or_elem, new_text, check=True, clear=True):
     current_text = textfield.get_attribute('value')
     if current_text != new_text:
         msg = 'Textfield: %r - did not write. Text was: %r' \
-            % (_element_to_string(textfield), current_text)
+            % (element_string, current_text)
         _raise(msg)
 
 
@@ -603,7 +637,7 @@ def assert_link(id_or_elem):
     link = _get_elem(id_or_elem)
     if link.tag_name != 'a':
         msg = 'The text %r is not part of a Link or a Link ID' \
-            % _element_to_string(link)
+            % _ElementString(link)
         _raise(msg)
     return link
 
@@ -642,7 +676,7 @@ def click_link(id_or_elem, check=False, wait=True):
     link = assert_link(id_or_elem)
     link_url = link.get_attribute('href')
 
-    logger.debug('Clicking link %r' % _element_to_string(link))
+    logger.debug('Clicking link %r', _ElementString(link))
     link.click()
 
     if wait:
@@ -680,7 +714,7 @@ def click_element(id_or_elem, wait=True):
     """
     elem = _get_elem(id_or_elem)
 
-    logger.debug('Clicking element %r' % _element_to_string(elem))
+    logger.debug('Clicking element %r', _ElementString(elem))
     elem.click()
 
     if wait:
@@ -769,11 +803,45 @@ def assert_url_network_location(netloc):
         _raise(msg)
 
 
+def _fixed_poll(poll):
+    while True:
+        yield poll
+
+
+def _backoff_poll(poll):
+    # Start at a tenth of the poll time, doubling up to ten times the poll
+    # time
+    delay = poll / 10.0
+    while True:
+        yield delay
+        delay = min(delay * 2, poll * 10)
+
+
+def _fast_start_poll(poll):
+    # Poll ten times faster during the first second
+    if poll > 0:
+        fast = poll / 10.0
+        for i in range(int(round(1 / fast))):
+            yield fast
+    while True:
+        yield poll
+
+
+_poll_strategies = {
+    'fixed': _fixed_poll,
+    'backoff': _backoff_poll,
+    'fast_start': _fast_start_poll,
+}
+
+
 _TIMEOUT = 10
 _POLL = 0.1
+_OBSERVE_DOM = False
+_POLL_STRATEGY = _fixed_poll
 
 
-def set_wait_timeout(timeout, poll=None):
+def set_wait_timeout(timeout, poll=None, observe_dom=None,
+                     poll_strategy=None):
     """Set the timeout and poll frequency used by `wait_for`.
 
     The default timeout at the start of a test is 10 seconds and the poll
@@ -782,21 +850,62 @@ def set_wait_timeout(timeout, poll=None):
     :argument timeout: The new timeout in seconds.
     :argument poll: The poll frequency in seconds. It is how long `wait_for`
        should wait in between checking its condition.
+    :argument observe_dom: If `True`, `wait_for` waits for the page to change
+       (using a MutationObserver in the browser) instead of polling when
+       waiting for elements or texts. It checks its condition again once
+       the page content changes (and a matching element exists), but never
+       sooner than the poll time.
+    :argument poll_strategy: How the time between two checks evolves, for
+       `wait_for` and `retry_on_exception`. 'fixed' (the default) always
+       waits for the poll time. 'backoff' starts at a tenth of the poll time
+       and doubles it after each check, up to ten times the poll time.
+       'fast_start' polls ten times faster during the first second. It can
+       also be a function taking the poll time and returning an iterator of
+       the times to wait.
 
     """
     msg = 'Setting wait timeout to %rs' % timeout
     if poll is not None:
         msg += ('. Setting poll time to %rs' % poll)
+    if observe_dom is not None:
+        msg += ('. Setting DOM observation to %r' % observe_dom)
+    if poll_strategy is not None:
+        msg += ('. Setting poll strategy to %r' % poll_strategy)
     logger.debug(msg)
-    _set_wait_timeout(timeout, poll)
+    _set_wait_timeout(timeout, poll, observe_dom, poll_strategy)
 
 
-def _set_wait_timeout(timeout, poll=None):
+def _set_wait_timeout(timeout, poll=None, observe_dom=None,
+                      poll_strategy=None):
     global _TIMEOUT
     global _POLL
+    global _OBSERVE_DOM
+    global _POLL_STRATEGY
     _TIMEOUT = timeout
     if poll is not None:
         _POLL = poll
+    if observe_dom is not None:
+        _OBSERVE_DOM = observe_dom
+    if poll_strategy is not None:
+        if not callable(poll_strategy):
+            try:
+                poll_strategy = _poll_strategies[poll_strategy]
+            except KeyError:
+                raise ValueError('Unknown poll strategy: %r'
+                                 % (poll_strategy,))
+        _POLL_STRATEGY = poll_strategy
+
+
+def _poll_delays(poll):
+    """Return an iterator of the times to wait between two checks.
+
+    The last time is repeated once the strategy runs out of them.
+    """
+    delay = poll
+    for delay in _POLL_STRATEGY(poll):
+        yield delay
+    while True:
+        yield delay
 
 
 def get_wait_timeout():
@@ -827,6 +936,9 @@ def _wait_for(action, refresh_page, timeout, poll, *args, **kwargs):
     # Disable logging levels equal to or lower than INFO.
     logging.disable(logging.INFO)
     result = None
+    delays = _poll_delays(poll)
+    # Whether the browser script timeout was changed to wait in the browser
+    observed = []
     try:
         max_time = time.time() + timeout
         while True:
@@ -846,13 +958,158 @@ def _wait_for(action, refresh_page, timeout, poll, *args, **kwargs):
                 if e:
                     error += '\nError during wait: %s' % e
                 _raise(error)
-            time.sleep(poll)
+            profiling.record_poll()
+            delay = next(delays)
+            start = time.time()
+            if (refresh_page or
+                    not _wait_for_dom_change(action, args, kwargs, max_time,
+                                             delay, observed)):
+                time.sleep(delay)
+            elif time.time() - start < delay:
+                # Don't check again right away
+                time.sleep(delay)
     finally:
+        if observed:
+            _restore_script_timeout()
         # Re-enable logging.
         logging.disable(logging.NOTSET)
     return result
 
 
+# Resolves to true when the page changes after the script started, once an
+# element matches the selector if there is one. It never resolves before
+# min_delay (in milliseconds) so the page is not checked again too often.
+# Resolves to false when the timeout (in milliseconds) expires.
+_wait_for_dom_change_script = '''
+var kind = arguments[0], selector = arguments[1], timeout = arguments[2],
+    minDelay = arguments[3];
+var done = arguments[arguments.length - 1];
+var start = new Date().getTime();
+function matches() {
+    if (kind === 'css') {
+        return document.querySelector(selector) !== null;
+    }
+    return document.evaluate(selector, document, null,
+        XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue !== null;
+}
+var timer;
+var observer = new MutationObserver(function () {
+    if (kind !== null && !matches()) {
+        return;
+    }
+    observer.disconnect();
+    clearTimeout(timer);
+    var elapsed = new Date().getTime() - start;
+    setTimeout(function () {
+        done(true);
+    }, Math.max(0, minDelay - elapsed));
+});
+timer = setTimeout(function () {
+    observer.disconnect();
+    done(false);
+}, timeout);
+var options = {childList: true, subtree: true, characterData: true,
+               attributes: true};
+if (kind === null) {
+    // Only the attributes that can display or hide elements, animations
+    // change the others all the time
+    options.attributeFilter = ['class', 'style', 'hidden'];
+}
+observer.observe(document, options);
+'''
+
+
+def _dom_condition(action, args, kwargs):
+    """Return how the browser can tell that `action` may now succeed.
+
+    :return: None if `action` doesn't only depend on the page content, a
+        (kind, selector) tuple otherwise. kind is 'css' or 'xpath' when
+        `action` succeeds if an element matches selector, None if it depends
+        on the page content in a way the browser can't check.
+    """
+    # Profiling wraps the actions, the real one has the signature
+    signature = getattr(action, '__wrapped__', action)
+    if action in (get_elements_by_css, get_element_by_css):
+        return ('css',
+                inspect.getcallargs(signature, *args, **kwargs)['selector'])
+    if action in (get_elements_by_xpath, get_element_by_xpath):
+        return ('xpath',
+                inspect.getcallargs(signature, *args, **kwargs)['selector'])
+    if action in (get_elements, get_element, exists_element, assert_element):
+        criteria = inspect.getcallargs(signature, *args, **kwargs)
+        attributes = criteria.pop('kwargs')
+        if criteria['text'] or criteria['text_regex']:
+            return None, None
+        selector = _css_selector(criteria['tag'], criteria['css_class'],
+                                 criteria['id'], attributes)
+        if not selector:
+            # No criteria, the action will fail anyway
+            return None
+        return 'css', selector
+    if action in (assert_displayed, assert_table_has_rows,
+                  assert_table_row_contains_text, assert_title,
+                  assert_title_contains):
+        return None, None
+    # The texts (input values), attributes (properties) and css properties
+    # (computed styles) can change without mutating the page, they are
+    # polled.
+    return None
+
+
+# The maximum time (in seconds) spent waiting in the browser before checking
+# again
+_MAX_BROWSER_WAIT = 1.0
+
+
+def _wait_for_dom_change(action, args, kwargs, max_time, min_delay,
+                         observed):
+    """Wait in the browser for the page to change so `action` may succeed.
+
+    :param min_delay: The minimum time (in seconds) to wait.
+    :param observed: A list, empty until the browser script timeout is
+        changed to wait in the browser. It needs to be restored once done.
+    :return: False if we can't wait for the page to change and need to poll.
+    """
+    if not _OBSERVE_DOM:
+        return False
+    try:
+        condition = _dom_condition(action, args, kwargs)
+    except TypeError:
+        # Invalid arguments, the action will tell
+        return False
+    if condition is None:
+        return False
+    kind, selector = condition
+    timeout = max_time - time.time()
+    if timeout <= 0:
+        return True
+    try:
+        if not observed:
+            # Long enough for all the waits of this wait_for
+            _test.browser.set_script_timeout(timeout + 1)
+            observed.append(True)
+        # A change happening before the script starts observing is caught
+        # by checking again periodically
+        browser_wait = min(timeout, max(_MAX_BROWSER_WAIT, min_delay))
+        _test.browser.execute_async_script(
+            _wait_for_dom_change_script, kind, selector,
+            int(browser_wait * 1000), int(min_delay * 1000))
+    except WebDriverException:
+        # The page was left while waiting or the browser doesn't support
+        # MutationObserver
+        return False
+    return True
+
+
+def _restore_script_timeout():
+    # WebDriver can't tell the script timeout, the test knows it
+    try:
+        _test.browser.set_script_timeout(_test.script_timeout)
+    except WebDriverException:
+        # The browser is gone, the wait failed anyway
+        pass
+
+
 # Selenium sometimes raises StaleElementReferenceException which leads to
 # spurious failures. In those cases, using this decorator will retry the
 # function once and avoid the spurious failure. This is a work-around until
@@ -935,14 +1192,194 @@ def _get_elem(id_or_elem):
         _raise(msg)
 
 
+# Port of the rules the WebDriver atoms use to decide whether an element is
+# displayed and to compute its text, so the texts read in a single script
+# call match WebElement.text: hidden descendants are skipped and whitespace
+# is collapsed. The image map and overflow rules are not ported.
+_visible_text_functions = '''
+function effectiveStyle(element, property) {
+    return window.getComputedStyle(element, null).getPropertyValue(property);
+}
+function isElement(node, tagName) {
+    return node.nodeType === 1 &&
+        (!tagName || node.tagName.toUpperCase() === tagName);
+}
+function hasPositiveSize(element) {
+    var rect = element.getBoundingClientRect();
+    if (rect.width > 0 && rect.height > 0) {
+        return true;
+    }
+    // Zero-sized elements are shown when one of their children is, unless
+    // they hide their overflow.
+    if (effectiveStyle(element, 'overflow') === 'hidden') {
+        return false;
+    }
+    for (var i = 0; i < element.childNodes.length; i++) {
+        var child = element.childNodes[i];
+        if (child.nodeType === 3 ||
+                (isElement(child) && hasPositiveSize(child))) {
+            return true;
+        }
+    }
+    return false;
+}
+function isDisplayed(element, ignoreOpacity) {
+    var tagName = element.tagName.toUpperCase();
+    if (tagName === 'OPTION' || tagName === 'OPTGROUP') {
+        var select = element.parentNode;
+        while (select && !isElement(select, 'SELECT')) {
+            select = select.parentNode;
+        }
+        return !!select && isDisplayed(select, true);
+    }
+    if ((tagName === 'INPUT' && element.type.toLowerCase() === 'hidden') ||
+            tagName === 'NOSCRIPT') {
+        return false;
+    }
+    var visibility = effectiveStyle(element, 'visibility');
+    if (visibility === 'hidden' || visibility === 'collapse') {
+        return false;
+    }
+    var opacity = 1;
+    for (var node = element; node && node.nodeType === 1;
+            node = node.parentNode) {
+        if (effectiveStyle(node, 'display') === 'none') {
+            return false;
+        }
+        opacity *= parseFloat(effectiveStyle(node, 'opacity'));
+    }
+    if (!ignoreOpacity && opacity === 0) {
+        return false;
+    }
+    return hasPositiveSize(element);
+}
+var inlineDisplays = ['inline', 'inline-block', 'inline-table', 'none',
+                      'table-cell', 'table-column', 'table-column-group'];
+function isBlank(line) {
+    return /^\\s*$/.test(line);
+}
+function appendTextNode(node, lines, whiteSpace, textTransform) {
+    var text = node.nodeValue.replace(/\\u200b/g, '');
+    text = text.replace(/\\r\\n|\\r/g, '\\n');
+    if (whiteSpace === 'normal' || whiteSpace === 'nowrap') {
+        text = text.replace(/\\n/g, ' ');
+    }
+    if (whiteSpace === 'pre' || whiteSpace === 'pre-wrap') {
+        text = text.replace(/[ \\f\\t\\v\\u2028\\u2029]/g, '\\u00a0');
+    } else {
+        text = text.replace(/[ \\f\\t\\v\\u2028\\u2029]+/g, ' ');
+    }
+    if (textTransform === 'capitalize') {
+        text = text.replace(/(^|\\s)(\\S)/g, function(match, space, first) {
+            return space + first.toUpperCase();
+        });
+    } else if (textTransform === 'uppercase') {
+        text = text.toUpperCase();
+    } else if (textTransform === 'lowercase') {
+        text = text.toLowerCase();
+    }
+    var line = lines.pop() || '';
+    if (/ $/.test(line) && /^ /.test(text)) {
+        text = text.substr(1);
+    }
+    lines.push(line + text);
+}
+function appendElement(element, lines) {
+    if (isElement(element, 'BR')) {
+        lines.push('');
+        return;
+    }
+    var isCell = isElement(element, 'TD');
+    var display = effectiveStyle(element, 'display');
+    var isBlock = !isCell && inlineDisplays.indexOf(display) === -1;
+    var previous = element.previousElementSibling;
+    var runIn = (previous && effectiveStyle(previous, 'display') === 'run-in'
+                 && effectiveStyle(element, 'float') === 'none');
+    if (isBlock && !runIn && !isBlank(lines[lines.length - 1])) {
+        lines.push('');
+    }
+    // The text nodes of a hidden element are skipped but its children may
+    // still be displayed (e.g. visibility: visible below visibility: hidden).
+    var shown = isDisplayed(element);
+    var whiteSpace = shown ? effectiveStyle(element, 'white-space') : null;
+    var textTransform = (shown ? effectiveStyle(element, 'text-transform')
+                         : null);
+    for (var i = 0; i < element.childNodes.length; i++) {
+        var child = element.childNodes[i];
+        if (child.nodeType === 3 && shown) {
+            appendTextNode(child, lines, whiteSpace, textTransform);
+        } else if (isElement(child)) {
+            appendElement(child, lines);
+        }
+    }
+    var line = lines[lines.length - 1];
+    // Table cells are separated by a single space.
+    if ((isCell || display === 'table-cell') && line && !/ $/.test(line)) {
+        lines[lines.length - 1] += ' ';
+    }
+    if (isBlock && display !== 'run-in' && !isBlank(line)) {
+        lines.push('');
+    }
+}
+function trimLine(line) {
+    return line.replace(/^[^\\S\\u00a0]+|[^\\S\\u00a0]+$/g, '');
+}
+function visibleText(element) {
+    var lines = [''];
+    appendElement(element, lines);
+    for (var i = 0; i < lines.length; i++) {
+        lines[i] = trimLine(lines[i]);
+    }
+    return trimLine(lines.join('\\n')).replace(/\\u00a0/g, ' ');
+}
+'''
+
+
+_element_snapshot_script = _visible_text_functions + '''
+var element = arguments[0];
+var displayed = isDisplayed(element);
+var text = visibleText(element);
+return {
+    'tag': element.tagName.toLowerCase(),
+    'type': element.type === undefined ? null : element.type,
+    'id': element.id,
+    'value': element.value === undefined ? null : element.value,
+    'text': text,
+    'displayed': displayed,
+    'selected': !!(element.checked || element.selected)
+};
+'''
+
+
+def _element_snapshot(elem):
+    """Return the state of an element fetched in a single script call.
+
+    The returned dict has the 'tag', 'type', 'id', 'value', 'text',
+    'displayed' and 'selected' keys. Actions checking several properties of
+    an element keep the snapshot for their duration instead of issuing one
+    WebDriver command per property.
+
+    """
+    return _test.browser.execute_script(_element_snapshot_script, elem)
+
+
+def _get_elem_of_type(id_or_elem, *elem_types):
+    """Return an element and its snapshot, asserting the type of the element.
+
+    :raise: AssertionError if the element doesn't exist or if its type is not
+        one of `elem_types`.
+
+    """
+    elem = _get_elem(id_or_elem)
+    snapshot = _element_snapshot(elem)
+    _elem_is_type(snapshot, id_or_elem, *elem_types)
+    return elem, snapshot
+
+
 # Takes an optional 2nd input type for cases like textfield & password
 #    where types are similar
-def _elem_is_type(elem, name, *elem_types):
-    try:
-        result = elem.get_attribute('type')
-    except NoSuchAttributeException:
-        msg = 'Element has no type attribute'
-        _raise(msg)
+def _elem_is_type(snapshot, name, *elem_types):
+    result = snapshot['type']
     if not result in elem_types:
         msg = 'Element %r is not one of %r' % (name, elem_types)
         _raise(msg)
@@ -957,11 +1394,41 @@ def assert_dropdown(id_or_elem):
     :return: The element object.
 
     """
-    elem = _get_elem(id_or_elem)
-    _elem_is_type(elem, id_or_elem, 'select-one')
+    elem, _ = _get_elem_of_type(id_or_elem, 'select-one')
     return elem
 
 
+_find_option_script = '''
+var select = arguments[0];
+var attribute = arguments[1];
+var wanted = arguments[2];
+var selectedOnly = arguments[3];
+for (var i = 0; i < select.options.length; i++) {
+    var option = select.options[i];
+    var found = attribute == 'text' ? option.text.trim() : option.value;
+    if (found === wanted && !(selectedOnly && option.value !== select.value)) {
+        return option;
+    }
+}
+return null;
+'''
+
+
+def _find_option(select, attribute, wanted, selected_only=False):
+    """Find the option of a drop-down list with a single script call.
+
+    :argument select: The drop-down list element object.
+    :argument attribute: Either 'text' or 'value'.
+    :argument wanted: The expected text or value of the option.
+    :argument selected_only: If `True`, the option is returned only if its
+        value is the one of the drop-down list.
+    :return: The option element object or `None` if no option matches.
+
+    """
+    return _test.browser.execute_script(
+        _find_option_script, select, attribute, wanted, selected_only)
+
+
 def set_dropdown_value(id_or_elem, text=None, value=None):
     """Set the value of a drop-down list.
 
@@ -976,20 +1443,19 @@ def set_dropdown_value(id_or_elem, text=None, value=None):
 
     """
     elem = assert_dropdown(id_or_elem)
-    logger.debug(
-        'Setting %r option list to %r' % (_element_to_string(elem),
-                                          text or value))
+    logger.debug('Setting %r option list to %r', _ElementString(elem),
+                 text or value)
     if text and not value:
-        for element in elem.find_elements_by_tag_name('option'):
-            if element.text.strip() == text:
-                element.click()
-                return
+        option = _find_option(elem, 'text', text)
+        if option is not None:
+            option.click()
+            return
         msg = 'The following option could not be found in the list: %r' % text
     elif value and not text:
-        for element in elem.find_elements_by_tag_name('option'):
-            if element.get_attribute("value") == value:
-                element.click()
-                return
+        option = _find_option(elem, 'value', value)
+        if option is not None:
+            option.click()
+            return
         msg = 'The following option could not be found in the list: %r' % value
     else:
         msg = 'Use set_dropdown_value() with either text or value!'
@@ -1008,11 +1474,8 @@ def assert_dropdown_value(id_or_elem, text_in):
     elem = assert_dropdown(id_or_elem)
     # Because there is no way to connect the current
     # text of a select element we have to use 'value'
-    current = elem.get_attribute('value')
-    for element in elem.find_elements_by_tag_name('option'):
-        if text_in == element.text and \
-                current == element.get_attribute('value'):
-            return
+    if _find_option(elem, 'text', text_in, selected_only=True) is not None:
+        return
     msg = 'The option is not currently set to: %r' % text_in
     _raise(msg)
 
@@ -1026,8 +1489,7 @@ def assert_radio(id_or_elem):
     :return: The element object.
 
     """
-    elem = _get_elem(id_or_elem)
-    _elem_is_type(elem, id_or_elem, 'radio')
+    elem, _ = _get_elem_of_type(id_or_elem, 'radio')
     return elem
 
 
@@ -1041,10 +1503,10 @@ def assert_radio_value(id_or_elem, value):
         or the value is not the expected.
 
     """
-    elem = assert_radio(id_or_elem)
-    selected = elem.is_selected()
-    msg = 'Radio %r should be set to: %s.' % (_element_to_string(elem), value)
+    elem, snapshot = _get_elem_of_type(id_or_elem, 'radio')
+    selected = snapshot['selected']
     if value != selected:
+        msg = 'Radio %r should be set to: %s.' % (_ElementString(elem), value)
         _raise(msg)
 
 
@@ -1057,10 +1519,144 @@ def set_radio_value(id_or_elem):
 
     """
     elem = assert_radio(id_or_elem)
-    logger.debug('Selecting radio button item %r' % _element_to_string(elem))
+    logger.debug('Selecting radio button item %r', _ElementString(elem))
     elem.click()
 
 
+_form_fields_script = '''
+var fields = arguments[0];
+var states = [];
+for (var i = 0; i < fields.length; i++) {
+    var element = fields[i];
+    if (typeof element == 'string') {
+        element = document.getElementById(element);
+    }
+    if (element === null) {
+        states.push(null);
+        continue;
+    }
+    var option = null;
+    if (element.type == 'select-one' && element.selectedIndex >= 0) {
+        option = element.options[element.selectedIndex].text.trim();
+    }
+    states.push({
+        'element': element,
+        'type': element.type === undefined ? null : element.type,
+        'value': element.value === undefined ? null : element.value,
+        'selected': !!element.checked,
+        'option': option
+    });
+}
+return states;
+'''
+
+
+def _get_form_fields(elems):
+    """Return the states of several form fields with a single script call.
+
+    :argument elems: A list of identifiers or element objects.
+    :return: A list with, for each field, `None` if it doesn't exist or a dict
+        with the 'element', 'type', 'value', 'selected' and 'option' (the text
+        of the selected option of drop-down lists) keys.
+
+    """
+    return _test.browser.execute_script(_form_fields_script, elems)
+
+
+_form_field_types = _textfields + ('checkbox', 'radio', 'select-one')
+
+
+def fill_form(fields, check=True):
+    """Fill several fields of a form.
+
+    All the fields are checked before anything is written, then the fields
+    are written and read back together, which requires much less round trips
+    to the browser than filling the fields one by one.
+
+    The value expected for each field depends on its type:
+
+    - text fields: the text to write, like `write_textfield`.
+    - checkboxes: `True` to select the checkbox, `False` otherwise.
+    - radio buttons: `True`, the radio button is selected.
+    - drop-down lists: the text of the option to select.
+
+    :argument fields: A dict, or a sequence of pairs when the order matters,
+        associating the identifier of each field, or its element object, to
+        its value.
+    :argument check: If `True`, a check will be made to make sure that the
+        fields have the expected values once written.
+    :raise: AssertionError if a field doesn't exist, if it isn't one of the
+        supported types, if an option is not in a drop-down list, or if a
+        field doesn't have the expected value once written. TypeError if a
+        radio button value is not `True`.
+
+    """
+    if isinstance(fields, collections.Mapping):
+        fields = fields.items()
+    fields = list(fields)
+    names = [name for name, _ in fields]
+    logger.debug('Filling form fields %r', names)
+
+    states = _get_form_fields(names)
+    for (name, value), state in zip(fields, states):
+        if state is None:
+            _raise('Element with id: %r does not exist' % (name,))
+        _elem_is_type(state, name, *_form_field_types)
+        if state['type'] == 'radio' and value is not True:
+            raise TypeError('Radio %r can only be set to True' % (name,))
+
+    # Empty text fields don't need to be cleared
+    to_clear = [state['element'] for state in states
+                if state['type'] in _textfields and state['value']]
+    for textfield in to_clear:
+        send_keys_select_all(textfield)
+        textfield.send_keys(keys.Keys.DELETE)
+    if to_clear:
+        for state in _get_form_fields(to_clear):
+            if state['value'] != '':
+                # for when send_keys does not work, e.g. PhantomJS
+                state['element'].clear()
+
+    for (name, value), state in zip(fields, states):
+        elem = state['element']
+        if state['type'] in _textfields:
+            if isinstance(value, unicode):
+                elem.send_keys(value)
+            else:
+                elem.send_keys(str(value))
+        elif state['type'] in ('checkbox', 'radio'):
+            if state['selected'] != value:
+                elem.click()
+        else:
+            option = _find_option(elem, 'text', value)
+            if option is None:
+                msg = ('The following option could not be found in the list:'
+                       ' %r' % value)
+                _raise(msg)
+            option.click()
+
+    if not check:
+        return
+    logger.debug('Check form fields were filled correctly')
+    written = _get_form_fields([state['element'] for state in states])
+    for (name, value), state in zip(fields, written):
+        element_string = _ElementString(state['element'])
+        if state['type'] in _textfields and state['value'] != value:
+            msg = 'Textfield: %r - did not write. Text was: %r' \
+                % (element_string, state['value'])
+            _raise(msg)
+        elif state['type'] == 'checkbox' and state['selected'] != value:
+            msg = 'Checkbox: %r - Has Value: %r' % (element_string,
+                                                    state['selected'])
+            _raise(msg)
+        elif state['type'] == 'radio' and not state['selected']:
+            msg = 'Radio %r should be set to: %s.' % (element_string, value)
+            _raise(msg)
+        elif state['type'] == 'select-one' and state['option'] != value:
+            msg = 'The option is not currently set to: %r' % value
+            _raise(msg)
+
+
 def assert_text(id_or_elem, text):
     """Assert the text of an element.
 
@@ -1081,30 +1677,25 @@ def assert_text(id_or_elem, text):
 
 def _get_text_for_assertion(id_or_elem):
     elem = _get_elem(id_or_elem)
-    if _is_text_field(elem):
-        value = elem.get_attribute('value')
+    snapshot = _element_snapshot(elem)
+    if _is_text_field(snapshot):
+        value = snapshot['value']
         if not value:
             # The text field is empty.
             return ''
         else:
             return value
     else:
-        text = get_text(elem)
+        text = snapshot['text']
         if not text:
-            msg = 'Element %r has no text.' % _element_to_string(elem)
+            msg = 'Element %r has no text.' % _ElementString(elem)
             _raise(msg)
         else:
             return text
 
 
-def _is_text_field(element):
-    # XXX refactor assert_textfield. It should be the other way around,
-    # assert_textfield should call is_text_field. -- elopio 2013-04-18
-    try:
-        assert_textfield(element)
-        return True
-    except AssertionError:
-        return False
+def _is_text_field(snapshot):
+    return snapshot['type'] in _textfields
 
 
 def assert_text_contains(id_or_elem, text, regex=False):
@@ -1130,15 +1721,6 @@ def assert_text_contains(id_or_elem, text, regex=False):
             _raise(msg)
 
 
-def _check_text(elem, text):
-    return get_text(elem) == text
-
-
-def _match_text(elem, regex):
-    text = get_text(elem) or ''
-    return bool(re.search(regex, text))
-
-
 def get_active_element():
     return _test.browser.switch_to.active_element
 
@@ -1168,17 +1750,7 @@ def get_elements(tag=None, css_class=None, id=None, text=None,
     if text and text_regex:
         raise TypeError("You can't use text and text_regex arguments")
 
-    selector_string = ''
-    if tag:
-        selector_string = tag
-    if css_class:
-        css_class_selector = css_class.strip().replace(' ', '.')
-        selector_string += ('.%s' % css_class_selector)
-    if id:
-        selector_string += ('#%s' % id)
-
-    selector_string += ''.join(['[%s=%r]' % (key, value) for
-                                key, value in kwargs.items()])
+    selector_string = _css_selector(tag, css_class, id, kwargs)
     try:
         if text and not selector_string:
             elems = _test.browser.find_elements_by_xpath(
@@ -1187,18 +1759,16 @@ def get_elements(tag=None, css_class=None, id=None, text=None,
             if not selector_string:
                 msg = 'Could not identify element: no arguments provided'
                 _raise(msg)
-            elems = _test.browser.find_elements_by_css_selector(
-                selector_string)
+            if text or text_regex:
+                elems = _find_elements_with_text(selector_string, text,
+                                                 text_regex)
+            else:
+                elems = _test.browser.find_elements_by_css_selector(
+                    selector_string)
     except (WebDriverException, NoSuchElementException) as e:
         msg = 'Element not found: %s' % e
         _raise(msg)
 
-    if text:
-        # if text was specified, filter elements
-        elems = [element for element in elems if _check_text(element, text)]
-    elif text_regex:
-        elems = [elem for elem in elems if _match_text(elem, text_regex)]
-
     if not elems:
         msg = 'Could not identify elements: 0 elements found'
         _raise(msg)
@@ -1206,6 +1776,55 @@ def get_elements(tag=None, css_class=None, id=None, text=None,
     return elems
 
 
+_find_elements_with_text_script = _visible_text_functions + '''
+var elements = document.querySelectorAll(arguments[0]);
+var text = arguments[1];
+var found = [];
+for (var i = 0; i < elements.length; i++) {
+    var elementText = visibleText(elements[i]);
+    if (text === null) {
+        found.push([elements[i], elementText]);
+    } else if (elementText === text) {
+        found.push(elements[i]);
+    }
+}
+return found;
+'''
+
+
+def _find_elements_with_text(selector, text=None, text_regex=None):
+    """Find the elements matching a CSS selector and a text.
+
+    The elements are found with a single script call whatever their number,
+    their texts are computed like `WebElement.text`. `text` is compared in
+    the browser which returns only the matching elements. `text_regex` is a
+    python regular expression, it is searched in the texts returned along
+    with the elements.
+
+    """
+    found = _test.browser.execute_script(
+        _find_elements_with_text_script, selector, text or None)
+    if text:
+        return found
+    return [elem for elem, elem_text in found
+            if re.search(text_regex, elem_text or '')]
+
+
+def _css_selector(tag, css_class, id, attributes):
+    selector_string = ''
+    if tag:
+        selector_string = tag
+    if css_class:
+        css_class_selector = css_class.strip().replace(' ', '.')
+        selector_string += ('.%s' % css_class_selector)
+    if id:
+        selector_string += ('#%s' % id)
+
+    selector_string += ''.join(['[%s=%r]' % (key, value) for
+                                key, value in attributes.items()])
+    return selector_string
+
+
 def get_element(tag=None, css_class=None, id=None, text=None,
                 text_regex=None, **kwargs):
     """Return an element object.
@@ -1301,11 +1920,12 @@ def assert_button(id_or_elem):
 
     """
     elem = _get_elem(id_or_elem)
-    if elem.tag_name == 'button':
+    snapshot = _element_snapshot(elem)
+    if snapshot['tag'] == 'button':
         return elem
-    if elem.get_attribute('type') == 'button':
+    if snapshot['type'] == 'button':
         return elem
-    _elem_is_type(elem, id_or_elem, 'submit')
+    _elem_is_type(snapshot, id_or_elem, 'submit')
     return elem
 
 
@@ -1321,7 +1941,7 @@ def click_button(id_or_elem, wait=True):
     """
     button = assert_button(id_or_elem)
 
-    logger.debug('Clicking button %r' % _element_to_string(button))
+    logger.debug('Clicking button %r', _ElementString(button))
     button.click()
 
     if wait:
@@ -1394,8 +2014,49 @@ def get_element_by_xpath(selector):
     return elements[0]
 
 
+_PAGE_READY_CHECK = 'ready_state'
+
+
+def set_page_ready_check(check):
+    """Set how the actions loading a page wait for it to be ready.
+
+    This is used by `go_to`, `go_back`, `refresh`, `click_button`,
+    `click_link` and `click_element` when their `wait` argument is `True`.
+
+    :argument check: 'ready_state' (the default) checks the document state
+        and its body with a single script call. 'body' looks for the body
+        element. `None` doesn't wait.
+
+    """
+    logger.debug('Setting page ready check to %r' % (check,))
+    _set_page_ready_check(check)
+
+
+def _set_page_ready_check(check):
+    global _PAGE_READY_CHECK
+    if check not in ('ready_state', 'body', None):
+        raise ValueError('Unknown page ready check: %r' % (check,))
+    _PAGE_READY_CHECK = check
+
+
+_page_is_ready_script = '''
+return document.readyState !== 'loading' && document.body !== null;
+'''
+
+
+def _page_is_ready():
+    try:
+        return _test.browser.execute_script(_page_is_ready_script)
+    except WebDriverException:
+        # The page is being unloaded
+        return False
+
+
 def _waitforbody():
-    wait_for(get_element, tag='body')
+    if _PAGE_READY_CHECK == 'ready_state':
+        wait_for(_page_is_ready)
+    elif _PAGE_READY_CHECK == 'body':
+        wait_for(get_element, tag='body')
 
 
 def get_page_source():
@@ -1528,6 +2189,61 @@ def dismiss_alert(expected_text=None, text_to_write=None):
     _alert_action('dismiss', expected_text, text_to_write)
 
 
+_table_data_script = _visible_text_functions + '''
+var table = arguments[0];
+var texts = function (elements) {
+    var result = [];
+    for (var i = 0; i < elements.length; i++) {
+        result.push(visibleText(elements[i]));
+    }
+    return result;
+};
+var data = {'tag': table.tagName.toLowerCase(),
+            'headers': null, 'rows': null};
+if (data.tag != 'table') {
+    return data;
+}
+data.headers = texts(table.getElementsByTagName('th'));
+var bodies = table.getElementsByTagName('tbody');
+if (bodies.length) {
+    var rows = bodies[0].getElementsByTagName('tr');
+    data.rows = [];
+    for (var i = 0; i < rows.length; i++) {
+        data.rows.push(texts(rows[i].getElementsByTagName('td')));
+    }
+}
+return data;
+'''
+
+
+def get_table_data(id_or_elem):
+    """Return the texts of the headers and cells of a table.
+
+    The whole table is read with a single script call, the texts are
+    computed like `WebElement.text`.
+
+    :argument id_or_elem: The identifier of the element, or its element object.
+    :raise: AssertionError if the element doesn't exist or isn't a table.
+    :return: A dict with a 'headers' key for the list of the texts of the
+        `<th>` tags and a 'rows' key for the list of the rows inside the
+        `<tbody>`, each row being the list of the texts of its `<td>` tags.
+        'rows' is `None` if the table has no `<tbody>`.
+
+    """
+    elem = _get_elem(id_or_elem)
+    data = _test.browser.execute_script(_table_data_script, elem)
+    if data['tag'] != 'table':
+        _raise('Element %r is not a table.' % (id_or_elem,))
+    return dict(headers=data['headers'], rows=data['rows'])
+
+
+def _get_table_rows(id_or_elem):
+    rows = get_table_data(id_or_elem)['rows']
+    if rows is None:
+        _raise('Table %r has no tbody.' % (id_or_elem,))
+    return rows
+
+
 def assert_table_headers(id_or_elem, headers):
     """Assert the headers of a table.
 
@@ -1540,11 +2256,7 @@ def assert_table_headers(id_or_elem, headers):
 
     """
     logger.debug('Checking headers for %r' % (id_or_elem,))
-    elem = _get_elem(id_or_elem)
-    if not elem.tag_name == 'table':
-        _raise('Element %r is not a table.' % (id_or_elem,))
-    header_elems = elem.find_elements_by_tag_name('th')
-    header_text = [get_text(e) for e in header_elems]
+    header_text = get_table_data(id_or_elem)['headers']
     if not header_text == headers:
         msg = ('Expected headers:%r. Actual headers%r\n' %
                (headers, header_text))
@@ -1563,13 +2275,7 @@ def assert_table_has_rows(id_or_elem, num_rows):
 
     """
     logger.debug('Checking table %r has %s rows' % (id_or_elem, num_rows))
-    elem = _get_elem(id_or_elem)
-    if not elem.tag_name == 'table':
-        _raise('Element %r is not a table.' % (id_or_elem,))
-    body = elem.find_elements_by_tag_name('tbody')
-    if not body:
-        _raise('Table %r has no tbody.' % (id_or_elem,))
-    rows = body[0].find_elements_by_tag_name('tr')
+    rows = _get_table_rows(id_or_elem)
     if not len(rows) == num_rows:
         msg = 'Expected %s rows. Found %s.' % (num_rows, len(rows))
         _raise(msg)
@@ -1594,18 +2300,11 @@ def assert_table_row_contains_text(id_or_elem, row, contents, regex=False):
     """
     logger.debug(
         'Checking the contents of table %r, row %s.' % (id_or_elem, row))
-    elem = _get_elem(id_or_elem)
-    if not elem.tag_name == 'table':
-        _raise('Element %r is not a table.' % (id_or_elem,))
-    body = elem.find_elements_by_tag_name('tbody')
-    if not body:
-        _raise('Table %r has no tbody.' % (id_or_elem,))
-    rows = body[0].find_elements_by_tag_name('tr')
+    rows = _get_table_rows(id_or_elem)
     if len(rows) <= row:
         msg = 'Asked to fetch row %s. Highest row is %s' % (row, len(rows) - 1)
         _raise(msg)
-    columns = rows[row].find_elements_by_tag_name('td')
-    cells = [get_text(e) for e in columns]
+    cells = rows[row]
     if not regex:
         success = cells == contents
     elif len(contents) != len(cells):
@@ -1631,8 +2330,8 @@ def assert_attribute(id_or_elem, attribute, value, regex=False):
 
     """
     elem = _get_elem(id_or_elem)
-    logger.debug(
-        'Checking attribute %r of %r' % (attribute, _element_to_string(elem)))
+    logger.debug('Checking attribute %r of %r', attribute,
+                 _ElementString(elem))
     actual = elem.get_attribute(attribute)
     if not regex:
         success = value == actual
@@ -1655,9 +2354,8 @@ def assert_css_property(id_or_elem, property, value, regex=False):
 
     """
     elem = _get_elem(id_or_elem)
-    logger.debug(
-        'Checking css property %r: %r of %r' % (
-            property, value, _element_to_string(elem)))
+    logger.debug('Checking css property %r: %r of %r', property, value,
+                 _ElementString(elem))
     actual = elem.value_of_css_property(property)
     # some browsers return string with space padded commas, some don't.
     actual = actual.replace(', ', ',')
@@ -1798,3 +2496,7 @@ def get_element_source(id_or_elem):
 
 def get_browser_log():
     return _test.browser.get_log('browser')
+
+
+# Profiled while profiling is enabled, whatever the way they are imported
+profiling.profile_actions(globals(), __all__)
@@ -17,10 +17,13 @@
 #   limitations under the License.
 #
 
+import atexit
+import copy
 import logging
 import platform
 import shutil
 import subprocess
+import threading
 import time
 
 from selenium import webdriver
@@ -44,6 +47,8 @@ class BrowserFactory(object):
 
     webdriver_class = None
 
+    _prelaunched = None
+
     def __init__(self):
         super(BrowserFactory, self).__init__()
 
@@ -64,6 +69,213 @@ class BrowserFactory(object):
         """
         return self.webdriver_class()
 
+    def pool_key(self, test):
+        """Return a key identifying the browsers that can be shared by tests.
+
+        A browser started for a test can only be reused by another test if
+        both tests produce the same key.
+
+        Daughter classes should redefine this method when ``setup_for_test``
+        depends on the test.
+        """
+        return None
+
+    def prelaunch(self, test):
+        """Start a browser in the background for the test to come.
+
+        The browser is setup for ``test`` and is handed to the next test
+        (via ``take_prelaunched``) if it produces the same ``pool_key``. This
+        hides the browser start up while ``test`` runs.
+
+        Only one browser is prelaunched at a time, a previous one not taken by
+        a test is discarded.
+        """
+        self.discard_prelaunched()
+        self._prelaunched = PrelaunchedBrowser(self, test)
+
+    def take_prelaunched(self, test):
+        """Return the browser prelaunched for ``test``.
+
+        This waits for the browser to be started if needed.
+
+        :returns: None if no browser was prelaunched, if it was setup for a
+            different kind of test or if it failed to start.
+        """
+        prelaunched = self._prelaunched
+        self._prelaunched = None
+        if prelaunched is None:
+            return None
+        if prelaunched.key != self.pool_key(test):
+            logger.debug('Discarding prelaunched browser setup for'
+                         ' another test')
+            prelaunched.discard()
+            return None
+        return prelaunched.take()
+
+    def discard_prelaunched(self):
+        """Stop the prelaunched browser if any.
+
+        This waits for the browser to be started so it can be stopped.
+        """
+        prelaunched = self._prelaunched
+        self._prelaunched = None
+        if prelaunched is not None:
+            prelaunched.discard(wait=True)
+
+
+class PrelaunchedBrowser(object):
+    """A browser started in a background thread."""
+
+    def __init__(self, factory, test):
+        super(PrelaunchedBrowser, self).__init__()
+        self.key = factory.pool_key(test)
+        self.browser = None
+        self.discarded = False
+        self.lock = threading.Lock()
+        # The factory is setup for the running test while the browser for the
+        # next one is started, they can't share the same options.
+        launcher = copy.copy(factory)
+        launcher._prelaunched = None
+        self.thread = threading.Thread(target=self._launch,
+                                       args=(launcher, test))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _launch(self, launcher, test):
+        try:
+            launcher.setup_for_test(test)
+            browser = launcher.browser()
+        except Exception:
+            logger.debug('Prelaunching browser failed', exc_info=True)
+            return
+        with self.lock:
+            if not self.discarded:
+                self.browser = browser
+                return
+        # Nobody wants this browser anymore
+        _quit_browser(browser)
+
+    def take(self):
+        """Wait for the browser to be started and return it.
+
+        :returns: None if the browser failed to start.
+        """
+        self.thread.join()
+        return self.browser
+
+    def discard(self, wait=False):
+        """Stop the browser, now if it's started or when it will be.
+
+        :param wait: Whether to wait for the browser to be started and
+            stopped.
+        """
+        with self.lock:
+            self.discarded = True
+            browser = self.browser
+            self.browser = None
+        if browser is not None:
+            _quit_browser(browser)
+        if wait:
+            self.thread.join()
+
+
+def _quit_browser(browser):
+    try:
+        browser.quit()
+    except Exception:
+        logger.debug('Failed to stop browser', exc_info=True)
+
+
+# Clearing the storages can fail (about:blank, file:// urls) but that's fine,
+# there is nothing to clear there.
+_clear_storages_script = '''
+try { window.localStorage.clear(); } catch (e) {}
+try { window.sessionStorage.clear(); } catch (e) {}
+'''
+
+
+class BrowserPool(object):
+    """Keep browsers alive across tests.
+
+    Starting a browser is expensive, the pool keeps the browsers released by
+    tests and hands them back to the following ones after resetting them.
+
+    A pool is used by a single process, concurrent workers each get their own
+    copy when forked and are responsible for stopping it.
+    """
+
+    def __init__(self, size=1):
+        """Create a pool.
+
+        :param size: The maximum number of idle browsers kept alive.
+        """
+        super(BrowserPool, self).__init__()
+        self.size = size
+        self.idle = []
+        # Don't leak browsers when the pool is used outside of sst-run
+        atexit.register(self.stop)
+
+    def _key(self, test):
+        factory = test.browser_factory
+        return (factory, factory.pool_key(test))
+
+    def checkout(self, test):
+        """Return a browser for ``test``.
+
+        An idle browser is reused if one matches the test, a new one is
+        started otherwise.
+        """
+        key = self._key(test)
+        for pos, (idle_key, browser) in enumerate(self.idle):
+            if idle_key == key:
+                del self.idle[pos]
+                logger.debug('Reusing browser: %s' % browser.name)
+                return browser
+        test.browser_factory.setup_for_test(test)
+        return test.browser_factory.browser()
+
+    def checkin(self, test, browser):
+        """Give back a browser used by ``test``.
+
+        The browser is reset so the next test gets a clean one. If that fails,
+        the browser is considered broken and discarded.
+        """
+        try:
+            self.reset(browser)
+        except Exception:
+            logger.debug('Discarding browser that failed to reset',
+                         exc_info=True)
+            _quit_browser(browser)
+            return
+        self.idle.append((self._key(test), browser))
+        while len(self.idle) > self.size:
+            _, oldest = self.idle.pop(0)
+            _quit_browser(oldest)
+
+    def reset(self, browser):
+        """Restore a browser to a state suitable for a new test.
+
+        Extra windows are closed, cookies and storages are cleared and the
+        remaining window displays about:blank.
+
+        Note that webdriver only gives access to the cookies of the current
+        domain, cookies set for other domains during the test survive.
+        """
+        handles = browser.window_handles
+        for handle in handles[1:]:
+            browser.switch_to_window(handle)
+            browser.close()
+        browser.switch_to_window(handles[0])
+        browser.delete_all_cookies()
+        browser.execute_script(_clear_storages_script)
+        browser.get('about:blank')
+
+    def stop(self):
+        """Stop all idle browsers."""
+        while self.idle:
+            _, browser = self.idle.pop()
+            _quit_browser(browser)
+
 
 # MISSINGTEST: Exercise this class -- vila 2013-04-11
 class RemoteBrowserFactory(BrowserFactory):
@@ -220,6 +432,10 @@ class FirefoxFactory(BrowserFactory):
                 'allAccess')
         self.profile = profile
 
+    def pool_key(self, test):
+        # The profile depends on the test
+        return test.assume_trusted_cert_issuer
+
     def browser(self):
         desired = DesiredCapabilities.FIREFOX
         desired['loggingPrefs'] = { 'browser':'ALL' }
@@ -25,14 +25,19 @@ import os
 import pdb
 import testtools
 import testtools.content
+import time
 import traceback
 
 from selenium.common import exceptions
 from sst import (
     actions,
     browsers,
+    codecache,
     config,
     context,
+    profiling,
+    results,
+    tracing,
     xvfbdisplay,
 )
 
@@ -47,11 +52,26 @@ class SSTTestCase(testtools.TestCase):
     xserver_headless = False
 
     browser_factory = browsers.FirefoxFactory()
+    # A browsers.BrowserPool to reuse browsers across tests
+    browser_pool = None
+    # Start the browser for the next test while the current one runs. The
+    # display used by the browser must outlive the test.
+    prelaunch_browser = False
 
     assume_trusted_cert_issuer = False
 
     wait_timeout = 10
     wait_poll = 0.1
+    # Wait for the page to change rather than polling (see
+    # actions.set_wait_timeout)
+    wait_observe_dom = False
+    # How the time between two checks evolves (see actions.set_wait_timeout)
+    wait_poll_strategy = 'fixed'
+    # How to check a page is loaded (see actions.set_page_ready_check)
+    page_ready_check = 'ready_state'
+    # The browser script timeout (in seconds), restored by wait_for after
+    # waiting in the browser. Update it when changing the browser one.
+    script_timeout = 0
     base_url = None
 
     results_directory = None
@@ -59,11 +79,80 @@ class SSTTestCase(testtools.TestCase):
     debug_post_mortem = False
     extended_report = False
 
+    def __init__(self, *args, **kwargs):
+        super(SSTTestCase, self).__init__(*args, **kwargs)
+        # The time spent in each phase of the last run (see PHASES in
+        # sst.results)
+        self.phase_timings = {}
+        self._phase = None
+
+    def run(self, result=None):
+        if 'setUp' in vars(self):
+            # Already running and timed (the test runs itself)
+            return super(SSTTestCase, self).run(result)
+        self.phase_timings = {}
+        self._phase = None
+        # Time the phases around the setUp and tearDown of the actual class,
+        # the test body runs in between.
+        setUp, tearDown = self.setUp, self.tearDown
+
+        def timed_setUp():
+            # Registered before setUp so it runs once all the cleanups are done
+            self.addCleanup(self._add_phase_timings)
+            self._switch_phase('setup')
+            try:
+                setUp()
+            except:
+                self._switch_phase('cleanup')
+                raise
+            self._switch_phase('body')
+
+        def timed_tearDown():
+            # tearDown and the cleanups
+            self._switch_phase('cleanup')
+            tearDown()
+
+        self.setUp, self.tearDown = timed_setUp, timed_tearDown
+        try:
+            return super(SSTTestCase, self).run(result)
+        finally:
+            del self.setUp, self.tearDown
+
+    def _switch_phase(self, phase):
+        """Stop timing the current phase and start timing ``phase``.
+
+        :returns: The phase that was timed until now so it can be resumed.
+        """
+        now = time.time()
+        previous = self._phase
+        if previous is not None:
+            elapsed = now - self._phase_start
+            self.phase_timings[previous] = (
+                self.phase_timings.get(previous, 0.0) + elapsed)
+        self._phase = phase
+        self._phase_start = now
+        return previous
+
+    def _add_phase_timings(self):
+        self._switch_phase(None)
+        self.addDetail(results.PHASES_DETAIL_NAME,
+                       testtools.content.json_content(self.phase_timings))
+
     def setUp(self):
         super(SSTTestCase, self).setUp()
+        if profiling.is_enabled():
+            profiling.start_test()
+            # Registered first so it runs once all the actions are done
+            self.addCleanup(profiling.add_profile_detail, self)
+        if tracing.is_enabled():
+            tracing.start_test(self.id())
+            self.addCleanup(tracing.add_trace_details, self)
         if self.base_url is not None:
             actions.set_base_url(self.base_url)
-        actions._set_wait_timeout(self.wait_timeout, self.wait_poll)
+        actions._set_wait_timeout(self.wait_timeout, self.wait_poll,
+                                  self.wait_observe_dom,
+                                  self.wait_poll_strategy)
+        actions._set_page_ready_check(self.page_ready_check)
         # Ensures sst.actions will find me
         actions._test = self
         if self.xserver_headless and self.xvfb is None:
@@ -92,26 +181,47 @@ class SSTTestCase(testtools.TestCase):
         return None
 
     def _start_browser(self):
-        self.browser_factory.setup_for_test(self)
-        self.browser = self.browser_factory.browser()
+        if self.browser_pool is not None:
+            self.browser = self.browser_pool.checkout(self)
+            return
+        factory = self.browser_factory
+        browser = None
+        if self.prelaunch_browser:
+            browser = factory.take_prelaunched(self)
+        if browser is None:
+            factory.setup_for_test(self)
+            browser = factory.browser()
+        self.browser = browser
+        if self.prelaunch_browser:
+            factory.prelaunch(self)
 
     def start_browser(self):
         max_attempts = 5
-        for nb_attempts in range(1, max_attempts + 1):
-            try:
-                logger.debug('Starting browser (attempt: %d)' % nb_attempts)
-                self._start_browser()
-                break
-            except exceptions.WebDriverException:
-                if nb_attempts >= max_attempts:
-                    raise
+        previous_phase = self._switch_phase('browser_start')
+        try:
+            for nb_attempts in range(1, max_attempts + 1):
+                try:
+                    logger.debug('Starting browser (attempt: %d)'
+                                 % nb_attempts)
+                    self._start_browser()
+                    break
+                except exceptions.WebDriverException:
+                    if nb_attempts >= max_attempts:
+                        raise
+        finally:
+            self._switch_phase(previous_phase)
         logger.debug('Browser started: %s' % self.browser.name)
 
     def stop_browser(self):
-        logger.debug('Stopping browser')
-        self.browser.quit()
+        if self.browser_pool is not None:
+            logger.debug('Releasing browser')
+            self.browser_pool.checkin(self, self.browser)
+        else:
+            logger.debug('Stopping browser')
+            self.browser.quit()
 
     def take_screenshot_and_page_dump(self, exc_info):
+        previous_phase = self._switch_phase('screenshot')
         try:
             filename = 'screenshot-{0}.png'.format(self.id())
             actions.take_screenshot(filename)
@@ -125,6 +235,7 @@ class SSTTestCase(testtools.TestCase):
         except Exception:
             # FIXME: Needs to be reported somehow ? -- vila 2012-10-16
             pass
+        self._switch_phase(previous_phase)
 
     def print_exception_and_enter_post_mortem(self, exc_info):
         exc_class, exc, tb = exc_info
@@ -166,6 +277,11 @@ class SSTScriptTestCase(SSTTestCase):
         if test_id.startswith('./'):
             test_id = test_id[2:]
         self.id = lambda: '%s' % (test_id.replace(os.sep, '.'))
+        # A DataRow is loaded only when the test runs
+        self.data_row = None
+        if isinstance(context_row, DataRow):
+            self.data_row = context_row
+            context_row = None
         if context_row is None:
             context_row = {}
         self.context = context_row
@@ -177,7 +293,9 @@ class SSTScriptTestCase(SSTTestCase):
         return "%s" % (self.id(),)
 
     def setUp(self):
+        previous_phase = self._switch_phase('compile')
         self._compile_script()
+        self._switch_phase(previous_phase)
         # The script may override some settings. The default value for
         # ASSUME_TRUSTED_CERT_ISSUER is False, so if the user mentions it
         # in his script, it's to turn them on. Also, getting our hands on
@@ -187,8 +305,13 @@ class SSTScriptTestCase(SSTTestCase):
         super(SSTScriptTestCase, self).setUp()
         # Start with default values
         actions.reset_base_url()
-        actions._set_wait_timeout(10, 0.1)
+        actions._set_wait_timeout(10, 0.1, self.wait_observe_dom,
+                                  self.wait_poll_strategy)
         # Possibly inject parametrization from associated .csv file
+        if self.data_row is not None:
+            self.context = self.data_row.load()
+            # Don't keep the rows of the tests already run
+            self.addCleanup(setattr, self, 'context', {})
         previous_context = context.store_context()
         self.addCleanup(context.restore_context, previous_context)
         context.populate_context(self.context, self.script_path,
@@ -196,9 +319,7 @@ class SSTScriptTestCase(SSTTestCase):
 
     def _compile_script(self):
         self.script_path = os.path.join(self.script_dir, self.script_name)
-        with open(self.script_path) as f:
-            source = f.read() + '\n'
-        self.code = compile(source, self.script_path, 'exec')
+        self.code = codecache.compile_script(self.script_path)
 
     def run_test_script(self, result=None):
         # Run the test catching exceptions sstnam style
@@ -208,6 +329,30 @@ class SSTScriptTestCase(SSTTestCase):
             pass
 
 
+def _parse_headers(line):
+    headers = line.rstrip().split('^')
+    headers = [header.replace('"', '') for header in headers]
+    headers = [header.replace("'", '') for header in headers]
+    return headers
+
+
+def _parse_row(headers, line, row_num):
+    row = {}
+    row['_row_num'] = row_num
+    fields = line.rstrip().split('^')
+    for header, field in zip(headers, fields):
+        try:
+            value = ast.literal_eval(field)
+        except ValueError:
+            value = field
+            if value.lower() == 'false':
+                value = False
+            if value.lower() == 'true':
+                value = True
+        row[header] = value
+    return row
+
+
 def get_data(csv_path):
     """
     Return a list of data dicts for parameterized testing.
@@ -215,28 +360,87 @@ def get_data(csv_path):
     The first row (headers) match data_map key names. rows beneath are filled
     with data values.
     """
-    rows = []
+    return [row.load() for row in get_data_rows(csv_path)]
+
+
+class DataRow(object):
+    """A row of a csv data file, parsed only when loaded.
+
+    Only the position of the row in the file is kept until then.
+    """
+
+    def __init__(self, csv_path, headers, row_num, offset):
+        self.csv_path = csv_path
+        self.headers = headers
+        self.row_num = row_num
+        self.offset = offset
+
+    def load(self):
+        """Return the data dict of the row."""
+        with open(self.csv_path, 'rb') as f:
+            f.seek(self.offset)
+            line = f.readline()
+        return _parse_row(self.headers, line, self.row_num)
+
+
+def scan_data_file(csv_path):
+    """Return the headers and the row offsets of a csv data file."""
+    offsets = []
     logger.debug('Reading data from %r' % os.path.split(csv_path)[-1])
-    row_num = 0
-    with open(csv_path) as f:
-        headers = f.readline().rstrip().split('^')
-        headers = [header.replace('"', '') for header in headers]
-        headers = [header.replace("'", '') for header in headers]
+    with open(csv_path, 'rb') as f:
+        line = f.readline()
+        headers = _parse_headers(line)
+        offset = len(line)
         for line in f:
-            row = {}
-            row_num += 1
-            row['_row_num'] = row_num
-            fields = line.rstrip().split('^')
-            for header, field in zip(headers, fields):
-                try:
-                    value = ast.literal_eval(field)
-                except ValueError:
-                    value = field
-                    if value.lower() == 'false':
-                        value = False
-                    if value.lower() == 'true':
-                        value = True
-                row[header] = value
-            rows.append(row)
-    logger.debug('found %s rows' % len(rows))
+            offsets.append(offset)
+            offset += len(line)
+    logger.debug('found %s rows' % len(offsets))
+    return headers, offsets
+
+
+def get_data_rows(csv_path, selector=None, scanned=None):
+    """
+    Return a list of DataRow for parameterized testing.
+
+    The file is only scanned for the row positions, the rows are parsed when
+    loaded.
+
+    :param csv_path: The path of the csv data file.
+    :param selector: A callable filtering the list of rows (see
+        `get_row_selector`) or `None` to get all the rows.
+    :param scanned: The headers and row offsets returned by `scan_data_file`
+        if they are already known.
+    """
+    if scanned is None:
+        scanned = scan_data_file(csv_path)
+    headers, offsets = scanned
+    rows = [DataRow(csv_path, headers, row_num, offset)
+            for row_num, offset in enumerate(offsets, 1)]
+    if selector is not None:
+        rows = selector(rows)
+        logger.debug('selected %s rows' % len(rows))
     return rows
+
+
+def get_row_selector(spec):
+    """Return a callable selecting the rows of csv data files.
+
+    :param spec: Either 'START:STOP[:STEP]' selecting the rows like a python
+        slice (rows are counted from 0) or 'SHARD/SHARDS' selecting one row
+        every SHARDS rows, starting from the row SHARD (counted from 1) so
+        that 'SHARDS' runs with different shards cover all the rows.
+    :raise: ValueError if `spec` is invalid.
+    """
+    try:
+        if '/' in spec:
+            shard, shards = [int(n) for n in spec.split('/')]
+            if not 1 <= shard <= shards:
+                raise ValueError(spec)
+            return lambda rows: rows[shard - 1::shards]
+        bounds = [int(n) if n else None for n in spec.split(':')]
+        if not 2 <= len(bounds) <= 3 or bounds[2:] == [0]:
+            raise ValueError(spec)
+        selected = slice(*bounds)
+        return lambda rows: rows[selected]
+    except ValueError:
+        raise ValueError('Invalid data rows selector: %r' % (spec,))
@@ -0,0 +1,148 @@
+#
+#   Copyright (c) 2013 Canonical Ltd.
+#
+#   This file is part of: SST (selenium-simple-test)
+#   https://launchpad.net/selenium-simple-test
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+"""Compiled test scripts shared by the whole process.
+
+Scripts are compiled once per process whatever the number of data rows they
+are run with or the number of times they are called with `run_test`. The code
+objects can also be persisted as bytecode to be reused by the next runs or by
+the other concurrent processes.
+"""
+
+import __future__
+import hashlib
+import imp
+import logging
+import marshal
+import os
+
+
+logger = logging.getLogger('SST')
+
+
+# The future features of the test scripts, they used to be compiled from
+# cases.py
+SCRIPT_FLAGS = __future__.print_function.compiler_flag
+
+
+class CodeCache(object):
+    """The code objects compiled from scripts, keyed by path.
+
+    A code object is reused as long as the script modification time and size
+    are unchanged.
+    """
+
+    def __init__(self, directory=None):
+        """Create a code cache.
+
+        :param directory: The directory where the compiled code is persisted
+            or `None` to keep it in memory only.
+        """
+        super(CodeCache, self).__init__()
+        self.directory = directory
+        self.codes = {}
+
+    def compile(self, path, flags=SCRIPT_FLAGS):
+        """Return the code object compiled from a script.
+
+        :param path: The path of the script.
+        :param flags: The future features the script is compiled with, the
+            ones of the calling code are never inherited.
+        """
+        path = os.path.abspath(path)
+        with open(path) as f:
+            st = os.fstat(f.fileno())
+            key = (st.st_mtime, st.st_size, flags)
+            cached = self.codes.get((path, flags))
+            if cached is not None and cached[0] == key:
+                return cached[1]
+            code = self._load(path, key)
+            if code is None:
+                source = f.read() + '\n'
+                code = compile(source, path, 'exec', flags, True)
+                self._save(path, key, code)
+        self.codes[(path, flags)] = (key, code)
+        return code
+
+    def clear(self):
+        """Forget the code objects kept in memory."""
+        self.codes = {}
+
+    def _bytecode_path(self, path, flags):
+        if isinstance(path, unicode):
+            path = path.encode('utf-8')
+        name = hashlib.md5('%s:%d' % (path, flags)).hexdigest()
+        return os.path.join(self.directory, name + '.sstc')
+
+    def _load(self, path, key):
+        if self.directory is None:
+            return None
+        try:
+            with open(self._bytecode_path(path, key[2]), 'rb') as f:
+                magic, persisted_path, persisted_key, code = marshal.load(f)
+        except IOError:
+            # Never persisted
+            return None
+        except (EOFError, ValueError, TypeError):
+            logger.warning('Ignoring invalid bytecode for %s' % path)
+            return None
+        if (magic, persisted_path, persisted_key) != (imp.get_magic(), path,
+                                                      key):
+            # Outdated
+            return None
+        return code
+
+    def _save(self, path, key, code):
+        if self.directory is None:
+            return
+        if not os.path.isdir(self.directory):
+            try:
+                os.makedirs(self.directory)
+            except OSError:
+                # A concurrent process may just have created it
+                if not os.path.isdir(self.directory):
+                    raise
+        bytecode_path = self._bytecode_path(path, key[2])
+        # Don't leave a truncated file behind, concurrent processes may read
+        # it at any time
+        tmp = '%s.%d.tmp' % (bytecode_path, os.getpid())
+        with open(tmp, 'wb') as f:
+            marshal.dump((imp.get_magic(), path, key, code), f)
+        os.rename(tmp, bytecode_path)
+
+
+# The cache used for all the scripts run in this process
+code_cache = CodeCache()
+
+
+def compile_script(path, flags=SCRIPT_FLAGS):
+    """Return the code object compiled from a script, using the cache.
+
+    :param flags: The future features the script is compiled with.
+    """
+    return code_cache.compile(path, flags)
+
+
+def set_bytecode_directory(directory):
+    """Persist the compiled scripts as bytecode in `directory`.
+
+    :param directory: The directory where the bytecode is persisted or `None`
+        to disable persistence.
+    """
+    code_cache.directory = directory
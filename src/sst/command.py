@@ -31,6 +31,7 @@ import sst
 from sst import (
     actions,
     browsers,
+    cases,
     config,
 )
 
@@ -70,7 +71,7 @@ def get_common_options():
                       help='directory of test case files')
     parser.add_option('-r', dest='report_format',
                       default='console',
-                      help='report type: xml')
+                      help='report type: xml, subunit or jsonl')
     parser.add_option('-b', dest='browser_type',
                       default='Firefox',
                       help=('select webdriver (Firefox, Chrome, '
@@ -125,6 +126,49 @@ def get_common_options():
     parser.add_option('-c', '--concurrency', dest='concurrency',
                       default=1, type='int',
                       help='concurrency (number of procs)')
+    parser.add_option('--reuse-browser', dest='reuse_browser',
+                      action='store_true', default=False,
+                      help='keep browsers alive across tests, resetting them'
+                      ' between tests')
+    parser.add_option('--prelaunch-browser', dest='prelaunch_browser',
+                      action='store_true', default=False,
+                      help='start the browser for the next test while the'
+                      ' current one runs')
+    parser.add_option('--timings-file', dest='timings_file', default=None,
+                      help='file recording the tests durations to balance'
+                      ' them between concurrent processes')
+    parser.add_option('--work-queue', dest='work_queue',
+                      action='store_true', default=False,
+                      help='hand the tests one at a time to the concurrent'
+                      ' processes instead of splitting them upfront')
+    parser.add_option('--bytecode-cache', dest='bytecode_cache',
+                      default=None,
+                      help='directory persisting the compiled test scripts'
+                      ' for the next runs')
+    parser.add_option('--data-rows', dest='data_rows', default=None,
+                      help='csv data rows to run the scripts with, either'
+                      ' START:STOP[:STEP] (counted from 0) or SHARD/SHARDS')
+    parser.add_option('--discovery-index', dest='discovery_index',
+                      default=None,
+                      help='file caching the directory listings and data'
+                      ' files scanned to collect the tests for the next runs')
+    parser.add_option('--discovery-threads', dest='discovery_threads',
+                      default=1, type='int',
+                      help='number of threads listing the test directories'
+                      ' concurrently before collecting the tests (including'
+                      ' the ones pruned by the package discover or'
+                      ' load_tests hooks), default=1 (no prefetch)')
+    parser.add_option('--profile', dest='profile',
+                      action='store_true', default=False,
+                      help='profile the actions, saving results/profile.json'
+                      ' and summarizing the most expensive ones')
+    parser.add_option('--trace-commands', dest='trace_commands',
+                      action='store_true', default=False,
+                      help='log the WebDriver commands with their latency and'
+                      ' payload size, attaching their histogram to the tests')
+    parser.add_option('--trace-file', dest='trace_file', default=None,
+                      help='file saving the WebDriver commands in the Chrome'
+                      ' trace format, implies --trace-commands')
     return parser
 
 
@@ -132,7 +176,8 @@ def get_run_options():
     parser = get_common_options()
     parser.add_option('-x', dest='xserver_headless',
                       default=False, action='store_true',
-                      help='run browser in headless xserver (Xvfb)')
+                      help='run browser in headless xserver (Xvfb), one per'
+                      ' concurrent process')
     return parser
 
 
@@ -179,6 +224,12 @@ def get_opts(get_options, args=None):
               cmd_opts.browser_type, browsers.browser_factories.keys())
         sys.exit(1)
 
+    if cmd_opts.data_rows is not None:
+        try:
+            cases.get_row_selector(cmd_opts.data_rows)
+        except ValueError as e:
+            parser.error(str(e))
+
     logging.basicConfig(format=cmd_opts.log_format)
     logger = logging.getLogger('SST')
 
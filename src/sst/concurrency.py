@@ -31,8 +31,12 @@ concurrency.
 Unix only.
 """
 
+import collections
+import heapq
 import os
+import signal
 import sys
+import threading
 import traceback
 import unittest
 import itertools
@@ -40,27 +44,336 @@ import itertools
 import subunit
 from subunit import test_results
 import testtools
+from testtools import content
+
+
+# The pids of the running worker processes
+_workers = set()
+_workers_lock = threading.Lock()
+# Set when the run is terminating, no more workers or tests are started
+_terminating = threading.Event()
+
+
+def _add_worker(pid):
+    with _workers_lock:
+        _workers.add(pid)
+        if _terminating.is_set():
+            # Started while the others were being stopped
+            _kill_worker(pid)
+
+
+def _remove_worker(pid):
+    with _workers_lock:
+        _workers.discard(pid)
+
+
+def _kill_worker(pid, signum=signal.SIGTERM):
+    try:
+        os.kill(pid, signum)
+    except OSError:
+        # Already gone
+        pass
+
+
+def terminate_workers():
+    """Stop the running workers and don't start new ones or new tests."""
+    with _workers_lock:
+        _terminating.set()
+        for pid in _workers:
+            _kill_worker(pid)
+
+
+def kill_workers():
+    """Kill the workers that didn't stop when asked to."""
+    with _workers_lock:
+        for pid in _workers:
+            _kill_worker(pid, signal.SIGKILL)
+
+
+def is_terminating():
+    return _terminating.is_set()
+
+
+def run_suite(suite, result, poll=0.1, grace_period=5.0):
+    """Run a `ConcurrentTestSuite` while keeping the main thread responsive.
+
+    With python 2 the main thread can't handle signals while it waits for
+    the workers results in `ConcurrentTestSuite.run`. The suite is run in
+    another thread instead so an interruption (SIGINT or a SIGTERM handler
+    raising KeyboardInterrupt) stops the workers right away. The
+    interruption is raised once they are all gone.
+
+    :param poll: How often (in seconds) the main thread checks for the end
+        of the run.
+    :param grace_period: How long (in seconds) the workers are given to stop
+        before being killed.
+    """
+    raised = []
+
+    def run():
+        try:
+            suite.run(result)
+        except:
+            raised.append(sys.exc_info())
+    thread = threading.Thread(target=run, name='concurrent-suite')
+    thread.daemon = True
+    try:
+        thread.start()
+        while thread.is_alive():
+            thread.join(poll)
+    except KeyboardInterrupt:
+        terminate_workers()
+        thread.join(grace_period)
+        # A worker signaled before it could install its handlers ignores
+        # SIGTERM
+        while thread.is_alive():
+            kill_workers()
+            thread.join(poll)
+        raise
+    finally:
+        # The next runs start afresh
+        _terminating.clear()
+    if raised:
+        exc_class, exc, tb = raised[0]
+        raise exc_class, exc, tb
+
+
+class WorkerProgress(testtools.TestResultDecorator):
+    """Track the tests reported by a worker process."""
+
+    def __init__(self, decorated):
+        super(WorkerProgress, self).__init__(decorated)
+        # The number of tests started by the worker
+        self.started = 0
+        # The test being run by the worker if any
+        self.current = None
+
+    def startTest(self, test):
+        self.started += 1
+        self.current = test
+        return super(WorkerProgress, self).startTest(test)
+
+    def stopTest(self, test):
+        self.current = None
+        return super(WorkerProgress, self).stopTest(test)
+
+
+def describe_exit_status(status):
+    if os.WIFSIGNALED(status):
+        return 'killed by signal %d' % (os.WTERMSIG(status),)
+    return 'exited with status %d' % (os.WEXITSTATUS(status),)
 
 
 class TestInOtherProcess(subunit.ProtocolTestCase):
     # Should be in subunit, I think. RBC.
-    def __init__(self, stream, pid):
-        super(TestInOtherProcess, self).__init__(stream)
+    def __init__(self, stream, pid, passthrough=None, respawn=None):
+        """Create a test reporting the results of a worker process.
+
+        :param respawn: An optional callable used when the worker dies
+            abnormally. It's given the number of tests started by the worker
+            and returns a new `TestInOtherProcess` running the remaining tests
+            or None if there are none.
+        """
+        super(TestInOtherProcess, self).__init__(stream, passthrough)
         self.pid = pid
+        self.respawn = respawn
 
     def run(self, result):
+        progress = WorkerProgress(result)
+        protocol = subunit.TestProtocolServer(progress, self._passthrough,
+                                              self._forward)
         try:
-            super(TestInOtherProcess, self).run(result)
+            for line in iter(self._stream.readline, ''):
+                protocol.lineReceived(line)
         finally:
             pid, status = os.waitpid(self.pid, 0)
-        # GZ 2011-10-18: If status is nonzero, should report to the result
-        #                that something went wrong.
+            _remove_worker(self.pid)
+        if not status:
+            protocol.lostConnection()
+            return
+        # The worker crashed (segfault, OOM killer, etc)
+        crash = 'Worker process %d %s' % (self.pid,
+                                          describe_exit_status(status))
+        if progress.current is not None:
+            test = progress.current
+            progress.addError(test, details={
+                'traceback': content.text_content(
+                    crash + ' while running this test')})
+            progress.stopTest(test)
+        else:
+            worker = testtools.PlaceHolder(
+                'worker-%d' % (self.pid,), outcome='addError',
+                details={'traceback': content.text_content(crash)})
+            worker.run(result)
+        # Only respawn workers that made progress or we may never end
+        if (self.respawn is not None and progress.started and
+                not is_terminating()):
+            new_worker = self.respawn(progress.started)
+            if new_worker is not None:
+                new_worker.run(result)
+
+
+# The line a worker writes in its subunit stream to ask for the next test
+_NEXT_TEST = 'sst-next-test\n'
+
+
+class TestQueue(object):
+    """The tests handed to the worker processes one at a time.
+
+    Only the indices of the tests are exchanged with the workers, they all
+    get a copy of the tests when forked (test ids are not unique).
+    """
+
+    def __init__(self, tests, durations=None):
+        """Create a queue for tests.
 
+        :param durations: An optional callable returning the expected
+            duration of a test, the longest tests are then handed first.
+        """
+        super(TestQueue, self).__init__()
+        indices = range(len(tests))
+        if durations is not None:
+            expected = [durations(test) for test in tests]
+            indices.sort(key=lambda i: -expected[i])
+        self.pending = collections.deque(indices)
+        self.lock = threading.Lock()
+
+    def next_test(self):
+        """Return the index of the next test to run or None."""
+        with self.lock:
+            if not self.pending or is_terminating():
+                return None
+            return self.pending.popleft()
+
+    def is_empty(self):
+        with self.lock:
+            return not self.pending
+
+    def stop(self):
+        """Don't hand any more tests."""
+        with self.lock:
+            self.pending.clear()
+
+
+class QueuedTestsInOtherProcess(TestInOtherProcess):
+    """The tests run by a worker process asking for them one at a time.
+
+    The requests are read from the worker subunit stream, after the results
+    of the previous test. No more tests are handed once the result should
+    stop (--failfast).
+    """
+
+    def __init__(self, stream, pid, queue, orders, respawn=None):
+        """Create a test for a worker process.
+
+        :param queue: The `TestQueue` shared by all the workers.
+
+        :param orders: The stream the indices of the tests to run are written
+            to.
+        """
+        # The lines that are not part of the subunit protocol, including the
+        # worker requests, are written to us.
+        super(QueuedTestsInOtherProcess, self).__init__(stream, pid, self,
+                                                        respawn)
+        self.queue = queue
+        self.orders = orders
+        self.result = None
 
-def fork_for_tests(concurrency_num=1):
+    def run(self, result):
+        self.result = result
+        try:
+            super(QueuedTestsInOtherProcess, self).run(result)
+        finally:
+            self.orders.close()
+
+    def write(self, line):
+        if line != _NEXT_TEST:
+            # Test noise
+            sys.stdout.write(line)
+            return
+        if self.result.shouldStop:
+            self.queue.stop()
+        index = self.queue.next_test()
+        if index is None:
+            order = '\n'
+        else:
+            order = '%d\n' % (index,)
+        try:
+            self.orders.write(order)
+            self.orders.flush()
+        except IOError:
+            # The worker is gone, its stream will tell us why
+            pass
+
+
+def _fork_worker(run_worker, cleanup_worker=None, setup_worker=None):
+    """Fork a worker process running tests.
+
+    :param run_worker: A callable running tests in the worker process, given
+        the subunit stream and the result reporting to it.
+
+    :param cleanup_worker: An optional callable called in the worker process
+        once all its tests have run.
+
+    :param setup_worker: An optional callable called in the worker process
+        before running any test.
+
+    :return: The pid of the worker and the stream its results are read from.
+    """
+    c2pread, c2pwrite = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            stream = os.fdopen(c2pwrite, 'wb', 1)
+            os.close(c2pread)
+            # Leave stderr and stdout open so we can see test noise
+            # Close stdin so that the child goes away if it decides to
+            # read from stdin (otherwise its a roulette to see what
+            # child actually gets keystrokes for pdb etc).
+            sys.stdin.close()
+            result = test_results.AutoTimingTestResultDecorator(
+                subunit.TestProtocolClient(stream)
+            )
+            try:
+                if setup_worker is not None:
+                    setup_worker()
+                run_worker(stream, result)
+            finally:
+                if cleanup_worker is not None:
+                    cleanup_worker()
+        except:
+            # Try and report traceback on stream, but exit with error
+            # even if stream couldn't be created or something else
+            # goes wrong.  The traceback is formatted to a string and
+            # written in one go to avoid interleaving lines from
+            # multiple failing children.
+            try:
+                stream.write(traceback.format_exc())
+            finally:
+                os._exit(1)
+        os._exit(0)
+    os.close(c2pwrite)
+    _add_worker(pid)
+    return pid, os.fdopen(c2pread, 'rb', 1)
+
+
+def fork_for_tests(concurrency_num=1, cleanup_worker=None, durations=None,
+                   setup_worker=None):
     """Implementation of `make_tests` used to construct `ConcurrentTestSuite`.
 
     :param concurrency_num: number of processes to use.
+
+    :param cleanup_worker: An optional callable called in each worker process
+        once all its tests have run (to release resources shared by the tests
+        run in this process).
+
+    :param durations: An optional callable returning the expected duration of
+        a test to balance the tests between the processes (see
+        `partition_tests`).
+
+    :param setup_worker: An optional callable called in each worker process
+        before running its tests (to setup resources shared by the tests run
+        in this process).
     """
     def do_fork(suite):
         """Take suite and start up multiple runners by forking (Unix only).
@@ -70,51 +383,100 @@ def fork_for_tests(concurrency_num=1):
         :return: An iterable of TestCase-like objects which can each have
         run(result) called on them to feed tests to result.
         """
-        tests = []
-        test_blocks = partition_tests(suite, concurrency_num)
+        test_blocks = partition_tests(suite, concurrency_num, durations)
+        # Clear the tests from the original suite so it doesn't keep them alive
+        suite._tests[:] = []
+        return [start_worker(process_tests) for process_tests in test_blocks]
+
+    def start_worker(process_tests):
+        process_suite = unittest.TestSuite(process_tests)
+        pid, stream = _fork_worker(
+            lambda stream, result: process_suite.run(result), cleanup_worker,
+            setup_worker)
+
+        def respawn(started):
+            # The worker runs its tests in order, the remaining ones are run
+            # by a new worker
+            remaining = process_tests[started:]
+            if not remaining:
+                return None
+            return start_worker(remaining)
+        return TestInOtherProcess(stream, pid, respawn=respawn)
+    return do_fork
+
+
+def fork_for_queue(concurrency_num=1, cleanup_worker=None, durations=None,
+                   setup_worker=None):
+    """Implementation of `make_tests` handing tests from a queue.
+
+    Unlike `fork_for_tests`, the tests are not split before forking, each
+    worker asks for the next test when it's done with the previous one. No
+    worker stays idle while others still have tests to run.
+
+    :param concurrency_num: number of processes to use.
+
+    :param cleanup_worker: An optional callable called in each worker process
+        once all its tests have run.
+
+    :param durations: An optional callable returning the expected duration of
+        a test, the longest tests are handed first.
+
+    :param setup_worker: An optional callable called in each worker process
+        before running its tests.
+    """
+    def do_fork(suite):
+        tests = list(testtools.iterate_tests(suite))
         # Clear the tests from the original suite so it doesn't keep them alive
         suite._tests[:] = []
-        for process_tests in test_blocks:
-            process_suite = unittest.TestSuite(process_tests)
-            # Also clear each split list so new suite has only reference
-            process_tests[:] = []
-            c2pread, c2pwrite = os.pipe()
-            pid = os.fork()
-            if pid == 0:
-                try:
-                    stream = os.fdopen(c2pwrite, 'wb', 1)
-                    os.close(c2pread)
-                    # Leave stderr and stdout open so we can see test noise
-                    # Close stdin so that the child goes away if it decides to
-                    # read from stdin (otherwise its a roulette to see what
-                    # child actually gets keystrokes for pdb etc).
-                    sys.stdin.close()
-                    result = test_results.AutoTimingTestResultDecorator(
-                        subunit.TestProtocolClient(stream)
-                    )
-                    process_suite.run(result)
-                except:
-                    # Try and report traceback on stream, but exit with error
-                    # even if stream couldn't be created or something else
-                    # goes wrong.  The traceback is formatted to a string and
-                    # written in one go to avoid interleaving lines from
-                    # multiple failing children.
-                    try:
-                        stream.write(traceback.format_exc())
-                    finally:
-                        os._exit(1)
-                os._exit(0)
-            else:
-                os.close(c2pwrite)
-                stream = os.fdopen(c2pread, 'rb', 1)
-                test = TestInOtherProcess(stream, pid)
-                tests.append(test)
-        return tests
+        queue = TestQueue(tests, durations)
+        return [start_worker(tests, queue) for i in range(concurrency_num)]
+
+    def start_worker(tests, queue):
+        p2cread, p2cwrite = os.pipe()
+
+        def run_worker(stream, result):
+            os.close(p2cwrite)
+            run_queued_tests(tests, stream, os.fdopen(p2cread, 'rb', 1),
+                             result)
+        pid, stream = _fork_worker(run_worker, cleanup_worker, setup_worker)
+        os.close(p2cread)
+
+        def respawn(started):
+            # The test the worker was running is not handed again
+            if queue.is_empty():
+                return None
+            return start_worker(tests, queue)
+        return QueuedTestsInOtherProcess(
+            stream, pid, queue, os.fdopen(p2cwrite, 'wb', 1), respawn)
     return do_fork
 
 
-def partition_tests(suite, count):
-    """Partition suite into count lists of tests."""
+def run_queued_tests(tests, stream, orders, result):
+    """Run the tests handed by the parent process until there is none left.
+
+    :param stream: The subunit stream where the next test is asked for.
+
+    :param orders: The stream the indices of the tests to run are read from.
+    """
+    while True:
+        stream.write(_NEXT_TEST)
+        stream.flush()
+        order = orders.readline().strip()
+        if not order:
+            # No more tests or the parent is gone
+            break
+        tests[int(order)].run(result)
+
+
+def partition_tests(suite, count, durations=None):
+    """Partition suite into count lists of tests.
+
+    :param durations: An optional callable returning the expected duration of
+        a test. When provided, the partitions are balanced by duration rather
+        than by number of tests.
+    """
+    if durations is not None:
+        return partition_tests_by_duration(suite, count, durations)
     # This just assigns tests in a round-robin fashion.  On one hand this
     # splits up blocks of related tests that might run faster if they shared
     # resources, but on the other it avoids assigning blocks of slow tests to
@@ -125,3 +487,26 @@ def partition_tests(suite, count):
     for partition, test in zip(itertools.cycle(partitions), tests):
         partition.append(test)
     return partitions
+
+
+def partition_tests_by_duration(suite, count, durations):
+    """Partition suite into count lists of tests with similar durations.
+
+    The longest tests are assigned first, each to the partition with the
+    smallest total duration so far (LPT scheduling). This keeps slow tests
+    apart so the slowest partition, which sets the wall-clock time of the
+    run, finishes as early as possible.
+
+    The tests keep their original relative order inside each partition.
+    """
+    tests = list(testtools.iterate_tests(suite))
+    expected = [durations(test) for test in tests]
+    # Longest first, ties keep the suite order
+    by_duration = sorted(range(len(tests)), key=lambda i: -expected[i])
+    loads = [(0.0, i) for i in range(count)]
+    assigned = [list() for i in range(count)]
+    for index in by_duration:
+        load, partition = heapq.heappop(loads)
+        assigned[partition].append(index)
+        heapq.heappush(loads, (load + expected[index], partition))
+    return [[tests[i] for i in sorted(indices)] for indices in assigned]
@@ -19,7 +19,7 @@
 
 import os
 
-from sst import actions, config
+from sst import actions, codecache, config
 from collections import namedtuple
 
 StoredContext = namedtuple(
@@ -90,7 +90,7 @@ def _execute_test(name, kwargs):
     context = {}
     populate_context(context, location, config.browser_type, kwargs)
 
-    with open(location) as h:
-        exec(h.read(), context)
+    # Without future features, like exec'ing the source from here
+    exec(codecache.compile_script(location, flags=0), context)
 
     return context.get('RESULT')
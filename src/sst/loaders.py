@@ -20,15 +20,28 @@
 import contextlib
 import fnmatch
 import functools
+import json
+import logging
+import multiprocessing.pool
 import os
 import re
 import sys
+import threading
 import unittest
 import unittest.loader
 
 from sst import cases
 
 
+logger = logging.getLogger('SST')
+
+try:
+    from scandir import scandir
+except ImportError:
+    # Optional, it saves a stat per directory entry
+    scandir = None
+
+
 class NameMatcher(object):
     """Defines rules to select names.
 
@@ -81,6 +94,174 @@ def NameMatchers(test_loader, file_matcher=None, dir_matcher=None):
         (test_loader.file_matcher, test_loader.dir_matcher) = orig
 
 
+def list_directory(dir_path):
+    """Return a dict of the kind ('file', 'dir' or None) of each entry."""
+    entries = {}
+    if scandir is not None:
+        for entry in scandir(dir_path):
+            if entry.is_file():
+                entries[entry.name] = 'file'
+            elif entry.is_dir():
+                entries[entry.name] = 'dir'
+            else:
+                entries[entry.name] = None
+        return entries
+    for name in os.listdir(dir_path):
+        path = os.path.join(dir_path, name)
+        if os.path.isfile(path):
+            entries[name] = 'file'
+        elif os.path.isdir(path):
+            entries[name] = 'dir'
+        else:
+            entries[name] = None
+    return entries
+
+
+class DiscoveryIndex(object):
+    """The directory listings and data files scanned by the previous runs.
+
+    A directory listing is reused as long as the directory modification time
+    is unchanged, so only the directories where entries were added, removed
+    or renamed are listed again. Data files are scanned again when their
+    modification time or size change.
+
+    Importing packages and modules can't be cached, the index only saves the
+    file system accesses.
+    """
+
+    def __init__(self, path=None):
+        """Create a discovery index.
+
+        :param path: The file where the index is persisted.
+        """
+        super(DiscoveryIndex, self).__init__()
+        self.path = path
+        self.directories = {}
+        self.data_files = {}
+        # The paths already checked during this run
+        self.checked = set()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def load(self):
+        """Load the index persisted by a previous run if any."""
+        try:
+            with open(self.path) as f:
+                index = json.load(f)
+            directories = index['directories']
+            data_files = index['data_files']
+        except IOError:
+            # No previous run
+            return
+        except (ValueError, KeyError, TypeError):
+            logger.warning('Ignoring invalid discovery index: %s' % self.path)
+            return
+        self.directories.update(directories)
+        self.data_files.update(data_files)
+
+    def save(self):
+        """Persist the index for the next runs."""
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        # Don't leave a truncated file behind if we're interrupted
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(dict(directories=self.directories,
+                           data_files=self.data_files), f)
+        os.rename(tmp, self.path)
+
+    def _record(self, path, hit):
+        with self.lock:
+            self.checked.add(path)
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def list_directory(self, dir_path):
+        """Return the entries of a directory like `list_directory`.
+
+        This can be called from several threads.
+        """
+        path = os.path.abspath(dir_path)
+        if path in self.checked:
+            return self.directories[path]['entries']
+        key = os.stat(path).st_mtime
+        cached = self.directories.get(path)
+        hit = cached is not None and cached['key'] == key
+        if not hit:
+            cached = dict(key=key, entries=list_directory(path))
+            self.directories[path] = cached
+        self._record(path, hit)
+        return cached['entries']
+
+    def scan_data_file(self, csv_path):
+        """Return the headers and row offsets of a csv data file."""
+        path = os.path.abspath(csv_path)
+        if path not in self.checked:
+            st = os.stat(path)
+            key = [st.st_mtime, st.st_size]
+            cached = self.data_files.get(path)
+            hit = cached is not None and cached['key'] == key
+            if not hit:
+                headers, offsets = cases.scan_data_file(path)
+                self.data_files[path] = dict(key=key, headers=headers,
+                                             offsets=offsets)
+            self._record(path, hit)
+        cached = self.data_files[path]
+        return cached['headers'], cached['offsets']
+
+
+def prefetch_tree(dir_path, lister=None, dir_matcher=None, threads=8):
+    """List the directories of a tree with concurrent threads.
+
+    The directories at the same depth are listed concurrently, which hides
+    the file system latency (network mounts) without changing the order the
+    tests are discovered in.
+
+    :param dir_path: The root of the tree.
+    :param lister: The callable listing a directory, `list_directory` by
+        default.
+    :param dir_matcher: A NameMatcher selecting the sub directories to walk,
+        all of them by default.
+    :param threads: The number of threads listing directories.
+    :return: A dict of the entries of the listed directories keyed by their
+        absolute path.
+    """
+    if lister is None:
+        lister = list_directory
+
+    def list_entries(path):
+        try:
+            return lister(path)
+        except OSError:
+            # Vanished or unreadable, discovery will deal with it
+            return None
+
+    listings = {}
+    pool = multiprocessing.pool.ThreadPool(threads)
+    try:
+        level = [os.path.abspath(dir_path)]
+        while level:
+            next_level = []
+            for path, entries in zip(level, pool.map(list_entries, level)):
+                if entries is None:
+                    continue
+                listings[path] = entries
+                for name, kind in sorted(entries.items()):
+                    if kind != 'dir':
+                        continue
+                    if dir_matcher is None or dir_matcher.matches(name):
+                        next_level.append(os.path.join(path, name))
+            level = next_level
+    finally:
+        pool.close()
+        pool.join()
+    return listings
+
+
 class TestLoader(unittest.TestLoader):
     """Load tests from an arbitrary tree.
 
@@ -94,6 +275,10 @@ class TestLoader(unittest.TestLoader):
 
     file_matcher = NameMatcher(includes=[r'^test.*\.py$'])
     dir_matcher = NameMatcher(includes=[r'.*'])
+    # A DiscoveryIndex saving the file system accesses
+    discovery_index = None
+    # The directory entries listed by prefetchTree keyed by absolute path
+    prefetched = None
 
     def discover(self, start_dir, pattern='test*.py', top_level_dir=None):
         if top_level_dir:
@@ -108,9 +293,9 @@ class TestLoader(unittest.TestLoader):
 
     def discoverTestsFromTree(self, dir_path, package=None):
         suite = self.suiteClass()
-        names = os.listdir(dir_path)
+        names = list(self.listDirectory(dir_path))
         if package is None:
-            if os.path.isfile(os.path.join(dir_path, '__init__.py')):
+            if self.isFile(os.path.join(dir_path, '__init__.py')):
                 package = self.importFromPath(dir_path)
                 names.remove('__init__.py')
         if package is not None:
@@ -135,9 +320,9 @@ class TestLoader(unittest.TestLoader):
         suite = self.suiteClass()
         for name in self.sortNames(names):
             path = os.path.join(dir_path, name)
-            if os.path.isfile(path) and self.file_matcher.matches(name):
+            if self.isFile(path) and self.file_matcher.matches(name):
                 suite.addTests(self.discoverTestsFromFile(path))
-            elif os.path.isdir(path) and self.dir_matcher.matches(name):
+            elif self.isDir(path) and self.dir_matcher.matches(name):
                 suite.addTests(self.discoverTestsFromTree(path))
         return suite
 
@@ -145,6 +330,55 @@ class TestLoader(unittest.TestLoader):
         module = self.importFromPath(path)
         return self.loadTestsFromModule(module)
 
+    def prefetchTree(self, dir_path, threads=8):
+        """List the directories of a tree concurrently before discovery.
+
+        Only the file system accesses are done concurrently, the tests are
+        still discovered (and the modules imported) in order. The whole tree
+        is listed, including the sub directories a package `discover` or
+        `load_tests` hook may not walk, so this is only worth it when most of
+        the tree is discovered.
+        """
+        if self.discovery_index is None:
+            lister = list_directory
+        else:
+            lister = self.discovery_index.list_directory
+        self.prefetched = prefetch_tree(dir_path, lister, self.dir_matcher,
+                                        threads)
+
+    def listDirectory(self, dir_path):
+        if self.prefetched is not None:
+            entries = self.prefetched.get(os.path.abspath(dir_path))
+            if entries is not None:
+                return entries
+        if self.discovery_index is None:
+            entries = list_directory(dir_path)
+        else:
+            entries = self.discovery_index.list_directory(dir_path)
+        if self.prefetched is not None:
+            # Outside of the prefetched tree, list it only once
+            self.prefetched[os.path.abspath(dir_path)] = entries
+        return entries
+
+    def _entryKind(self, path):
+        dir_path, name = os.path.split(path)
+        try:
+            entries = self.listDirectory(dir_path or os.curdir)
+        except OSError:
+            # No such directory
+            return None
+        return entries.get(name)
+
+    def isFile(self, path):
+        if self.discovery_index is None and self.prefetched is None:
+            return os.path.isfile(path)
+        return self._entryKind(path) == 'file'
+
+    def isDir(self, path):
+        if self.discovery_index is None and self.prefetched is None:
+            return os.path.isdir(path)
+        return self._entryKind(path) == 'dir'
+
     def sortNames(self, names):
         """Return 'names' sorted as defined by sortTestMethodsUsing.
 
@@ -188,10 +422,17 @@ class SSTestLoader(TestLoader):
 
     def __init__(self, results_directory=None, browser_factory=None,
                  screenshots_on=False, debug_post_mortem=False,
-                 extended_report=False):
+                 extended_report=False, browser_pool=None,
+                 prelaunch_browser=False, row_selector=None,
+                 discovery_index=None):
         super(SSTestLoader, self).__init__()
         self.results_directory = results_directory
         self.browser_factory = browser_factory
+        self.browser_pool = browser_pool
+        self.prelaunch_browser = prelaunch_browser
+        # Selects the csv data rows scripts are run with
+        self.row_selector = row_selector
+        self.discovery_index = discovery_index
         self.screenshots_on = screenshots_on
         self.debug_post_mortem = debug_post_mortem
         self.extended_report = extended_report
@@ -202,14 +443,19 @@ class SSTestLoader(TestLoader):
     def loadTestsFromScript(self, path):
         suite = self.suiteClass()
         dir_name, script_name = os.path.split(path)
-        if not os.path.isfile(path):
+        if not self.isFile(path):
             return suite
         # script specific test parametrization
         csv_path = path.replace('.py', '.csv')
-        if os.path.isfile(csv_path):
-            for row in cases.get_data(csv_path):
-                # row is a dictionary of variables that will magically appear
-                # as globals in the script.
+        if self.isFile(csv_path):
+            if self.discovery_index is not None:
+                scanned = self.discovery_index.scan_data_file(csv_path)
+            else:
+                scanned = None
+            rows = cases.get_data_rows(csv_path, self.row_selector, scanned)
+            for row in rows:
+                # row provides a dictionary of variables that will magically
+                # appear as globals in the script when the test runs.
                 test = self.loadTestFromScript(dir_name, script_name, row)
                 suite.addTest(test)
         else:
@@ -224,6 +470,8 @@ class SSTestLoader(TestLoader):
         # smells wrong here. -- vila 2013-04-26
         test.results_directory = self.results_directory
         test.browser_factory = self.browser_factory
+        test.browser_pool = self.browser_pool
+        test.prelaunch_browser = self.prelaunch_browser
 
         test.screenshots_on = self.screenshots_on
         test.debug_post_mortem = self.debug_post_mortem
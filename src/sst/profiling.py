@@ -0,0 +1,276 @@
+#
+#   Copyright (c) 2013 Canonical Ltd.
+#
+#   This file is part of: SST (selenium-simple-test)
+#   https://launchpad.net/selenium-simple-test
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+"""Profiling of the actions used by the tests.
+
+When enabled, every call to a public action records its wall time, the number
+of WebDriver commands it issued and the number of times it polled (waiting
+for a condition or retrying). Only the outermost action is recorded when
+actions call each other. The actions are wrapped when they are defined (see
+`profile_actions`) so they are profiled however the tests imported them.
+
+The profile of each test is attached to its result as a detail so it reaches
+the main process when tests run concurrently. `ProfileResult` aggregates
+them for the whole run.
+"""
+
+import functools
+import json
+import logging
+import os
+import time
+
+import testtools
+import testtools.content
+
+from selenium.webdriver.remote import webdriver
+
+
+logger = logging.getLogger('SST')
+
+
+# The name of the test detail holding the profile of the test
+DETAIL_NAME = 'Action profile'
+
+# The actions that are not profiled, the actions called by the script
+# run_test runs are more interesting
+_excluded_actions = ('debug', 'run_test')
+
+
+class ActionProfiler(object):
+    """Record the actions called by the current test."""
+
+    def __init__(self):
+        super(ActionProfiler, self).__init__()
+        # The depth of the actions calling each other
+        self.depth = 0
+        self.commands = 0
+        self.polls = 0
+        self.stats = {}
+
+    def start_test(self):
+        self.stats = {}
+
+    def action(self, name, func, args, kwargs):
+        """Call an action, recording it unless it's called by another."""
+        if self.depth:
+            return func(*args, **kwargs)
+        self.depth += 1
+        self.commands = 0
+        self.polls = 0
+        start = time.time()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            elapsed = time.time() - start
+            self.depth -= 1
+            add_stats(self.stats, name,
+                      dict(calls=1, time=elapsed, commands=self.commands,
+                           polls=self.polls))
+
+    def command(self):
+        if self.depth:
+            self.commands += 1
+
+    def poll(self):
+        if self.depth:
+            self.polls += 1
+
+
+def add_stats(stats, name, added):
+    """Add the `added` counters to the ones of `name` in `stats`."""
+    current = stats.setdefault(name, dict(calls=0, time=0.0, commands=0,
+                                          polls=0))
+    for key, value in added.items():
+        current[key] += value
+
+
+# The profiler of the current process, None when profiling is disabled
+_profiler = None
+# The original WebDriver.execute, restored by disable()
+_original_execute = None
+
+
+def is_enabled():
+    return _profiler is not None
+
+
+def enable():
+    """Start profiling the actions."""
+    global _profiler
+    global _original_execute
+    if _profiler is not None:
+        return
+    _profiler = ActionProfiler()
+    execute = webdriver.WebDriver.execute
+    _original_execute = execute
+
+    @functools.wraps(execute)
+    def counted_execute(*args, **kwargs):
+        if _profiler is not None:
+            _profiler.command()
+        return execute(*args, **kwargs)
+    webdriver.WebDriver.execute = counted_execute
+
+
+def disable():
+    """Stop profiling the actions."""
+    global _profiler
+    global _original_execute
+    if _profiler is None:
+        return
+    webdriver.WebDriver.execute = _original_execute
+    _original_execute = None
+    _profiler = None
+
+
+def profile_actions(namespace, names):
+    """Wrap the actions so they are profiled while profiling is enabled.
+
+    :param namespace: The dict defining the actions (the module globals).
+    :param names: The names of the actions to wrap.
+    """
+    for name in names:
+        if name in _excluded_actions:
+            continue
+        namespace[name] = _profiled_action(name, namespace[name])
+
+
+def _profiled_action(name, func):
+
+    @functools.wraps(func)
+    def profiled(*args, **kwargs):
+        if _profiler is None:
+            return func(*args, **kwargs)
+        return _profiler.action(name, func, args, kwargs)
+    # Some actions need to inspect the signature of the real one
+    profiled.__wrapped__ = func
+    return profiled
+
+
+def record_poll():
+    """Record that the current action polls again."""
+    if _profiler is not None:
+        _profiler.poll()
+
+
+def start_test():
+    """Start recording the profile of a new test."""
+    if _profiler is not None:
+        _profiler.start_test()
+
+
+def get_test_profile():
+    """Return the profile of the current test."""
+    if _profiler is None:
+        return {}
+    return _profiler.stats
+
+
+def add_profile_detail(test):
+    """Attach the profile of the current test to it."""
+    stats = get_test_profile()
+    if stats:
+        test.addDetail(DETAIL_NAME, testtools.content.json_content(stats))
+
+
+class ProfileResult(testtools.TestResult):
+    """A TestResult aggregating the profiles of the tests.
+
+    The profile of the run is saved as json at the end of the run and the
+    most expensive actions are summarized.
+    """
+
+    def __init__(self, path, stream=None, top=10):
+        """Create a profile result.
+
+        :param path: The file the profile of the run is saved to.
+        :param stream: Where the summary is written, if any.
+        :param top: The number of actions in the summary.
+        """
+        super(ProfileResult, self).__init__()
+        self.path = path
+        self.stream = stream
+        self.top = top
+        self.actions = {}
+        self.tests = {}
+
+    def _record(self, test, details):
+        if not details or DETAIL_NAME not in details:
+            return
+        content = details[DETAIL_NAME]
+        stats = json.loads(''.join(content.iter_bytes()))
+        test_stats = self.tests.setdefault(test.id(), {})
+        for name, counters in stats.items():
+            add_stats(self.actions, name, counters)
+            add_stats(test_stats, name, counters)
+
+    def addSuccess(self, test, details=None):
+        self._record(test, details)
+        super(ProfileResult, self).addSuccess(test, details=details)
+
+    def addFailure(self, test, err=None, details=None):
+        self._record(test, details)
+        super(ProfileResult, self).addFailure(test, err, details=details)
+
+    def addError(self, test, err=None, details=None):
+        self._record(test, details)
+        super(ProfileResult, self).addError(test, err, details=details)
+
+    def addSkip(self, test, reason=None, details=None):
+        self._record(test, details)
+        super(ProfileResult, self).addSkip(test, reason, details=details)
+
+    def addExpectedFailure(self, test, err=None, details=None):
+        self._record(test, details)
+        super(ProfileResult, self).addExpectedFailure(test, err,
+                                                      details=details)
+
+    def addUnexpectedSuccess(self, test, details=None):
+        self._record(test, details)
+        super(ProfileResult, self).addUnexpectedSuccess(test, details=details)
+
+    def stopTestRun(self):
+        self.save()
+        if self.stream is not None:
+            self.stream.write(self.summary())
+        return super(ProfileResult, self).stopTestRun()
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        with open(self.path, 'w') as f:
+            json.dump(dict(actions=self.actions, tests=self.tests), f,
+                      indent=1, sort_keys=True)
+
+    def summary(self):
+        """Return the most expensive actions as text."""
+        ranked = sorted(self.actions.items(), key=lambda a: a[1]['time'],
+                        reverse=True)[:self.top]
+        lines = ['', 'Top %d actions by total time:' % (self.top,),
+                 '%-30s %8s %10s %10s %10s %8s' % (
+                     'action', 'calls', 'total (s)', 'mean (ms)', 'commands',
+                     'polls')]
+        for name, stats in ranked:
+            lines.append('%-30s %8d %10.3f %10.1f %10d %8d' % (
+                name, stats['calls'], stats['time'],
+                1000 * stats['time'] / stats['calls'], stats['commands'],
+                stats['polls']))
+        return '\n'.join(lines) + '\n'
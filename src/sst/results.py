@@ -17,32 +17,107 @@
 #   limitations under the License.
 #
 
-from testtools import testresult
+import json
+import os
+import re
+import time
+
+import junitxml
+import subunit
+from subunit import test_results as subunit_results
+import testtools
+from testtools import (
+    content,
+    testresult,
+)
+
+from sst import (
+    profiling,
+    tracing,
+)
+
+
+# The name of the test detail holding the time spent in each phase of a test
+PHASES_DETAIL_NAME = 'Phase timings'
+# The phases of a test, in the order they happen
+PHASES = ('compile', 'setup', 'browser_start', 'body', 'screenshot',
+          'cleanup')
+# The details recorded for the reports, not for the people reading them
+INTERNAL_DETAIL_NAMES = (PHASES_DETAIL_NAME, profiling.DETAIL_NAME,
+                         tracing.DETAIL_NAME, tracing.EVENTS_DETAIL_NAME)
+
+
+def get_phase_timings(details):
+    """Return the time spent in each phase of a test.
+
+    :param details: The details of the test outcome.
+    :returns: A list of (phase, seconds) in the order the phases happen,
+        empty if the test didn't record them.
+    """
+    if not details or PHASES_DETAIL_NAME not in details:
+        return []
+    content = details[PHASES_DETAIL_NAME]
+    timings = json.loads(''.join(content.iter_bytes()))
+    return [(phase, timings[phase]) for phase in PHASES if phase in timings]
+
+
+def format_phase_timings(timings):
+    return ', '.join('%s %.3f' % (phase, seconds)
+                     for phase, seconds in timings)
 
 
 class TextTestResult(testresult.TextTestResult):
-    """A TestResult which outputs activity to a text stream."""
+    """A TestResult which outputs activity to a text stream.
+
+    The time spent in each phase of the tests is displayed for each test in
+    verbose mode and summed up for the whole run.
+    """
 
     def __init__(self, stream, failfast=False, verbosity=1):
         super(TextTestResult, self).__init__(stream, failfast)
         self.verbose = verbosity > 1
+        self.phase_totals = {}
+        self.phase_timings = []
 
     def startTest(self, test):
         if self.verbose:
             self.stream.write(str(test))
             self.stream.write(' ... ')
         self.start_time = self._now()
+        self.phase_timings = []
         super(TextTestResult, self).startTest(test)
 
     def stopTest(self, test):
         if self.verbose:
-            elapsed_time = self._now() - self.start_time
-            self.stream.write(' (%.3f secs)\n'
-                              % self._delta_to_float(elapsed_time))
+            elapsed_time = self._delta_to_float(self._now() - self.start_time)
+            if self.phase_timings:
+                self.stream.write(' (%.3f secs: %s)\n' % (
+                    elapsed_time, format_phase_timings(self.phase_timings)))
+            else:
+                self.stream.write(' (%.3f secs)\n' % elapsed_time)
             self.stream.flush()
         super(TextTestResult, self).stopTest(test)
 
+    def stopTestRun(self):
+        if self.phase_totals:
+            totals = [(phase, self.phase_totals[phase]) for phase in PHASES
+                      if phase in self.phase_totals]
+            self.stream.write('\nTime spent per phase: %s\n'
+                              % format_phase_timings(totals))
+        super(TextTestResult, self).stopTestRun()
+
+    def _err_details_to_string(self, test, err=None, details=None):
+        return super(TextTestResult, self)._err_details_to_string(
+            test, err, filter_internal_details(details))
+
+    def _record_phases(self, details):
+        self.phase_timings = get_phase_timings(details)
+        for phase, seconds in self.phase_timings:
+            self.phase_totals[phase] = (self.phase_totals.get(phase, 0.0) +
+                                        seconds)
+
     def addExpectedFailure(self, test, err=None, details=None):
+        self._record_phases(details)
         if self.verbose:
             self.stream.write('XFAIL')
         else:
@@ -50,6 +125,7 @@ class TextTestResult(testresult.TextTestResult):
         super(TextTestResult, self).addExpectedFailure(test, err, details)
 
     def addError(self, test, err=None, details=None):
+        self._record_phases(details)
         if self.verbose:
             self.stream.write('ERROR')
         else:
@@ -57,6 +133,7 @@ class TextTestResult(testresult.TextTestResult):
         super(TextTestResult, self).addError(test, err, details)
 
     def addFailure(self, test, err=None, details=None):
+        self._record_phases(details)
         if self.verbose:
             self.stream.write('FAIL')
         else:
@@ -67,6 +144,7 @@ class TextTestResult(testresult.TextTestResult):
         # FIXME: Something weird is going on with testtools, as we're supposed
         # to use a (self, test, reason, details) signature but this is never
         # called this way -- vila 2013-05-10
+        self._record_phases(details)
         reason = details.get('reason', '').as_text()
         if self.verbose:
             if not reason:
@@ -82,6 +160,7 @@ class TextTestResult(testresult.TextTestResult):
         # self.skipped.append((test, reason)) call.
 
     def addSuccess(self, test, details=None):
+        self._record_phases(details)
         if self.verbose:
             self.stream.write('OK')
         else:
@@ -89,8 +168,396 @@ class TextTestResult(testresult.TextTestResult):
         super(TextTestResult, self).addSuccess(test, details)
 
     def addUnexpectedSuccess(self, test, details=None):
+        self._record_phases(details)
         if self.verbose:
             self.stream.write('NOTOK')
         else:
             self.stream.write('u')
         super(TextTestResult, self).addUnexpectedSuccess(test, details)
+
+
+def filter_internal_details(details):
+    """Return the details of a test without the ones recorded for sst.
+
+    The phase timings, action profiles and WebDriver traces are meant for the
+    reports and tools processing them, not for the people reading why a test
+    failed.
+    """
+    if not details:
+        return details
+    return dict((name, detail) for name, detail in details.items()
+                if name not in INTERNAL_DETAIL_NAMES)
+
+
+# The characters XML documents can't contain
+_invalid_xml_chars = re.compile(u'[\x00-\x08\x0b-\x1f\ufffe\uffff]')
+
+
+def _xml_escape(text, attribute=False):
+    """Return ``text`` escaped for an XML document, encoded in utf-8."""
+    if not isinstance(text, unicode):
+        text = text.decode('utf-8', 'replace')
+    text = _invalid_xml_chars.sub(u'', text)
+    text = text.replace(u'&', u'&amp;').replace(u'<', u'&lt;').replace(
+        u']]>', u']]&gt;')
+    if attribute:
+        text = text.replace(u'"', u'&quot;').replace(
+            u'\t', u'&#x9;').replace(u'\n', u'&#xA;')
+    return text.encode('utf-8')
+
+
+def _exception_name(exc_class):
+    module = exc_class.__module__
+    if module in ('__main__', 'builtins', 'exceptions'):
+        return exc_class.__name__
+    return '%s.%s' % (module, exc_class.__name__)
+
+
+class _JUnitXmlWriter(junitxml.JUnitXmlResult):
+    """A junitxml result including the time spent in each phase of the tests.
+
+    junitxml provides the timing, the test cases are written here so the
+    phase timings can be added as their properties. They are set by
+    `JUnitXmlResult` before the outcome of a test is reported.
+    """
+
+    def __init__(self, stream):
+        super(_JUnitXmlWriter, self).__init__(stream)
+        self.phase_timings = []
+        # The XML of the test cases not written yet
+        self.testcases = []
+
+    def add_testcase(self, test, outcome=''):
+        """Add a completed test case.
+
+        :param test: The test.
+        :param outcome: The XML describing the outcome of the test, empty for
+            the successes.
+        """
+        test_id = test.id()
+        # Split on the last dot not inside a parameter
+        class_end = test_id.rfind('.', 0, test_id.find('('))
+        if class_end == -1:
+            classname, name = '', test_id
+        else:
+            classname, name = test_id[:class_end], test_id[class_end + 1:]
+        testcase = '<testcase classname="%s" name="%s" time="%0.3f"' % (
+            _xml_escape(classname, True), _xml_escape(name, True),
+            self._duration(self._test_start))
+        content = []
+        if self.phase_timings:
+            content.append('<properties>\n')
+            for phase, seconds in self.phase_timings:
+                content.append('<property name="phase.%s" value="%0.3f"/>\n'
+                               % (phase, seconds))
+            content.append('</properties>\n')
+        if outcome:
+            content.append(outcome)
+        if content:
+            testcase += '>\n%s</testcase>\n' % ''.join(content)
+        else:
+            testcase += '/>\n'
+        self.testcases.append(testcase)
+        self.testcase_added()
+
+    def testcase_added(self):
+        """Called once a test case is complete."""
+        pass
+
+    def _exception_outcome(self, tag, test, error):
+        return '<%s type="%s">%s</%s>\n' % (
+            tag, _xml_escape(_exception_name(error[0]), True),
+            _xml_escape(self._exc_info_to_string(error, test)), tag)
+
+    # Skip the junitxml methods writing the test cases on their own, the
+    # unittest ones keep the counts.
+
+    def addSuccess(self, test):
+        super(junitxml.JUnitXmlResult, self).addSuccess(test)
+        self.add_testcase(test)
+
+    def addError(self, test, error):
+        super(junitxml.JUnitXmlResult, self).addError(test, error)
+        self.add_testcase(test, self._exception_outcome('error', test, error))
+
+    def addFailure(self, test, error):
+        super(junitxml.JUnitXmlResult, self).addFailure(test, error)
+        self.add_testcase(test,
+                          self._exception_outcome('failure', test, error))
+
+    def addSkip(self, test, reason):
+        super(junitxml.JUnitXmlResult, self).addSkip(test, reason)
+        self.add_testcase(
+            test, '<skipped>%s</skipped>\n' % _xml_escape(reason, True))
+
+    def addExpectedFailure(self, test, error):
+        super(junitxml.JUnitXmlResult, self).addExpectedFailure(test, error)
+        self.add_testcase(test)
+
+    def addUnexpectedSuccess(self, test):
+        super(junitxml.JUnitXmlResult, self).addUnexpectedSuccess(test)
+        self.add_testcase(
+            test, '<failure type="unittest.case._UnexpectedSuccess"/>\n')
+
+    def testsuite_tag(self):
+        return ('<testsuite errors="%d" failures="%d" name="" tests="%d"'
+                ' time="%0.3f"' % (
+                    len(self.errors),
+                    len(self.failures) + len(self.unexpectedSuccesses),
+                    self.testsRun, self._duration(self._run_start)))
+
+    def stopTestRun(self):
+        self._stream.write('%s>\n%s</testsuite>\n' % (
+            self.testsuite_tag(), ''.join(self.testcases)))
+
+
+class _StreamingJUnitXmlWriter(_JUnitXmlWriter):
+    """A _JUnitXmlWriter writing the test cases while the tests run.
+
+    The report is kept valid on disk even if the run is killed: the pending
+    test cases are written periodically followed by the closing tag (which
+    the next ones overwrite) and the opening tag is rewritten in place with
+    the updated counts. It's padded so its length never changes.
+
+    Once a test case is written, only the count of its outcome is kept: the
+    texts of the failures are not accumulated in memory for the whole run.
+    """
+
+    # The room reserved for the opening tag, enough for billions of tests
+    testsuite_tag_width = 120
+
+    # Replaces the (test, text) entries of the outcomes already written
+    written_outcome = (None, None)
+
+    def __init__(self, stream, flush_interval):
+        super(_StreamingJUnitXmlWriter, self).__init__(stream)
+        self.flush_interval = flush_interval
+        self.last_flush = None
+        self.start_offset = None
+        self.end_offset = None
+
+    def startTestRun(self):
+        super(_StreamingJUnitXmlWriter, self).startTestRun()
+        self.start_offset = self._stream.tell()
+        self._stream.write(self._padded_testsuite_tag())
+        self.end_offset = self._stream.tell()
+        self._stream.write('</testsuite>\n')
+        self._flush_stream()
+
+    def _padded_testsuite_tag(self):
+        tag = self.testsuite_tag()
+        # Whitespace is allowed before the end of a tag
+        return tag + ' ' * (self.testsuite_tag_width - len(tag)) + '>\n'
+
+    def testcase_added(self):
+        for outcomes in (self.errors, self.failures, self.expectedFailures,
+                         self.skipped):
+            if outcomes and outcomes[-1] is not self.written_outcome:
+                outcomes[-1] = self.written_outcome
+        if time.time() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """Write the pending test cases and the updated counts."""
+        self._stream.seek(self.end_offset)
+        # A single write so the closing tag is never missing on disk for long
+        self._stream.write(''.join(self.testcases) + '</testsuite>\n')
+        self.end_offset = self._stream.tell() - len('</testsuite>\n')
+        self.testcases = []
+        self._stream.seek(self.start_offset)
+        self._stream.write(self._padded_testsuite_tag())
+        self._stream.seek(0, os.SEEK_END)
+        self._flush_stream()
+
+    def _flush_stream(self):
+        self._stream.flush()
+        self.last_flush = time.time()
+
+    def stopTestRun(self):
+        self.flush()
+
+
+class JUnitXmlResult(testtools.ExtendedToOriginalDecorator):
+    """A TestResult which outputs JUnit compatible XML.
+
+    The report is written by junitxml. The time spent in each phase of the
+    tests is included as properties of the test cases and the internal
+    details are left out of the failures.
+    """
+
+    def __init__(self, stream):
+        """Create a JUnit XML result.
+
+        :param stream: The stream the XML is written to once the run is
+            complete.
+        """
+        super(JUnitXmlResult, self).__init__(self._make_writer(stream))
+
+    def _make_writer(self, stream):
+        return _JUnitXmlWriter(stream)
+
+    def _set_phase_timings(self, details):
+        self.decorated.phase_timings = get_phase_timings(details)
+        return filter_internal_details(details)
+
+    def addSuccess(self, test, details=None):
+        details = self._set_phase_timings(details)
+        super(JUnitXmlResult, self).addSuccess(test, details=details)
+
+    def addError(self, test, err=None, details=None):
+        details = self._set_phase_timings(details)
+        super(JUnitXmlResult, self).addError(test, err, details=details)
+
+    def addFailure(self, test, err=None, details=None):
+        details = self._set_phase_timings(details)
+        super(JUnitXmlResult, self).addFailure(test, err, details=details)
+
+    def addSkip(self, test, reason=None, details=None):
+        details = self._set_phase_timings(details)
+        super(JUnitXmlResult, self).addSkip(test, reason, details=details)
+
+    def addExpectedFailure(self, test, err=None, details=None):
+        details = self._set_phase_timings(details)
+        super(JUnitXmlResult, self).addExpectedFailure(test, err,
+                                                       details=details)
+
+    def addUnexpectedSuccess(self, test, details=None):
+        details = self._set_phase_timings(details)
+        super(JUnitXmlResult, self).addUnexpectedSuccess(test,
+                                                         details=details)
+
+
+class StreamingJUnitXmlResult(JUnitXmlResult):
+    """A JUnitXmlResult writing the test cases while the tests run.
+
+    The report on disk is a valid JUnit XML document at any time.
+    """
+
+    def __init__(self, stream, flush_interval=1.0):
+        """Create a streaming JUnit XML result.
+
+        :param stream: The seekable stream the XML is written to.
+        :param flush_interval: The minimum time (in seconds) between two
+            writes of the test cases completed in the meantime.
+        """
+        self.flush_interval = flush_interval
+        super(StreamingJUnitXmlResult, self).__init__(stream)
+
+    def _make_writer(self, stream):
+        return _StreamingJUnitXmlWriter(stream, self.flush_interval)
+
+    def flush(self):
+        """Write the test cases completed so far."""
+        self.decorated.flush()
+
+
+def get_subunit_result(stream):
+    """Return a result writing a subunit stream.
+
+    Subunit v2 is used if the installed subunit supports it, v1 otherwise.
+
+    :param stream: The binary stream the events are written to.
+    """
+    if getattr(subunit, 'StreamResultToBytes', None) is None:
+        return subunit_results.AutoTimingTestResultDecorator(
+            subunit.TestProtocolClient(stream))
+    return testtools.ExtendedToStreamDecorator(
+        subunit.StreamResultToBytes(stream))
+
+
+class JsonLinesResult(testtools.TestResult):
+    """A TestResult writing the test events as json, one per line.
+
+    Each event is flushed as soon as it happens so the stream can be followed
+    while the tests run. The text and json details of the tests are included
+    in their ``stopTest`` event.
+    """
+
+    def __init__(self, stream):
+        """Create a json lines result.
+
+        :param stream: The stream the events are written to.
+        """
+        super(JsonLinesResult, self).__init__()
+        self.stream = stream
+        self.counts = {}
+        self.status = None
+        self.details = None
+
+    def _write(self, event, **kwargs):
+        kwargs['event'] = event
+        kwargs['timestamp'] = self._now().isoformat()
+        self.stream.write(json.dumps(kwargs, sort_keys=True) + '\n')
+        self.stream.flush()
+
+    def startTestRun(self):
+        super(JsonLinesResult, self).startTestRun()
+        self.counts = {}
+        self.run_start = self._now()
+        self._write('startTestRun')
+
+    def stopTestRun(self):
+        self._write('stopTestRun', tests=self.testsRun, counts=self.counts,
+                    duration=self._duration(self.run_start))
+        super(JsonLinesResult, self).stopTestRun()
+
+    def startTest(self, test):
+        super(JsonLinesResult, self).startTest(test)
+        self.test_start = self._now()
+        self.status = None
+        self.details = None
+        self._write('startTest', id=test.id())
+
+    def stopTest(self, test):
+        self._write('stopTest', id=test.id(), status=self.status,
+                    duration=self._duration(self.test_start),
+                    details=self._encode_details(self.details))
+        # Don't keep the details of the tests already reported
+        self.details = None
+        super(JsonLinesResult, self).stopTest(test)
+
+    def _duration(self, start):
+        delta = self._now() - start
+        return (delta.days * 86400.0 + delta.seconds +
+                delta.microseconds / 1000000.0)
+
+    def _encode_details(self, details):
+        encoded = {}
+        for name, detail in (details or {}).items():
+            content_type = detail.content_type
+            if content_type.type == 'text':
+                encoded[name] = detail.as_text()
+            elif (content_type.type, content_type.subtype) == (
+                    'application', 'json'):
+                encoded[name] = json.loads(''.join(detail.iter_bytes()))
+            # Binary details (screenshots, etc) are left out
+        return encoded
+
+    def _outcome(self, test, status, err=None, details=None):
+        self.counts[status] = self.counts.get(status, 0) + 1
+        self.status = status
+        if err is not None:
+            details = dict(details or {})
+            details['traceback'] = content.TracebackContent(err, test)
+        self.details = details
+
+    def addSuccess(self, test, details=None):
+        self._outcome(test, 'success', details=details)
+
+    def addError(self, test, err=None, details=None):
+        self._outcome(test, 'error', err, details)
+
+    def addFailure(self, test, err=None, details=None):
+        self._outcome(test, 'failure', err, details)
+
+    def addSkip(self, test, reason=None, details=None):
+        if reason is not None:
+            details = dict(details or {})
+            details['reason'] = content.text_content(reason)
+        self._outcome(test, 'skip', details=details)
+
+    def addExpectedFailure(self, test, err=None, details=None):
+        self._outcome(test, 'xfail', err, details)
+
+    def addUnexpectedSuccess(self, test, details=None):
+        self._outcome(test, 'uxsuccess', details=details)
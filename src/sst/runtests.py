@@ -17,21 +17,27 @@
 #   limitations under the License.
 #
 
-import junitxml
 import logging
 import os
+import signal
 import sys
+import time
 
 import testtools
 
 from sst import (
     browsers,
     cases,
+    codecache,
     concurrency,
     config,
     filters,
     loaders,
+    profiling,
     results,
+    timings,
+    tracing,
+    xvfbdisplay,
 )
 
 # Maintaining compatibility until we deprecate the followings
@@ -66,7 +72,19 @@ def runtests(test_regexps, results_directory, out,
              extended=False,
              includes=None,
              excludes=None,
-             xml_results_filename='results.xml'):
+             xml_results_filename='results.xml',
+             reuse_browser=False,
+             prelaunch_browser=False,
+             timings_file=None,
+             work_queue=False,
+             xserver_headless=False,
+             bytecode_cache=None,
+             data_rows=None,
+             discovery_index_file=None,
+             discovery_threads=1,
+             profile=False,
+             trace_commands=False,
+             trace_file=None):
     if not os.path.isdir(test_dir):
         raise RuntimeError('Specified directory %r does not exist'
                            % (test_dir,))
@@ -77,13 +95,37 @@ def runtests(test_regexps, results_directory, out,
     if shared_directory is not None:
         sys.path.append(shared_directory)
 
+    if bytecode_cache is not None:
+        bytecode_cache = os.path.abspath(bytecode_cache)
+    # Inherited by the concurrent processes
+    codecache.set_bytecode_directory(bytecode_cache)
+
+    if reuse_browser:
+        browser_pool = browsers.BrowserPool()
+    else:
+        browser_pool = None
+    if data_rows is not None:
+        row_selector = cases.get_row_selector(data_rows)
+    else:
+        row_selector = None
     loader = loaders.SSTestLoader(results_directory,
                                   browser_factory, screenshots_on,
-                                  debug, extended)
+                                  debug, extended, browser_pool,
+                                  prelaunch_browser, row_selector)
+    if discovery_index_file is not None:
+        loader.discovery_index = loaders.DiscoveryIndex(discovery_index_file)
+        loader.discovery_index.load()
+    collect_start = time.time()
+    if discovery_threads > 1:
+        loader.prefetchTree(test_dir, discovery_threads)
     alltests = loader.suiteClass()
     alltests.addTests(loader.discoverTestsFromTree(test_dir))
     alltests = filters.include_regexps(test_regexps, alltests)
     alltests = filters.exclude_regexps(excludes, alltests)
+    log_collection(alltests, time.time() - collect_start,
+                   loader.discovery_index)
+    if loader.discovery_index is not None:
+        loader.discovery_index.save()
 
     if not alltests.countTestCases():
         # FIXME: Really needed ? Can't we just rely on the number of tests run
@@ -96,36 +138,133 @@ def runtests(test_regexps, results_directory, out,
         return 0
 
     txt_res = results.TextTestResult(out, failfast=failfast, verbosity=2)
+    all_results = [txt_res]
     if report_format == 'xml':
         results_file = os.path.join(results_directory, xml_results_filename)
         xml_stream = file(results_file, 'wb')
-        result = testtools.testresult.MultiTestResult(
-            txt_res, junitxml.JUnitXmlResult(xml_stream))
+        all_results.append(results.StreamingJUnitXmlResult(xml_stream))
+    elif report_format == 'subunit':
+        # Unbuffered so the events can be followed while the tests run
+        subunit_stream = open(
+            os.path.join(results_directory, 'results.subunit'), 'wb', 0)
+        all_results.append(results.get_subunit_result(subunit_stream))
+    elif report_format == 'jsonl':
+        jsonl_stream = open(os.path.join(results_directory, 'results.jsonl'),
+                            'wb')
+        all_results.append(results.JsonLinesResult(jsonl_stream))
+    if timings_file is not None:
+        history = timings.TimingHistory(os.path.abspath(timings_file))
+        history.load()
+        durations = history.get_durations()
+        all_results.append(timings.TimingRecorder(history))
+    else:
+        history = None
+        durations = None
+    if profile:
+        all_results.append(profiling.ProfileResult(
+            os.path.join(results_directory, 'profile.json'), out))
+    if trace_file is not None:
+        trace_commands = True
+        all_results.append(tracing.TraceResult(os.path.abspath(trace_file)))
+    if len(all_results) > 1:
+        result = testtools.testresult.MultiTestResult(*all_results)
         result.failfast = failfast
     else:
         result = txt_res
 
+    # The Xvfb displays started for the tests run in this process
+    displays = []
+
+    def setup_worker():
+        if xserver_headless:
+            # Each process gets its own display so the browsers running
+            # concurrently don't interfere
+            logger.debug('Starting virtual display')
+            display = xvfbdisplay.Xvfb(width=1024, height=768)
+            display.start()
+            displays.append(display)
+
+    def cleanup_worker():
+        # Don't leak the browsers kept alive for the tests to come
+        if browser_pool is not None:
+            browser_pool.stop()
+        if browser_factory is not None:
+            browser_factory.discard_prelaunched()
+        # The browsers are gone, their display can go too
+        while displays:
+            logger.debug('Stopping virtual display')
+            displays.pop().stop()
+
     if concurrency_num == 1:
         suite = alltests
     else:
+        if work_queue:
+            make_tests = concurrency.fork_for_queue
+        else:
+            make_tests = concurrency.fork_for_tests
         suite = testtools.ConcurrentTestSuite(
-            alltests, concurrency.fork_for_tests(concurrency_num))
+            alltests, make_tests(concurrency_num, cleanup_worker, durations,
+                                 setup_worker))
+
+    if profile:
+        # Inherited by the concurrent processes
+        profiling.enable()
+    if trace_commands:
+        # Inherited by the concurrent processes
+        tracing.enable(keep_events=trace_file is not None)
+    main_pid = os.getpid()
+    previous_handler = signal.getsignal(signal.SIGTERM)
+    if previous_handler is None:
+        # Not installed from python
+        previous_handler = signal.SIG_DFL
 
+    def terminate(signum, frame):
+        if os.getpid() != main_pid:
+            # A concurrent process, terminate as usual
+            signal.signal(signum, signal.SIG_DFL)
+            os.kill(os.getpid(), signum)
+            return
+        # Don't get in the way if we're asked again
+        signal.signal(signum, previous_handler)
+        # Complete the reports as if the run was interrupted, the concurrent
+        # processes are stopped by concurrency.run_suite
+        raise KeyboardInterrupt()
+    try:
+        signal.signal(signal.SIGTERM, terminate)
+        handling_sigterm = True
+    except ValueError:
+        # Signals can only be handled from the main thread
+        handling_sigterm = False
     result.startTestRun()
     try:
-        suite.run(result)
+        if concurrency_num == 1:
+            setup_worker()
+            suite.run(result)
+        else:
+            concurrency.run_suite(suite, result)
     except KeyboardInterrupt:
         out.write('Test run interrupted\n')
+    finally:
+        if handling_sigterm:
+            signal.signal(signal.SIGTERM, previous_handler)
+        cleanup_worker()
+        profiling.disable()
+        tracing.disable()
     result.stopTestRun()
+    if history is not None:
+        history.save()
+
+    return len(txt_res.failures) + len(txt_res.errors)
 
-    if isinstance(result, testtools.testresult.MultiTestResult):
-        failures = result._results[0].failures
-        errors = result._results[0].errors
-    else:
-        failures = result.failures
-        errors = result.errors
 
-    return len(failures) + len(errors)
+def log_collection(suite, elapsed, discovery_index=None):
+    """Log how long collecting the tests took."""
+    msg = 'Collected %d tests in %.3f secs' % (suite.countTestCases(),
+                                               elapsed)
+    if discovery_index is not None:
+        msg += (' (discovery index: %d entries reused, %d refreshed)'
+                % (discovery_index.hits, discovery_index.misses))
+    logger.info(msg)
 
 
 def find_shared_directory(test_dir, shared_directory):
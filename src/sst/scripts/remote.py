@@ -62,7 +62,18 @@ def main():
         extended=cmd_opts.extended_tracebacks,
         # FIXME: not tested -- vila 2013-05-23
         excludes=cmd_opts.excludes,
-        xml_results_filename=cmd_opts.xml_results_filename
+        xml_results_filename=cmd_opts.xml_results_filename,
+        reuse_browser=cmd_opts.reuse_browser,
+        prelaunch_browser=cmd_opts.prelaunch_browser,
+        timings_file=cmd_opts.timings_file,
+        work_queue=cmd_opts.work_queue,
+        bytecode_cache=cmd_opts.bytecode_cache,
+        data_rows=cmd_opts.data_rows,
+        discovery_index_file=cmd_opts.discovery_index,
+        discovery_threads=cmd_opts.discovery_threads,
+        profile=cmd_opts.profile,
+        trace_commands=cmd_opts.trace_commands,
+        trace_file=cmd_opts.trace_file
     )
 
 
@@ -50,13 +50,6 @@ def main():
     run_django(sst.DEVSERVER_PORT)
     cleaner.add('killing django...\n', kill_django, sst.DEVSERVER_PORT)
 
-    if cmd_opts.xserver_headless:
-        from sst.xvfbdisplay import Xvfb
-        out.write('starting virtual display...\n')
-        display = Xvfb(width=1024, height=768)
-        display.start()
-        cleaner.add('stopping virtual display...\n', display.stop)
-
     with cleaner:
         results_directory = os.path.abspath('results')
         command.reset_directory(results_directory)
@@ -77,7 +70,19 @@ def main():
             debug=cmd_opts.debug,
             extended=cmd_opts.extended_tracebacks,
             excludes=cmd_opts.excludes,
-            xml_results_filename=cmd_opts.xml_results_filename
+            xml_results_filename=cmd_opts.xml_results_filename,
+            reuse_browser=cmd_opts.reuse_browser,
+            prelaunch_browser=cmd_opts.prelaunch_browser,
+            timings_file=cmd_opts.timings_file,
+            work_queue=cmd_opts.work_queue,
+            xserver_headless=cmd_opts.xserver_headless,
+            bytecode_cache=cmd_opts.bytecode_cache,
+            data_rows=cmd_opts.data_rows,
+            discovery_index_file=cmd_opts.discovery_index,
+            discovery_threads=cmd_opts.discovery_threads,
+            profile=cmd_opts.profile,
+            trace_commands=cmd_opts.trace_commands,
+            trace_file=cmd_opts.trace_file
         )
 
     return failures
@@ -13,6 +13,16 @@ sst.actions.assert_text(element, 'Some text here')
 # Test an id.
 sst.actions.assert_text('some_id', 'Some text here')
 
+# Test text spanning several lines, whitespace is collapsed like WebDriver
+# does.
+sst.actions.assert_text('multi_line_text', 'A text on several lines')
+sst.actions.assert_text_contains('multi_line_text', 'text on several')
+
+# Test hidden children don't contribute to the text.
+sst.actions.assert_text('text_with_hidden_child', 'Shown text')
+sst.actions.assert_equal(
+    sst.actions.get_element(id='text_with_hidden_child').text, 'Shown text')
+
 # Test wrong text.
 sst.actions.fails(sst.actions.assert_text, 'some_id', 'Wrong text')
 
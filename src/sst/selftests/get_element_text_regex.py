@@ -18,3 +18,10 @@ sst.actions.get_element(tag='p', text_regex='^Some text.*$')
 sst.actions.exists_element(tag='p', text_regex='^Some text.*$')
 
 assert len(sst.actions.get_elements(tag='p', text_regex='^Some text.*$')) == 1
+
+# The texts are matched like WebElement.text: whitespace is collapsed and
+# hidden children are ignored.
+sst.actions.get_element(tag='p', text='A text on several lines')
+sst.actions.get_element(tag='p', text_regex='^A text on several lines$')
+sst.actions.get_element(tag='p', text='Shown text')
+assert not sst.actions.exists_element(tag='p', text_regex='hidden|invisible')
@@ -49,3 +49,10 @@ sst.actions.fails(
 sst.actions.fails(
     sst.actions.assert_table_row_contains_text, 'one-row', 0,
     ['Cell 0', 'Cell 1', 'Cell 2'], regex=True)
+
+# The texts are read like WebElement.text: whitespace is collapsed and hidden
+# children are ignored.
+sst.actions.assert_table_headers('whitespace', ['Head 0', 'Head 1'])
+sst.actions.assert_equal(
+    {'headers': ['Head 0', 'Head 1'], 'rows': [['Cell 0', 'Cell\n1']]},
+    sst.actions.get_table_data('whitespace'))
@@ -133,19 +133,16 @@ class TestRetryOnException(testtools.TestCase):
 
 class TestElementToString(testtools.TestCase):
 
+    def setUp(self):
+        super(TestElementToString, self).setUp()
+        self.browser = mock.Mock()
+        self.patch(actions, '_test', mock.Mock(browser=self.browser))
+
     def _get_mock_element(self, identifier=None, text=None, value=None,
                           outer_html=None):
-        def mock_get_attribute(attribute):
-            values = {
-                'id': identifier,
-                'value': value,
-                'outerHTML': outer_html
-            }
-            return values[attribute]
-        element = mock.Mock(spec=webelement.WebElement, parent=None, id_=None)
-        element.get_attribute.side_effect = mock_get_attribute
-        type(element).text = mock.PropertyMock(return_value=text)
-        return element
+        self.browser.execute_script.return_value = [
+            identifier, text, value, outer_html]
+        return mock.Mock(spec=webelement.WebElement, parent=None, id_=None)
 
     def test_element_with_id(self):
         element = self._get_mock_element(identifier='Test id')
@@ -166,6 +163,337 @@ class TestElementToString(testtools.TestCase):
         self.assertEqual(
             actions._element_to_string(element), '<p></p>')
 
+    def test_single_script_call(self):
+        element = self._get_mock_element(identifier='Test id')
+        actions._element_to_string(element)
+        self.browser.execute_script.assert_called_once_with(
+            actions._element_description_script, element)
+
+
+class TestElementString(testtools.TestCase):
+
+    def setUp(self):
+        super(TestElementString, self).setUp()
+        self.browser = mock.Mock()
+        self.browser.execute_script.return_value = ['Test id', None, None,
+                                                    None]
+        self.patch(actions, '_test', mock.Mock(browser=self.browser))
+
+    def test_not_described_until_displayed(self):
+        actions._ElementString(mock.Mock())
+        self.assertFalse(self.browser.execute_script.called)
+
+    def test_describes_current_state(self):
+        element_string = actions._ElementString(mock.Mock())
+        self.assertEqual("'Test id'", repr(element_string))
+        # An action changed the element since
+        self.browser.execute_script.return_value = ['New id', None, None,
+                                                    None]
+        self.assertEqual("'New id'", '%r' % (element_string,))
+
+    def test_unavailable_element(self):
+        self.browser.execute_script.side_effect = (
+            actions.WebDriverException('stale'))
+        self.assertEqual('<unavailable element>',
+                         repr(actions._ElementString(mock.Mock())))
+
+
+class TestElementSnapshot(testtools.TestCase):
+
+    def setUp(self):
+        super(TestElementSnapshot, self).setUp()
+        self.browser = mock.Mock()
+        self.patch(actions, '_test', mock.Mock(browser=self.browser))
+        self.element = mock.Mock(spec=webelement.WebElement)
+
+    def set_snapshot(self, **kwargs):
+        snapshot = dict(tag='input', type=None, id='', value=None, text='',
+                        displayed=True, selected=False)
+        snapshot.update(kwargs)
+        self.browser.execute_script.return_value = snapshot
+
+    def test_single_script_call(self):
+        self.set_snapshot(type='checkbox', selected=True)
+        actions.assert_checkbox_value(self.element, True)
+        self.browser.execute_script.assert_called_once_with(
+            actions._element_snapshot_script, self.element)
+        self.assertEqual([], self.element.method_calls)
+
+    def test_wrong_type(self):
+        self.set_snapshot(type='radio')
+        e = self.assertRaises(AssertionError,
+                              actions.assert_checkbox, self.element)
+        self.assertIn("is not one of ('checkbox',)", str(e))
+
+    def test_no_type(self):
+        self.set_snapshot(tag='p')
+        e = self.assertRaises(AssertionError,
+                              actions.assert_radio, self.element)
+        # Like WebDriver, a missing type is no type at all
+        self.assertIn("is not one of ('radio',)", str(e))
+
+    def test_assert_button_tag(self):
+        self.set_snapshot(tag='button', type='reset')
+        self.assertIs(self.element, actions.assert_button(self.element))
+
+    def test_assert_button_submit(self):
+        self.set_snapshot(type='submit')
+        self.assertIs(self.element, actions.assert_button(self.element))
+
+    def test_assert_text_of_textfield(self):
+        self.set_snapshot(type='email', value='me@example.com', text='')
+        actions.assert_text(self.element, 'me@example.com')
+        self.assertEqual(1, self.browser.execute_script.call_count)
+
+    def test_assert_text_of_empty_textfield(self):
+        self.set_snapshot(type='textarea', value=None)
+        actions.assert_text(self.element, '')
+
+    def test_assert_text(self):
+        self.set_snapshot(tag='p', text='Some text')
+        actions.assert_text_contains(self.element, 'text')
+
+
+class TestGetElementsWithText(testtools.TestCase):
+
+    def setUp(self):
+        super(TestGetElementsWithText, self).setUp()
+        self.browser = mock.Mock()
+        self.patch(actions, '_test', mock.Mock(browser=self.browser))
+        self.first = mock.Mock(spec=webelement.WebElement)
+        self.second = mock.Mock(spec=webelement.WebElement)
+
+    def test_text_is_filtered_in_browser(self):
+        self.browser.execute_script.return_value = [self.first]
+        self.assertIs(self.first, actions.get_element(tag='a', text='Next'))
+        self.browser.execute_script.assert_called_once_with(
+            actions._find_elements_with_text_script, 'a', 'Next')
+        self.assertFalse(self.browser.find_elements_by_css_selector.called)
+
+    def test_text_regex(self):
+        self.browser.execute_script.return_value = [
+            [self.first, 'Page 1'], [self.second, 'Next']]
+        self.assertEqual([self.first],
+                         actions.get_elements(tag='a', text_regex=r'\d$'))
+        self.browser.execute_script.assert_called_once_with(
+            actions._find_elements_with_text_script, 'a', None)
+
+    def test_no_match(self):
+        self.browser.execute_script.return_value = [[self.first, None]]
+        e = self.assertRaises(AssertionError, actions.get_elements,
+                              tag='a', text_regex='Next')
+        self.assertEqual('Could not identify elements: 0 elements found',
+                         str(e))
+
+    def test_invalid_selector(self):
+        self.browser.execute_script.side_effect = (
+            exceptions.WebDriverException('invalid selector'))
+        e = self.assertRaises(AssertionError, actions.get_elements,
+                              tag='a[', text='Next')
+        self.assertIn('Element not found', str(e))
+
+
+class TestDropdownOptions(testtools.TestCase):
+
+    def setUp(self):
+        super(TestDropdownOptions, self).setUp()
+        self.browser = mock.Mock()
+        self.patch(actions, '_test', mock.Mock(browser=self.browser))
+        self.select = mock.Mock(spec=webelement.WebElement)
+        self.option = mock.Mock(spec=webelement.WebElement)
+        self.real_find_option = actions._find_option
+        self.find_option = self.patch_find_option(self.option)
+
+    def patch_find_option(self, option):
+        # The type check goes through the element snapshot
+        self.browser.execute_script.return_value = {'type': 'select-one'}
+        find_option = mock.Mock(return_value=option)
+        self.patch(actions, '_find_option', find_option)
+        return find_option
+
+    def test_set_by_text(self):
+        actions.set_dropdown_value(self.select, text='Iceland')
+        self.find_option.assert_called_once_with(self.select, 'text',
+                                                 'Iceland')
+        self.option.click.assert_called_once_with()
+        self.assertFalse(self.select.find_elements_by_tag_name.called)
+
+    def test_set_by_value(self):
+        actions.set_dropdown_value(self.select, value='is')
+        self.find_option.assert_called_once_with(self.select, 'value', 'is')
+        self.option.click.assert_called_once_with()
+
+    def test_set_missing_option(self):
+        self.patch_find_option(None)
+        e = self.assertRaises(AssertionError, actions.set_dropdown_value,
+                              self.select, text='Atlantis')
+        self.assertEqual(
+            "The following option could not be found in the list: 'Atlantis'",
+            str(e))
+
+    def test_assert_value(self):
+        actions.assert_dropdown_value(self.select, 'Iceland')
+        self.find_option.assert_called_once_with(
+            self.select, 'text', 'Iceland', selected_only=True)
+
+    def test_assert_wrong_value(self):
+        self.patch_find_option(None)
+        e = self.assertRaises(AssertionError, actions.assert_dropdown_value,
+                              self.select, 'Atlantis')
+        self.assertEqual("The option is not currently set to: 'Atlantis'",
+                         str(e))
+
+    def test_find_option_single_call(self):
+        self.browser.execute_script.return_value = self.option
+        self.assertIs(self.option,
+                      self.real_find_option(self.select, 'value', 'is'))
+        self.browser.execute_script.assert_called_once_with(
+            actions._find_option_script, self.select, 'value', 'is', False)
+
+
+class TestTableData(testtools.TestCase):
+
+    def setUp(self):
+        super(TestTableData, self).setUp()
+        self.browser = mock.Mock()
+        self.patch(actions, '_test', mock.Mock(browser=self.browser))
+        self.table = mock.Mock(spec=webelement.WebElement)
+
+    def set_table(self, tag='table', headers=None, rows=None):
+        self.browser.execute_script.return_value = dict(
+            tag=tag, headers=headers, rows=rows)
+
+    def test_get_table_data(self):
+        self.set_table(headers=['Name', 'Age'], rows=[['Ann', '42']])
+        self.assertEqual({'headers': ['Name', 'Age'], 'rows': [['Ann', '42']]},
+                         actions.get_table_data(self.table))
+        self.browser.execute_script.assert_called_once_with(
+            actions._table_data_script, self.table)
+        self.assertEqual([], self.table.method_calls)
+
+    def test_not_a_table(self):
+        self.set_table(tag='div')
+        e = self.assertRaises(AssertionError, actions.get_table_data,
+                              self.table)
+        self.assertIn('is not a table', str(e))
+
+    def test_assert_table_headers(self):
+        self.set_table(headers=['Name', 'Age'], rows=[])
+        actions.assert_table_headers(self.table, ['Name', 'Age'])
+        self.assertRaises(AssertionError, actions.assert_table_headers,
+                          self.table, ['Name'])
+
+    def test_no_tbody(self):
+        self.set_table(headers=[])
+        e = self.assertRaises(AssertionError, actions.assert_table_has_rows,
+                              self.table, 0)
+        self.assertIn('has no tbody', str(e))
+
+    def test_assert_table_has_rows(self):
+        self.set_table(headers=[], rows=[['a'], ['b']])
+        actions.assert_table_has_rows(self.table, 2)
+        e = self.assertRaises(AssertionError, actions.assert_table_has_rows,
+                              self.table, 3)
+        self.assertEqual('Expected 3 rows. Found 2.', str(e))
+
+    def test_assert_table_row_contains_text(self):
+        self.set_table(headers=[], rows=[['Ann', '42'], ['Bob', '7']])
+        actions.assert_table_row_contains_text(self.table, 1, ['Bob', '7'])
+        actions.assert_table_row_contains_text(self.table, 0, ['A', r'\d+'],
+                                               regex=True)
+        e = self.assertRaises(AssertionError,
+                              actions.assert_table_row_contains_text,
+                              self.table, 2, ['Cid', '1'])
+        self.assertEqual('Asked to fetch row 2. Highest row is 1', str(e))
+
+
+class TestFillForm(testtools.TestCase):
+
+    def setUp(self):
+        super(TestFillForm, self).setUp()
+        self.browser = mock.Mock()
+        self.patch(actions, '_test', mock.Mock(browser=self.browser))
+        self.patch(actions, '_find_option', mock.Mock())
+        self.elements = {}
+
+    def state(self, name, type_, value=None, selected=False, option=None):
+        element = self.elements.setdefault(
+            name, mock.Mock(spec=webelement.WebElement, name=name))
+        return dict(element=element, type=type_, value=value,
+                    selected=selected, option=option)
+
+    def test_fill_form(self):
+        self.browser.execute_script.side_effect = [
+            [self.state('name', 'text', ''),
+             self.state('terms', 'checkbox'),
+             self.state('express', 'radio'),
+             self.state('country', 'select-one', option='Spain')],
+            [self.state('name', 'text', 'Ann'),
+             self.state('terms', 'checkbox', selected=True),
+             self.state('express', 'radio', selected=True),
+             self.state('country', 'select-one', option='Iceland')]]
+        actions.fill_form([('name', 'Ann'), ('terms', True),
+                           ('express', True), ('country', 'Iceland')])
+        self.assertEqual(2, self.browser.execute_script.call_count)
+        self.browser.execute_script.assert_called_with(
+            actions._form_fields_script,
+            [self.elements[name]
+             for name in ('name', 'terms', 'express', 'country')])
+        # The empty field isn't cleared
+        self.elements['name'].send_keys.assert_called_once_with('Ann')
+        self.elements['terms'].click.assert_called_once_with()
+        self.elements['express'].click.assert_called_once_with()
+        actions._find_option.assert_called_once_with(
+            self.elements['country'], 'text', 'Iceland')
+        actions._find_option.return_value.click.assert_called_once_with()
+
+    def test_clear_text_fields(self):
+        self.browser.execute_script.side_effect = [
+            [self.state('name', 'text', 'Bob')],
+            [self.state('name', 'text', '')],
+            [self.state('name', 'text', 'Ann')]]
+        actions.fill_form({'name': 'Ann'})
+        name = self.elements['name']
+        self.assertEqual(3, len(name.send_keys.call_args_list))
+        self.assertEqual(mock.call('Ann'), name.send_keys.call_args)
+        self.assertFalse(name.clear.called)
+
+    def test_fields_are_checked_before_writing(self):
+        self.browser.execute_script.return_value = [
+            self.state('name', 'text', ''), self.state('submit', 'submit')]
+        e = self.assertRaises(AssertionError, actions.fill_form,
+                              [('name', 'Ann'), ('submit', 'Go')])
+        self.assertIn("Element 'submit' is not one of", str(e))
+        self.assertFalse(self.elements['name'].send_keys.called)
+
+    def test_missing_field(self):
+        self.browser.execute_script.return_value = [None]
+        e = self.assertRaises(AssertionError, actions.fill_form,
+                              {'name': 'Ann'})
+        self.assertEqual("Element with id: 'name' does not exist", str(e))
+
+    def test_radio_cannot_be_unset(self):
+        self.browser.execute_script.return_value = [
+            self.state('express', 'radio', selected=True)]
+        self.assertRaises(TypeError, actions.fill_form, {'express': False})
+
+    def test_not_written(self):
+        self.patch(actions, '_element_to_string', lambda elem: 'name')
+        self.browser.execute_script.side_effect = [
+            [self.state('name', 'text', '')],
+            [self.state('name', 'text', 'An')]]
+        e = self.assertRaises(AssertionError, actions.fill_form,
+                              {'name': 'Ann'})
+        self.assertEqual(
+            "Textfield: 'name' - did not write. Text was: 'An'", str(e))
+
+    def test_no_check(self):
+        self.browser.execute_script.return_value = [
+            self.state('terms', 'checkbox', selected=True)]
+        actions.fill_form({'terms': True}, check=False)
+        self.assertEqual(1, self.browser.execute_script.call_count)
+        self.assertFalse(self.elements['terms'].click.called)
+
 
 class TestBaseUrl(testtools.TestCase):
 
@@ -173,3 +501,231 @@ class TestBaseUrl(testtools.TestCase):
         e = self.assertRaises(AssertionError, actions.go_to, '/')
         self.assertEqual('BASE_URL is not set, did you call set_base_url ?',
                          e.message)
+
+
+class TestWaitForObservingDom(testtools.TestCase):
+
+    def setUp(self):
+        super(TestWaitForObservingDom, self).setUp()
+        self.browser = mock.Mock()
+        self.patch(actions, '_test', mock.Mock(browser=self.browser,
+                                               script_timeout=30))
+        self.addCleanup(actions._set_wait_timeout, 10, 0.1, False)
+        actions.set_wait_timeout(5, 0.1, observe_dom=True)
+        self.sleep = mock.Mock()
+        self.patch(time, 'sleep', self.sleep)
+
+    def element_appears(self):
+        # The element appears once the page changed
+        elements = [mock.Mock(spec=webelement.WebElement)]
+        self.browser.find_elements_by_css_selector.side_effect = [[],
+                                                                  elements]
+        return elements[0]
+
+    def observed(self):
+        args = self.browser.execute_async_script.call_args[0]
+        return args[1:3]
+
+    def test_wait_for_element(self):
+        element = self.element_appears()
+        self.assertIs(element, actions.wait_for(actions.get_element,
+                                                tag='p', id='foo'))
+        self.assertEqual(('css', 'p#foo'), self.observed())
+        # Not waiting less than the poll time in the browser
+        self.assertEqual(100,
+                         self.browser.execute_async_script.call_args[0][4])
+
+    def test_quick_change_sleeps(self):
+        # The page changed faster than the poll time (the browser would have
+        # waited for it)
+        self.element_appears()
+        actions.wait_for(actions.get_element, id='foo')
+        self.sleep.assert_called_once_with(0.1)
+
+    def test_slow_change_doesnt_sleep(self):
+        self.element_appears()
+        now = [1000.0]
+
+        def wait(*args):
+            now[0] += 0.5
+        self.browser.execute_async_script.side_effect = wait
+        self.patch(time, 'time', lambda: now[0])
+        actions.wait_for(actions.get_element, id='foo')
+        self.assertFalse(self.sleep.called)
+
+    def test_wait_for_css(self):
+        element = self.element_appears()
+        self.assertIs(element, actions.wait_for(actions.get_element_by_css,
+                                                '.foo > p'))
+        self.assertEqual(('css', '.foo > p'), self.observed())
+
+    def test_wait_for_text(self):
+        self.browser.find_elements_by_xpath.side_effect = [
+            [], [mock.Mock(spec=webelement.WebElement, text='hello')]]
+        actions.wait_for(actions.get_element, text='hello')
+        # Any change in the page may reveal the text
+        self.assertEqual((None, None), self.observed())
+
+    def test_wait_for_displayed(self):
+        element = mock.Mock(spec=webelement.WebElement)
+        element.is_displayed.side_effect = [False, True]
+        actions.wait_for(actions.assert_displayed, element)
+        # A class or style change may display the element
+        self.assertEqual((None, None), self.observed())
+        self.assertIn("attributeFilter = ['class', 'style', 'hidden']",
+                      self.browser.execute_async_script.call_args[0][0])
+
+    def test_properties_are_polled(self):
+        # Input values, properties and computed styles change without
+        # mutating the page
+        element = mock.Mock(spec=webelement.WebElement)
+        for action, args in [(actions.get_text, (element,)),
+                             (actions.assert_text, (element, 'foo')),
+                             (actions.assert_attribute,
+                              (element, 'checked', 'true')),
+                             (actions.assert_css_property,
+                              (element, 'color', 'red'))]:
+            self.assertIs(None, actions._dom_condition(action, args, {}))
+
+    def test_script_timeout_restored(self):
+        # The element appears after several changes
+        elements = [mock.Mock(spec=webelement.WebElement)]
+        self.browser.find_elements_by_css_selector.side_effect = [
+            [], [], [], elements]
+        actions.wait_for(actions.get_element, id='foo')
+        self.assertEqual(3, self.browser.execute_async_script.call_count)
+        # Changed once for the whole wait
+        calls = self.browser.set_script_timeout.call_args_list
+        self.assertEqual([6, 30], [round(c[0][0]) for c in calls])
+
+    def test_other_conditions_poll(self):
+        results = [False, True]
+        actions.wait_for(results.pop, 0)
+        self.assertFalse(self.browser.execute_async_script.called)
+        self.sleep.assert_called_once_with(0.1)
+
+    def test_page_left_while_waiting_polls(self):
+        self.element_appears()
+        self.browser.execute_async_script.side_effect = (
+            exceptions.WebDriverException('document unloaded'))
+        actions.wait_for(actions.get_element, id='foo')
+        self.sleep.assert_called_once_with(0.1)
+
+    def test_disabled(self):
+        actions.set_wait_timeout(5, 0.1, observe_dom=False)
+        self.element_appears()
+        actions.wait_for(actions.get_element, id='foo')
+        self.assertFalse(self.browser.execute_async_script.called)
+        self.sleep.assert_called_once_with(0.1)
+
+
+class TestPollStrategies(testtools.TestCase):
+
+    def setUp(self):
+        super(TestPollStrategies, self).setUp()
+        self.addCleanup(actions._set_wait_timeout, 10, 0.1, False, 'fixed')
+        self.sleep = mock.Mock()
+        self.patch(time, 'sleep', self.sleep)
+
+    def first_delays(self, strategy, count, poll=0.1):
+        delays = actions._poll_strategies[strategy](poll)
+        return [round(next(delays), 3) for i in range(count)]
+
+    def test_fixed(self):
+        self.assertEqual([0.1] * 3, self.first_delays('fixed', 3))
+
+    def test_backoff(self):
+        self.assertEqual([0.01, 0.02, 0.04, 0.08, 0.16, 0.32, 0.64, 1, 1],
+                         self.first_delays('backoff', 9))
+
+    def test_fast_start(self):
+        delays = self.first_delays('fast_start', 12, poll=1)
+        self.assertEqual([0.1] * 10 + [1] * 2, delays)
+
+    def test_unknown_strategy(self):
+        self.assertRaises(ValueError, actions.set_wait_timeout, 10,
+                          poll_strategy='random')
+
+    def test_custom_strategy(self):
+        actions.set_wait_timeout(10, 0.5,
+                                 poll_strategy=lambda poll: [poll / 2, poll])
+        delays = actions._poll_delays(0.5)
+        # The last delay is reused once the strategy runs out of them
+        self.assertEqual([0.25, 0.5, 0.5, 0.5],
+                         [next(delays) for i in range(4)])
+
+    def test_empty_custom_strategy(self):
+        actions.set_wait_timeout(10, 0.5, poll_strategy=lambda poll: [])
+        delays = actions._poll_delays(0.5)
+        self.assertEqual([0.5, 0.5], [next(delays) for i in range(2)])
+
+    def test_no_poll(self):
+        for strategy in actions._poll_strategies:
+            self.assertEqual([0] * 3, self.first_delays(strategy, 3, poll=0))
+
+    def test_wait_for_uses_strategy(self):
+        actions.set_wait_timeout(10, 0.1, poll_strategy='backoff')
+        results = [True, False, False]
+        actions.wait_for(results.pop)
+        self.assertEqual([mock.call(0.01), mock.call(0.02)],
+                         self.sleep.call_args_list)
+
+    def test_retry_on_exception_uses_strategy(self):
+        actions.set_wait_timeout(10, 0.1, poll_strategy='backoff')
+        errors = [TestException(), TestException()]
+
+        @actions.retry_on_exception(TestException)
+        def raiser():
+            if errors:
+                raise errors.pop()
+
+        raiser()
+        self.assertEqual([mock.call(0.01), mock.call(0.02)],
+                         self.sleep.call_args_list)
+
+    def test_finite_strategy(self):
+        actions.set_wait_timeout(10, 0.1, poll_strategy=lambda poll: [poll])
+        results = [True, False, False, False]
+        actions.wait_for(results.pop)
+        self.assertEqual([mock.call(0.1)] * 3, self.sleep.call_args_list)
+
+
+class TestPageReadyCheck(testtools.TestCase):
+
+    def setUp(self):
+        super(TestPageReadyCheck, self).setUp()
+        self.browser = mock.Mock()
+        self.patch(actions, '_test', mock.Mock(browser=self.browser))
+        self.addCleanup(actions._set_page_ready_check, 'ready_state')
+        self.addCleanup(actions._set_wait_timeout, 10, 0.1)
+        actions.set_wait_timeout(1, 0.01)
+
+    def test_ready_state(self):
+        self.browser.execute_script.return_value = True
+        actions.refresh()
+        self.assertEqual(1, self.browser.execute_script.call_count)
+        self.assertFalse(self.browser.find_elements_by_css_selector.called)
+
+    def test_ready_state_while_unloading(self):
+        self.browser.execute_script.side_effect = [
+            exceptions.WebDriverException('unloaded'), False, True]
+        actions.refresh()
+        self.assertEqual(3, self.browser.execute_script.call_count)
+
+    def test_body(self):
+        actions.set_page_ready_check('body')
+        self.browser.find_elements_by_css_selector.return_value = [
+            mock.Mock(spec=webelement.WebElement)]
+        actions.refresh()
+        self.browser.find_elements_by_css_selector.assert_called_once_with(
+            'body')
+        self.assertFalse(self.browser.execute_script.called)
+
+    def test_no_check(self):
+        actions.set_page_ready_check(None)
+        actions.refresh()
+        self.assertFalse(self.browser.execute_script.called)
+        self.assertFalse(self.browser.find_elements_by_css_selector.called)
+
+    def test_unknown_check(self):
+        self.assertRaises(ValueError, actions.set_page_ready_check, 'loaded')
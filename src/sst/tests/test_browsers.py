@@ -0,0 +1,195 @@
+#
+#   Copyright (c) 2013 Canonical Ltd.
+#
+#   This file is part of: SST (selenium-simple-test)
+#   https://launchpad.net/selenium-simple-test
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+
+import mock
+import testtools
+
+from selenium.common import exceptions
+from sst import (
+    browsers,
+    cases,
+)
+
+
+class FakeBrowserFactory(browsers.BrowserFactory):
+    """A factory creating mock browsers."""
+
+    def __init__(self):
+        super(FakeBrowserFactory, self).__init__()
+        self.started = []
+
+    def pool_key(self, test):
+        return getattr(test, 'pool_key', None)
+
+    def browser(self):
+        browser = mock.Mock(name='browser-%d' % (len(self.started),))
+        browser.window_handles = ['main']
+        self.started.append(browser)
+        return browser
+
+
+class PoolTest(object):
+    """The minimal test API needed by a pool."""
+
+    def __init__(self, factory, pool_key=None):
+        self.browser_factory = factory
+        self.pool_key = pool_key
+
+
+class TestBrowserPool(testtools.TestCase):
+
+    def setUp(self):
+        super(TestBrowserPool, self).setUp()
+        self.factory = FakeBrowserFactory()
+        self.pool = browsers.BrowserPool()
+        self.addCleanup(self.pool.stop)
+
+    def test_checkout_starts_browser(self):
+        browser = self.pool.checkout(PoolTest(self.factory))
+        self.assertEqual([browser], self.factory.started)
+
+    def test_checkin_resets_browser(self):
+        test = PoolTest(self.factory)
+        browser = self.pool.checkout(test)
+        self.pool.checkin(test, browser)
+        browser.delete_all_cookies.assert_called_once_with()
+        browser.get.assert_called_once_with('about:blank')
+        self.assertFalse(browser.quit.called)
+
+    def test_checkin_closes_extra_windows(self):
+        test = PoolTest(self.factory)
+        browser = self.pool.checkout(test)
+        browser.window_handles = ['main', 'popup']
+        self.pool.checkin(test, browser)
+        browser.close.assert_called_once_with()
+        self.assertEqual([mock.call('popup'), mock.call('main')],
+                         browser.switch_to_window.call_args_list)
+
+    def test_browser_is_reused(self):
+        test = PoolTest(self.factory)
+        browser = self.pool.checkout(test)
+        self.pool.checkin(test, browser)
+        self.assertIs(browser, self.pool.checkout(PoolTest(self.factory)))
+        self.assertEqual(1, len(self.factory.started))
+
+    def test_browser_is_not_reused_for_other_key(self):
+        test = PoolTest(self.factory)
+        browser = self.pool.checkout(test)
+        self.pool.checkin(test, browser)
+        other = self.pool.checkout(PoolTest(self.factory, pool_key='trusted'))
+        self.assertIsNot(browser, other)
+        self.assertEqual(2, len(self.factory.started))
+
+    def test_broken_browser_is_discarded(self):
+        test = PoolTest(self.factory)
+        browser = self.pool.checkout(test)
+        browser.delete_all_cookies.side_effect = exceptions.WebDriverException
+        self.pool.checkin(test, browser)
+        browser.quit.assert_called_once_with()
+        self.assertEqual([], self.pool.idle)
+
+    def test_idle_browsers_are_limited(self):
+        test = PoolTest(self.factory)
+        trusted = PoolTest(self.factory, pool_key='trusted')
+        first = self.pool.checkout(test)
+        second = self.pool.checkout(trusted)
+        self.pool.checkin(test, first)
+        self.pool.checkin(trusted, second)
+        first.quit.assert_called_once_with()
+        self.assertEqual([second], [b for _, b in self.pool.idle])
+
+    def test_stop_quits_idle_browsers(self):
+        test = PoolTest(self.factory)
+        browser = self.pool.checkout(test)
+        self.pool.checkin(test, browser)
+        self.pool.stop()
+        browser.quit.assert_called_once_with()
+        self.assertEqual([], self.pool.idle)
+
+
+class TestSSTTestCaseWithPool(testtools.TestCase):
+
+    def test_browser_is_checked_out_and_in(self):
+        pool = mock.Mock(spec=browsers.BrowserPool)
+
+        class PooledBrowser(cases.SSTTestCase):
+
+            # The pool provides mock browsers
+            browser_pool = pool
+
+            def test_it(self):
+                pass
+
+        test = PooledBrowser('test_it')
+        result = testtools.TestResult()
+        test.run(result)
+        self.assertTrue(result.wasSuccessful())
+        pool.checkout.assert_called_once_with(test)
+        pool.checkin.assert_called_once_with(test, pool.checkout.return_value)
+
+
+class FailingBrowserFactory(FakeBrowserFactory):
+
+    def browser(self):
+        raise exceptions.WebDriverException('Cannot start')
+
+
+class TestPrelaunch(testtools.TestCase):
+
+    def setUp(self):
+        super(TestPrelaunch, self).setUp()
+        self.factory = FakeBrowserFactory()
+        self.addCleanup(self.factory.discard_prelaunched)
+
+    def test_nothing_prelaunched(self):
+        self.assertIsNone(
+            self.factory.take_prelaunched(PoolTest(self.factory)))
+
+    def test_take_prelaunched(self):
+        self.factory.prelaunch(PoolTest(self.factory))
+        browser = self.factory.take_prelaunched(PoolTest(self.factory))
+        self.assertEqual([browser], self.factory.started)
+        self.assertFalse(browser.quit.called)
+        # It can be taken only once
+        self.assertIsNone(
+            self.factory.take_prelaunched(PoolTest(self.factory)))
+
+    def test_other_key_discards_prelaunched(self):
+        self.factory.prelaunch(PoolTest(self.factory))
+        prelaunched = self.factory._prelaunched
+        self.assertIsNone(self.factory.take_prelaunched(
+            PoolTest(self.factory, pool_key='trusted')))
+        prelaunched.thread.join()
+        self.factory.started[0].quit.assert_called_once_with()
+
+    def test_failed_prelaunch(self):
+        factory = FailingBrowserFactory()
+        factory.prelaunch(PoolTest(factory))
+        self.assertIsNone(factory.take_prelaunched(PoolTest(factory)))
+
+    def test_discard_prelaunched(self):
+        self.factory.prelaunch(PoolTest(self.factory))
+        self.factory.prelaunch(PoolTest(self.factory))
+        self.factory.discard_prelaunched()
+        self.assertIsNone(self.factory._prelaunched)
+        # Prelaunching again discarded the first browser
+        self.assertEqual(2, len(self.factory.started))
+        for browser in self.factory.started:
+            browser.quit.assert_called_once_with()
@@ -0,0 +1,113 @@
+#
+#   Copyright (c) 2013 Canonical Ltd.
+#
+#   This file is part of: SST (selenium-simple-test)
+#   https://launchpad.net/selenium-simple-test
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+import os
+
+import testtools
+
+from sst import (
+    codecache,
+    tests,
+)
+
+
+class TestCodeCache(testtools.TestCase):
+
+    def setUp(self):
+        super(TestCodeCache, self).setUp()
+        tests.set_cwd_to_tmp(self)
+        self.write_script('RESULT = 1\n')
+
+    def write_script(self, content, mtime=None):
+        with open('script.py', 'w') as f:
+            f.write(content)
+        if mtime is not None:
+            os.utime('script.py', (mtime, mtime))
+
+    def run_code(self, code):
+        context = {}
+        exec(code, context)
+        return context['RESULT']
+
+    def test_compile(self):
+        cache = codecache.CodeCache()
+        code = cache.compile('script.py')
+        self.assertEqual(1, self.run_code(code))
+        self.assertEqual(os.path.abspath('script.py'), code.co_filename)
+
+    def test_print_function(self):
+        # Scripts have always been compiled with the print function
+        self.write_script('from StringIO import StringIO\n'
+                          'f = StringIO()\n'
+                          'print("x", file=f)\n'
+                          'RESULT = f.getvalue()\n')
+        cache = codecache.CodeCache()
+        self.assertEqual('x\n', self.run_code(cache.compile('script.py')))
+
+    def test_no_future_flags(self):
+        # The scripts run with run_test are compiled without future features
+        self.write_script('from StringIO import StringIO\n'
+                          'f = StringIO()\n'
+                          'print >>f, "x"\n'
+                          'RESULT = f.getvalue()\n')
+        cache = codecache.CodeCache()
+        self.assertEqual('x\n', self.run_code(cache.compile('script.py', 0)))
+
+    def test_compiled_once(self):
+        cache = codecache.CodeCache()
+        self.assertIs(cache.compile('script.py'), cache.compile('script.py'))
+
+    def test_modified_script_is_compiled_again(self):
+        cache = codecache.CodeCache()
+        self.write_script('RESULT = 1\n', mtime=1000)
+        cache.compile('script.py')
+        self.write_script('RESULT = 2\n', mtime=2000)
+        self.assertEqual(2, self.run_code(cache.compile('script.py')))
+
+    def test_missing_script(self):
+        cache = codecache.CodeCache()
+        self.assertRaises(IOError, cache.compile, 'missing.py')
+
+    def test_persisted_bytecode(self):
+        codecache.CodeCache('bytecode').compile('script.py')
+        self.assertEqual(1, len(os.listdir('bytecode')))
+
+        def fail(*args):
+            self.fail('The script should not be compiled again')
+        # Another process (or run) loads the bytecode instead of compiling
+        # the script
+        self.patch(codecache, 'compile', fail)
+        code = codecache.CodeCache('bytecode').compile('script.py')
+        self.assertEqual(1, self.run_code(code))
+
+    def test_outdated_bytecode(self):
+        self.write_script('RESULT = 1\n', mtime=1000)
+        codecache.CodeCache('bytecode').compile('script.py')
+        self.write_script('RESULT = 2\n', mtime=2000)
+        code = codecache.CodeCache('bytecode').compile('script.py')
+        self.assertEqual(2, self.run_code(code))
+
+    def test_invalid_bytecode(self):
+        cache = codecache.CodeCache('bytecode')
+        cache.compile('script.py')
+        with open(cache._bytecode_path(os.path.abspath('script.py'),
+                                       codecache.SCRIPT_FLAGS), 'wb') as f:
+            f.write('garbage')
+        code = codecache.CodeCache('bytecode').compile('script.py')
+        self.assertEqual(1, self.run_code(code))
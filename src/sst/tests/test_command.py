@@ -18,6 +18,7 @@
 #
 
 from cStringIO import StringIO
+import sys
 import testtools
 
 from sst import command
@@ -38,8 +39,31 @@ class TestArgParsing(testtools.TestCase):
         opts, args = self.parse_args([])
         self.assertEqual(1, opts.concurrency)
         self.assertIs(None, opts.excludes)
+        self.assertFalse(opts.reuse_browser)
+        self.assertFalse(opts.prelaunch_browser)
+        self.assertEqual(None, opts.timings_file)
+        self.assertFalse(opts.work_queue)
+        self.assertIsNone(opts.bytecode_cache)
+        self.assertIsNone(opts.data_rows)
+        self.assertIsNone(opts.discovery_index)
+        self.assertEqual(1, opts.discovery_threads)
+        self.assertFalse(opts.profile)
+        self.assertFalse(opts.trace_commands)
+        self.assertIsNone(opts.trace_file)
         self.assertEqual([], args)
 
+    def test_data_rows(self):
+        opts, args = self.parse_args(['--data-rows', '2/4'])
+        self.assertEqual('2/4', opts.data_rows)
+
+    def test_invalid_data_rows(self):
+        stderr = StringIO()
+        self.patch(sys, 'stderr', stderr)
+        e = self.assertRaises(SystemExit, self.parse_args,
+                              ['--data-rows', '5/4'])
+        self.assertEqual(2, e.code)
+        self.assertIn("Invalid data rows selector: '5/4'", stderr.getvalue())
+
     def test_single_regexp(self):
         opts, args = self.parse_args(['foo'])
         self.assertEquals(['foo'], args)
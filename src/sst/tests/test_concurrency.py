@@ -21,8 +21,13 @@
 from cStringIO import StringIO
 import os
 import signal
+import thread
+import threading
+import time
 import unittest
 
+import mock
+
 import testtools
 
 from sst import (
@@ -103,14 +108,173 @@ class TestConcurrentSuite(testtools.TestCase):
         self.assertEqual(1, len(res.unexpectedSuccesses))
 
     def test_killed(self):
-        class Killed(unittest.TestCase):
-            def test_killed(self):
-                pid = os.getpid()
-                os.kill(pid, signal.SIGKILL)
-
-        res = self.run_test_concurrently(Killed('test_killed'), False)
+        res = self.run_test_concurrently(get_killed_case(), False)
         self.assertEqual(1, len(res.errors))
         self.assertEqual(0, len(res.failures))
+        test, error = res.errors[0]
+        self.assertEqual('sst.tests.test_concurrency.Killed.test_killed',
+                         test.id())
+        self.assertIn('killed by signal %d while running this test'
+                      % (signal.SIGKILL,), error)
+
+
+def get_killed_case():
+    # Define the class in a function so test loading don't try to load it as a
+    # regular test class (it would kill the test runner).
+
+    class Killed(unittest.TestCase):
+
+        def test_killed(self):
+            os.kill(os.getpid(), signal.SIGKILL)
+    return Killed('test_killed')
+
+
+class TestWorkerCrash(testtools.TestCase):
+
+    def run_crashing(self, make_tests, cleanup_worker=None):
+        suite = unittest.TestSuite([tests.get_case('pass'),
+                                    get_killed_case(),
+                                    tests.get_case('pass'),
+                                    tests.get_case('pass')])
+        res = results.TextTestResult(StringIO(), verbosity=0)
+        concurrent_suite = testtools.ConcurrentTestSuite(
+            suite, make_tests(1, cleanup_worker))
+        res.startTestRun()
+        concurrent_suite.run(res)
+        res.stopTestRun()
+        return res
+
+    def assertRemainingTestsRun(self, res):
+        self.assertEqual(4, res.testsRun)
+        self.assertEqual(1, len(res.errors))
+        self.assertEqual('sst.tests.test_concurrency.Killed.test_killed',
+                         res.errors[0][0].id())
+
+    def test_tests_redispatched(self):
+        res = self.run_crashing(concurrency.fork_for_tests)
+        self.assertRemainingTestsRun(res)
+
+    def test_queued_tests_redispatched(self):
+        res = self.run_crashing(concurrency.fork_for_queue)
+        self.assertRemainingTestsRun(res)
+
+    def test_crash_outside_test(self):
+        suite = unittest.TestSuite([tests.get_case('pass')])
+        res = results.TextTestResult(StringIO(), verbosity=0)
+        concurrent_suite = testtools.ConcurrentTestSuite(
+            suite, concurrency.fork_for_tests(1, lambda: os._exit(3)))
+        res.startTestRun()
+        concurrent_suite.run(res)
+        res.stopTestRun()
+        self.assertEqual(2, res.testsRun)
+        self.assertEqual(1, len(res.errors))
+        test, error = res.errors[0]
+        self.assertTrue(test.id().startswith('worker-'))
+        self.assertIn('exited with status 3', error)
+
+
+class TestQueuedSuite(testtools.TestCase):
+
+    def run_queued(self, suite, concurrency_num, failfast=False):
+        res = results.TextTestResult(StringIO(), failfast=failfast,
+                                     verbosity=0)
+        concurrent_suite = testtools.ConcurrentTestSuite(
+            suite, concurrency.fork_for_queue(concurrency_num))
+        res.startTestRun()
+        concurrent_suite.run(res)
+        res.stopTestRun()
+        return res
+
+    def test_all_tests_run(self):
+        suite = unittest.TestSuite(
+            [tests.get_case('pass') for i in range(5)])
+        suite.addTest(tests.get_case('fail'))
+        res = self.run_queued(suite, 2)
+        self.assertEqual(6, res.testsRun)
+        self.assertEqual(1, len(res.failures))
+
+    def test_more_workers_than_tests(self):
+        res = self.run_queued(unittest.TestSuite([tests.get_case('pass')]), 3)
+        self.assertEqual(1, res.testsRun)
+        self.assertTrue(res.wasSuccessful())
+
+    def test_failfast_stops_dispatching(self):
+        suite = unittest.TestSuite([tests.get_case('fail')])
+        suite.addTests([tests.get_case('pass') for i in range(3)])
+        res = self.run_queued(suite, 1, failfast=True)
+        self.assertEqual(1, res.testsRun)
+        self.assertEqual(1, len(res.failures))
+
+
+class TestTestQueue(testtools.TestCase):
+
+    def test_suite_order(self):
+        queue = concurrency.TestQueue(['a', 'b', 'c'])
+        self.assertEqual([0, 1, 2, None],
+                         [queue.next_test() for i in range(4)])
+
+    def test_longest_first(self):
+        durations = dict(a=1, b=5, c=3)
+        queue = concurrency.TestQueue(['a', 'b', 'c'], durations.get)
+        self.assertEqual([1, 2, 0, None],
+                         [queue.next_test() for i in range(4)])
+
+    def test_stop(self):
+        queue = concurrency.TestQueue(['a', 'b'])
+        queue.next_test()
+        queue.stop()
+        self.assertIsNone(queue.next_test())
+
+    def test_terminating(self):
+        queue = concurrency.TestQueue(['a', 'b'])
+        self.addCleanup(concurrency._terminating.clear)
+        concurrency.terminate_workers()
+        self.assertIsNone(queue.next_test())
+
+
+def get_sleeping_case():
+
+    class Sleeping(unittest.TestCase):
+
+        def test_sleeping(self):
+            time.sleep(30)
+    return Sleeping('test_sleeping')
+
+
+class TestRunSuite(testtools.TestCase):
+
+    def run_interrupted(self, make_tests):
+        suite = unittest.TestSuite([get_sleeping_case() for i in range(4)])
+        res = results.TextTestResult(StringIO(), verbosity=0)
+        concurrent_suite = testtools.ConcurrentTestSuite(
+            suite, make_tests(2))
+        # Simulate a ^C while the workers are running their first test
+        timer = threading.Timer(0.5, thread.interrupt_main)
+        timer.start()
+        self.addCleanup(timer.cancel)
+        start = time.time()
+        res.startTestRun()
+        self.assertRaises(KeyboardInterrupt, concurrency.run_suite,
+                          concurrent_suite, res)
+        res.stopTestRun()
+        # The workers were stopped, not respawned
+        self.assertLess(time.time() - start, 10)
+        self.assertEqual(2, res.testsRun)
+        self.assertEqual(2, len(res.errors))
+        self.assertIn('killed by signal %d' % (signal.SIGTERM,),
+                      res.errors[0][1])
+
+    def test_interrupted(self):
+        self.run_interrupted(concurrency.fork_for_tests)
+
+    def test_interrupted_queue(self):
+        self.run_interrupted(concurrency.fork_for_queue)
+
+    def test_errors_are_raised(self):
+        suite = mock.Mock()
+        suite.run.side_effect = RuntimeError('Broken')
+        self.assertRaises(RuntimeError, concurrency.run_suite, suite,
+                          testtools.TestResult())
 
 
 class TestConcurrentRunTests(tests.ImportingLocalFilesTest):
@@ -177,6 +341,34 @@ class TestFail2(unittest.TestCase):
         self.assertEqual(output.count('Traceback (most recent call last):'), 2)
         self.assertIn('FAILED (failures=2)', output)
 
+    def test_work_queue(self):
+        tests.write_tree_from_desc('''dir: t
+file: t/__init__.py
+from sst import loaders
+discover = loaders.discoverRegularTests
+
+file: t/test_queue.py
+import unittest
+class Test(unittest.TestCase):
+    def test_pass_1(self):
+        self.assertTrue(True)
+    def test_pass_2(self):
+        self.assertTrue(True)
+    def test_pass_3(self):
+        self.assertTrue(True)
+''')
+
+        out = StringIO()
+        runtests.runtests(
+            ['^t'], 'no results directory used', out,
+            concurrency_num=2,
+            browser_factory=browsers.FirefoxFactory(),
+            work_queue=True,
+        )
+        output = out.getvalue()
+        self.assertIn('Ran 3 tests', output)
+        self.assertIn('OK', output)
+
 
 class PartitionTestCase(testtools.TestCase):
 
@@ -209,3 +401,73 @@ class PartitionTestCase(testtools.TestCase):
         self.assertEqual(3, len(parted_tests[0]))
         self.assertEqual(3, len(parted_tests[1]))
         self.assertEqual(2, len(parted_tests[2]))
+
+
+class PartitionByDurationTestCase(testtools.TestCase):
+
+    def partition(self, durations, count):
+        suite = unittest.TestSuite()
+        for duration in durations:
+            test = tests.get_case('pass')
+            test.duration = duration
+            suite.addTest(test)
+        parted_tests = concurrency.partition_tests(
+            suite, count, lambda test: test.duration)
+        return [[t.duration for t in part] for part in parted_tests]
+
+    def test_slow_tests_are_split(self):
+        self.assertEqual([[10, 1], [10, 1]],
+                         self.partition([10, 10, 1, 1], 2))
+
+    def test_long_tests_are_balanced(self):
+        self.assertEqual([[8, 1], [5, 3, 1], [4, 3, 3]],
+                         self.partition([8, 5, 4, 3, 3, 3, 1, 1], 3))
+
+    def test_tests_keep_their_order(self):
+        self.assertEqual([[10], [1, 2, 3, 4]],
+                         self.partition([1, 2, 3, 10, 4], 2))
+
+    def test_same_durations_are_round_robin(self):
+        self.assertEqual([[1, 1, 1], [1, 1], [1, 1]],
+                         self.partition([1] * 7, 3))
+
+
+class TestCleanupWorker(tests.ImportingLocalFilesTest):
+
+    def test_cleanup_called_in_each_worker(self):
+        suite = unittest.TestSuite([tests.get_case('pass')])
+
+        def cleanup_worker():
+            with open('cleanups', 'a') as f:
+                f.write('%d\n' % (os.getpid(),))
+
+        concurrent_suite = testtools.ConcurrentTestSuite(
+            suite, concurrency.fork_for_tests(2, cleanup_worker))
+        res = results.TextTestResult(StringIO(), verbosity=0)
+        concurrent_suite.run(res)
+        self.assertTrue(res.wasSuccessful())
+        with open('cleanups') as f:
+            pids = f.read().splitlines()
+        # Each worker cleaned up, even the one without tests
+        self.assertEqual(2, len(set(pids)))
+        self.assertNotIn(str(os.getpid()), pids)
+
+
+class TestSetupWorker(tests.ImportingLocalFilesTest):
+
+    def test_setup_called_in_each_worker(self):
+        suite = unittest.TestSuite([tests.get_case('pass')])
+
+        def setup_worker():
+            with open('setups', 'a') as f:
+                f.write('%d\n' % (os.getpid(),))
+
+        concurrent_suite = testtools.ConcurrentTestSuite(
+            suite, concurrency.fork_for_queue(2, setup_worker=setup_worker))
+        res = results.TextTestResult(StringIO(), verbosity=0)
+        concurrent_suite.run(res)
+        self.assertTrue(res.wasSuccessful())
+        with open('setups') as f:
+            pids = f.read().splitlines()
+        self.assertEqual(2, len(set(pids)))
+        self.assertNotIn(str(os.getpid()), pids)
@@ -38,9 +38,12 @@ below therefore use 't' as the main directory because:
 - it's unlikely to be imported by the module.
 
 """
+import os
+
 import testtools
 
 from sst import (
+    cases,
     loaders,
     tests,
 )
@@ -351,6 +354,22 @@ file: foo.csv
         suite = self.discover('.')
         self.assertEqual(2, suite.countTestCases())
 
+    def test_simple_script_with_selected_csv_rows(self):
+        tests.write_tree_from_desc('''file: foo.py
+pass
+file: foo.csv
+'foo'^'bar'
+1^baz
+2^qux
+3^quux
+''')
+        test_loader = loaders.SSTestLoader(
+            row_selector=cases.get_row_selector('2/2'))
+        suite = test_loader.discoverTestsFromTree('.')
+        self.assertEqual(1, suite.countTestCases())
+        test = list(testtools.testsuite.iterate_tests(suite))[0]
+        self.assertEqual(2, test.data_row.row_num)
+
     def test_simple_script_in_a_dir(self):
         tests.write_tree_from_desc('''dir: t
 # no t/__init__.py required, we don't need to import the scripts
@@ -434,3 +453,147 @@ _hidden_too.py
                           'tests.test_real1.Test_test_real1.test_test_real1',
                           'tests.test_real2.Test_test_real2.test_test_real2'],
                          [t.id() for t in testtools.iterate_tests(suite)])
+
+
+class TestDiscoveryIndex(testtools.TestCase):
+
+    def setUp(self):
+        super(TestDiscoveryIndex, self).setUp()
+        tests.set_cwd_to_tmp(self)
+        tests.write_tree_from_desc('''dir: t
+file: t/foo.py
+pass
+file: t/foo.csv
+'bar'
+1
+2
+dir: t/sub
+file: t/sub/baz.py
+pass
+''')
+        self.set_mtime('t', 1000)
+        self.set_mtime('t/sub', 1000)
+
+    def set_mtime(self, path, mtime):
+        os.utime(path, (mtime, mtime))
+
+    def discover(self, index):
+        test_loader = loaders.SSTestLoader(discovery_index=index)
+        suite = test_loader.discoverTestsFromTree('t')
+        return [t.id() for t in testtools.testsuite.iterate_tests(suite)]
+
+    def saved_index(self):
+        index = loaders.DiscoveryIndex('index.json')
+        index.load()
+        return index
+
+    def test_list_directory(self):
+        index = loaders.DiscoveryIndex()
+        self.assertEqual({'foo.py': 'file', 'foo.csv': 'file', 'sub': 'dir'},
+                         index.list_directory('t'))
+
+    def test_same_tests_discovered(self):
+        ids = self.discover(None)
+        self.assertEqual(['t.foo', 't.foo', 't.sub.baz'], ids)
+        self.assertEqual(ids, self.discover(loaders.DiscoveryIndex()))
+
+    def test_index_is_reused(self):
+        first = loaders.DiscoveryIndex('index.json')
+        self.discover(first)
+        first.save()
+        self.assertEqual((0, 3), (first.hits, first.misses))
+        index = self.saved_index()
+        self.assertEqual(['t.foo', 't.foo', 't.sub.baz'],
+                         self.discover(index))
+        self.assertEqual((3, 0), (index.hits, index.misses))
+
+    def test_modified_directory_is_listed_again(self):
+        index = loaders.DiscoveryIndex('index.json')
+        self.discover(index)
+        index.save()
+        tests.write_tree_from_desc('''file: t/sub/qux.py
+pass
+''')
+        self.set_mtime('t/sub', 2000)
+        index = self.saved_index()
+        self.assertEqual(['t.foo', 't.foo', 't.sub.baz', 't.sub.qux'],
+                         self.discover(index))
+        self.assertEqual((2, 1), (index.hits, index.misses))
+
+    def test_modified_data_file_is_scanned_again(self):
+        index = loaders.DiscoveryIndex('index.json')
+        self.discover(index)
+        index.save()
+        with open('t/foo.csv', 'a') as f:
+            f.write('3\n')
+        index = self.saved_index()
+        self.assertEqual(['t.foo', 't.foo', 't.foo', 't.sub.baz'],
+                         self.discover(index))
+
+    def test_invalid_index(self):
+        with open('index.json', 'w') as f:
+            f.write('garbage')
+        index = self.saved_index()
+        self.assertEqual({}, index.directories)
+
+
+class TestPrefetchTree(testtools.TestCase):
+
+    def setUp(self):
+        super(TestPrefetchTree, self).setUp()
+        tests.set_cwd_to_tmp(self)
+        tests.write_tree_from_desc('''dir: t
+file: t/foo.py
+pass
+file: t/foo.csv
+'bar'
+1
+dir: t/a
+file: t/a/one.py
+pass
+dir: t/a/deep
+file: t/a/deep/two.py
+pass
+dir: t/b
+file: t/b/three.py
+pass
+dir: t/_private
+file: t/_private/hidden.py
+pass
+''')
+
+    def test_prefetch_tree(self):
+        listings = loaders.prefetch_tree('t', threads=3)
+        self.assertEqual(
+            sorted(os.path.abspath(p) for p in
+                   ('t', 't/a', 't/a/deep', 't/b', 't/_private')),
+            sorted(listings))
+        self.assertEqual({'one.py': 'file', 'deep': 'dir'},
+                         listings[os.path.abspath('t/a')])
+
+    def test_dir_matcher(self):
+        listings = loaders.prefetch_tree(
+            't', dir_matcher=loaders.NameMatcher(includes=['^a$']))
+        self.assertEqual(sorted([os.path.abspath('t'),
+                                 os.path.abspath('t/a')]),
+                         sorted(listings))
+
+    def discover(self, prefetch):
+        test_loader = loaders.SSTestLoader()
+        if prefetch:
+            test_loader.prefetchTree('t', threads=3)
+        suite = test_loader.discoverTestsFromTree('t')
+        return [t.id() for t in testtools.testsuite.iterate_tests(suite)]
+
+    def test_same_order(self):
+        expected = ['t.a.deep.two', 't.a.one', 't.b.three', 't.foo']
+        self.assertEqual(expected, self.discover(False))
+        self.assertEqual(expected, self.discover(True))
+
+    def test_prefetched_entries_are_used(self):
+        test_loader = loaders.SSTestLoader()
+        test_loader.prefetchTree('t')
+        self.patch(loaders, 'list_directory', None)
+        self.patch(os, 'listdir', None)
+        suite = test_loader.discoverTestsFromTree('t')
+        self.assertEqual(4, suite.countTestCases())
@@ -0,0 +1,205 @@
+#
+#   Copyright (c) 2013 Canonical Ltd.
+#
+#   This file is part of: SST (selenium-simple-test)
+#   https://launchpad.net/selenium-simple-test
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+from cStringIO import StringIO
+import json
+import time
+
+import mock
+import testtools
+from testtools import content
+from testtools.testresult import doubles
+
+from selenium.webdriver.remote import webdriver
+from sst import (
+    actions,
+    browsers,
+    cases,
+    profiling,
+    tests,
+)
+
+
+class FakeDriver(webdriver.WebDriver):
+    """A WebDriver not talking to any browser."""
+
+    def __init__(self):
+        pass
+
+
+class TestActionProfiler(testtools.TestCase):
+
+    def test_outermost_action_only(self):
+        profiler = profiling.ActionProfiler()
+
+        def inner():
+            profiler.command()
+            profiler.poll()
+
+        def outer():
+            profiler.command()
+            profiler.action('inner', inner, (), {})
+            profiler.command()
+        profiler.action('outer', outer, (), {})
+        self.assertEqual(['outer'], profiler.stats.keys())
+        stats = profiler.stats['outer']
+        self.assertEqual((1, 3, 1),
+                         (stats['calls'], stats['commands'], stats['polls']))
+
+    def test_outside_actions(self):
+        profiler = profiling.ActionProfiler()
+        profiler.command()
+        profiler.poll()
+        self.assertEqual({}, profiler.stats)
+
+    def test_calls_are_added(self):
+        profiler = profiling.ActionProfiler()
+        profiler.action('foo', lambda: None, (), {})
+        profiler.action('foo', lambda: None, (), {})
+        self.assertEqual(2, profiler.stats['foo']['calls'])
+
+    def test_failing_action(self):
+        profiler = profiling.ActionProfiler()
+        self.assertRaises(AssertionError, profiler.action, 'fail',
+                          actions._raise, ('failed',), {})
+        self.assertEqual(1, profiler.stats['fail']['calls'])
+        self.assertEqual(0, profiler.depth)
+
+
+class TestProfiledActions(testtools.TestCase):
+
+    def setUp(self):
+        super(TestProfiledActions, self).setUp()
+        self.patch(webdriver.WebDriver, 'execute',
+                   lambda driver, command, params=None: {'value': None})
+        self.patch(actions, '_test', mock.Mock(browser=FakeDriver()))
+        self.original_get_element = actions.get_element
+        profiling.enable()
+        self.addCleanup(profiling.disable)
+
+    def test_actions_are_not_rebound(self):
+        # Modules that imported the actions before profiling was enabled
+        # are profiled too
+        self.assertIs(self.original_get_element, actions.get_element)
+        self.assertTrue(hasattr(actions.get_element, '__wrapped__'))
+        # Not a useful action to profile
+        self.assertFalse(hasattr(actions.run_test, '__wrapped__'))
+
+    def test_dom_condition(self):
+        # wait_for still recognizes the actions it can observe
+        self.assertEqual(('css', '#foo'),
+                         actions._dom_condition(actions.get_element, (),
+                                                {'id': 'foo'}))
+
+    def test_disabled(self):
+        profiling.disable()
+        actions.execute_script('return 1')
+        self.assertEqual({}, profiling.get_test_profile())
+
+    def test_commands_are_counted(self):
+        actions.execute_script('return 1')
+        actions.execute_script('return 2')
+        stats = profiling.get_test_profile()['execute_script']
+        self.assertEqual((2, 2), (stats['calls'], stats['commands']))
+
+    def test_polls_are_counted(self):
+        self.patch(time, 'sleep', lambda delay: None)
+        calls = []
+
+        def condition():
+            calls.append(None)
+            return len(calls) == 3
+        actions.wait_for(condition)
+        stats = profiling.get_test_profile()['wait_for']
+        self.assertEqual((1, 2), (stats['calls'], stats['polls']))
+
+    def test_start_test(self):
+        actions.execute_script('return 1')
+        profiling.start_test()
+        self.assertEqual({}, profiling.get_test_profile())
+
+
+class TestProfiledTestCase(testtools.TestCase):
+
+    def test_profile_detail(self):
+        profiling.enable()
+        self.addCleanup(profiling.disable)
+
+        class Profiled(cases.SSTTestCase):
+
+            browser_pool = mock.Mock(spec=browsers.BrowserPool)
+
+            def test_it(self):
+                actions.sleep(0)
+
+        result = doubles.ExtendedTestResult()
+        Profiled('test_it').run(result)
+        outcome, test, details = result._events[1]
+        self.assertEqual('addSuccess', outcome)
+        stats = json.loads(
+            ''.join(details[profiling.DETAIL_NAME].iter_bytes()))
+        self.assertEqual(1, stats['sleep']['calls'])
+
+
+class TestProfileResult(testtools.TestCase):
+
+    def setUp(self):
+        super(TestProfileResult, self).setUp()
+        tests.set_cwd_to_tmp(self)
+
+    def add_success(self, result, test_id, stats):
+        test = mock.Mock()
+        test.id.return_value = test_id
+        result.startTest(test)
+        result.addSuccess(test, details={
+            profiling.DETAIL_NAME: content.json_content(stats)})
+        result.stopTest(test)
+
+    def test_aggregate(self):
+        out = StringIO()
+        result = profiling.ProfileResult('results/profile.json', out, top=1)
+        result.startTestRun()
+        self.add_success(result, 't.foo', {
+            'go_to': dict(calls=1, time=2.0, commands=3, polls=0),
+            'click_button': dict(calls=2, time=1.0, commands=4, polls=1)})
+        self.add_success(result, 't.bar', {
+            'click_button': dict(calls=1, time=0.5, commands=2, polls=0)})
+        result.stopTestRun()
+        with open('results/profile.json') as f:
+            profile = json.load(f)
+        self.assertEqual(dict(calls=3, time=1.5, commands=6, polls=1),
+                         profile['actions']['click_button'])
+        self.assertEqual(['t.bar', 't.foo'], sorted(profile['tests']))
+        self.assertEqual(dict(calls=1, time=2.0, commands=3, polls=0),
+                         profile['tests']['t.foo']['go_to'])
+        summary = out.getvalue()
+        self.assertIn('Top 1 actions', summary)
+        self.assertIn('go_to', summary)
+        self.assertNotIn('click_button', summary)
+
+    def test_no_profile(self):
+        result = profiling.ProfileResult('profile.json')
+        result.startTestRun()
+        test = mock.Mock()
+        result.startTest(test)
+        result.addSuccess(test)
+        result.stopTest(test)
+        result.stopTestRun()
+        with open('profile.json') as f:
+            self.assertEqual({'actions': {}, 'tests': {}}, json.load(f))
@@ -19,10 +19,12 @@
 
 
 from cStringIO import StringIO
+from xml.dom import minidom
+import json
 
-import junitxml
 import subunit
 import testtools
+from testtools import content
 
 from sst import (
     results,
@@ -140,11 +142,11 @@ class TestXmlOutput(testtools.TestCase):
             some tests to add more keywords when they are test specific.
         """
         out = StringIO()
-        res = junitxml.JUnitXmlResult(out)
+        res = results.JUnitXmlResult(out)
         # We don't care about timing here so we always return 0 which
         # simplifies matching the expected result
-        res._now = lambda: 0.0
-        res._duration = lambda f: 0.0
+        res.decorated._now = lambda: 0.0
+        res.decorated._duration = lambda f: 0.0
         test = tests.get_case(kind)
         res.startTestRun()
         test.run(res)
@@ -152,7 +154,7 @@ class TestXmlOutput(testtools.TestCase):
         # the stream until stopTestRun() is called.
         res.stopTestRun()
         expected = tests.expand_template_for_test(template, test, kwargs)
-        self.assertEquals(expected, res._stream.getvalue())
+        self.assertEquals(expected, out.getvalue())
 
     def test_pass(self):
         expected = '''\
@@ -232,6 +234,22 @@ SyntaxError: None
 '''
         self.assertOutput(expected, 'unexpected_success')
 
+    def test_escaped_failure(self):
+
+        class Test(testtools.TestCase):
+
+            def test_fail(self):
+                self.fail(u'caf\xe9 < ]]> \x1b')
+
+        out = StringIO()
+        res = results.JUnitXmlResult(out)
+        res.startTestRun()
+        Test('test_fail').run(res)
+        res.stopTestRun()
+        failure = minidom.parseString(out.getvalue()).getElementsByTagName(
+            'failure')[0]
+        self.assertIn(u'caf\xe9 < ]]> \n', failure.firstChild.data)
+
 
 class TestSubunitOutput(testtools.TestCase):
     """Test subunit output stream."""
@@ -404,11 +422,11 @@ class TestSubunitInputStreamXmlOutput(TestXmlOutput):
         # Inject it again (what controlling process consumes)
         receiver = subunit.ProtocolTestCase(StringIO(stream.getvalue()))
         out = StringIO()
-        res = junitxml.JUnitXmlResult(out)
+        res = results.JUnitXmlResult(out)
         # We don't care about timing here so we always return 0 which
         # simplifies matching the expected result
-        res._now = lambda: 0.0
-        res._duration = lambda f: 0.0
+        res.decorated._now = lambda: 0.0
+        res.decorated._duration = lambda f: 0.0
         expected = tests.expand_template_for_test(template, test, kwargs)
         res.startTestRun()
         receiver.run(res)
@@ -416,3 +434,230 @@ class TestSubunitInputStreamXmlOutput(TestXmlOutput):
         # the stream until stopTestRun() is called.
         res.stopTestRun()
         self.assertEquals(expected, out.getvalue())
+
+
+def get_timed_case(fail=False):
+    # Define the class in a function so test loading don't try to load it as a
+    # regular test class.
+
+    class Timed(testtools.TestCase):
+
+        def test_timed(self):
+            self.addDetail(results.PHASES_DETAIL_NAME,
+                           content.json_content(dict(body=1.25, setup=0.5)))
+            if fail:
+                self.fail('Boom')
+
+    return Timed('test_timed')
+
+
+class TestPhaseTimingsOutput(testtools.TestCase):
+
+    def test_get_phase_timings(self):
+        details = {results.PHASES_DETAIL_NAME: content.json_content(
+            dict(cleanup=0.25, body=1.0, browser_start=2.0))}
+        self.assertEqual(
+            [('browser_start', 2.0), ('body', 1.0), ('cleanup', 0.25)],
+            results.get_phase_timings(details))
+
+    def test_no_phase_timings(self):
+        self.assertEqual([], results.get_phase_timings(None))
+        self.assertEqual([], results.get_phase_timings({}))
+
+    def test_verbose_output(self):
+        out = StringIO()
+        res = results.TextTestResult(out, verbosity=2)
+        res._delta_to_float = lambda atime: 0.0
+        test = get_timed_case()
+        test.run(res)
+        self.assertEqual(
+            '%s ... OK (0.000 secs: setup 0.500, body 1.250)\n' % (test,),
+            out.getvalue())
+
+    def test_totals(self):
+        out = StringIO()
+        res = results.TextTestResult(out)
+        res.startTestRun()
+        get_timed_case().run(res)
+        get_timed_case().run(res)
+        res.stopTestRun()
+        self.assertIn('Time spent per phase: setup 1.000, body 2.500\n',
+                      out.getvalue())
+
+    def test_xml_properties(self):
+        out = StringIO()
+        res = results.JUnitXmlResult(out)
+        res.decorated._duration = lambda start: 0.0
+        test = get_timed_case()
+        res.startTestRun()
+        test.run(res)
+        res.stopTestRun()
+        expected = tests.expand_template_for_test('''\
+<testsuite errors="0" failures="0" name="" tests="1" time="0.000">
+<testcase classname="{classname}" name="{name}" time="0.000">
+<properties>
+<property name="phase.setup" value="0.500"/>
+<property name="phase.body" value="1.250"/>
+</properties>
+</testcase>
+</testsuite>
+''', test)
+        self.assertEqual(expected, out.getvalue())
+
+
+class TestInternalDetails(testtools.TestCase):
+
+    def test_text_failure(self):
+        out = StringIO()
+        res = results.TextTestResult(out)
+        res.startTestRun()
+        get_timed_case(fail=True).run(res)
+        res.stopTestRun()
+        self.assertIn('Boom', out.getvalue())
+        self.assertNotIn(results.PHASES_DETAIL_NAME, out.getvalue())
+
+    def test_xml_failure(self):
+        out = StringIO()
+        res = results.JUnitXmlResult(out)
+        res.startTestRun()
+        get_timed_case(fail=True).run(res)
+        res.stopTestRun()
+        self.assertEqual(1, len(res.failures))
+        self.assertFalse(res.wasSuccessful())
+        self.assertIn('<property name="phase.body" value="1.250"/>',
+                      out.getvalue())
+        self.assertIn('Boom', out.getvalue())
+        self.assertNotIn(results.PHASES_DETAIL_NAME, out.getvalue())
+
+    def test_filter(self):
+        details = {results.PHASES_DETAIL_NAME: content.text_content('1'),
+                   'traceback': content.text_content('2')}
+        self.assertEqual(['traceback'],
+                         results.filter_internal_details(details).keys())
+
+
+class TestStreamingXmlOutput(testtools.TestCase):
+
+    def setUp(self):
+        super(TestStreamingXmlOutput, self).setUp()
+        tests.set_cwd_to_tmp(self)
+        self.stream = open('results.xml', 'wb')
+        self.addCleanup(self.stream.close)
+
+    def parse(self):
+        """Parse the report as written on disk so far."""
+        doc = minidom.parse('results.xml')
+        testsuite = doc.documentElement
+        return (testsuite.getAttribute('tests'),
+                testsuite.getAttribute('failures'),
+                [t.getAttribute('name')
+                 for t in doc.getElementsByTagName('testcase')])
+
+    def test_valid_after_each_test(self):
+        res = results.StreamingJUnitXmlResult(self.stream, flush_interval=0)
+        res.startTestRun()
+        self.assertEqual(('0', '0', []), self.parse())
+        tests.get_case('pass').run(res)
+        self.assertEqual(('1', '0', ['test_pass']), self.parse())
+        tests.get_case('fail').run(res)
+        self.assertEqual(('2', '1', ['test_pass', 'test_fail']),
+                         self.parse())
+        res.stopTestRun()
+        self.assertEqual(('2', '1', ['test_pass', 'test_fail']),
+                         self.parse())
+
+    def test_periodic_flush(self):
+        res = results.StreamingJUnitXmlResult(self.stream,
+                                              flush_interval=3600)
+        res.startTestRun()
+        tests.get_case('pass').run(res)
+        # Not written yet but the report is still valid
+        self.assertEqual(('0', '0', []), self.parse())
+        res.flush()
+        self.assertEqual(('1', '0', ['test_pass']), self.parse())
+        res.stopTestRun()
+        self.assertEqual(('1', '0', ['test_pass']), self.parse())
+
+    def test_outcomes(self):
+        res = results.StreamingJUnitXmlResult(self.stream, flush_interval=0)
+        res.startTestRun()
+        tests.get_case('error').run(res)
+        res.stopTestRun()
+        self.assertEqual(1, len(res.errors))
+        self.assertFalse(res.wasSuccessful())
+
+    def test_failure_texts_not_kept(self):
+
+        class Test(testtools.TestCase):
+
+            def test_fail(self):
+                self.fail('x' * 100000)
+
+        res = results.StreamingJUnitXmlResult(self.stream,
+                                              flush_interval=3600)
+        res.startTestRun()
+        for _ in range(5):
+            Test('test_fail').run(res)
+        res.stopTestRun()
+        # Only the counts are kept, the texts are on disk
+        self.assertEqual([(None, None)] * 5, res.failures)
+        self.assertFalse(res.wasSuccessful())
+        self.assertEqual(('5', '5', ['test_fail'] * 5), self.parse())
+        with open('results.xml') as f:
+            self.assertEqual(5, f.read().count('x' * 100000))
+
+
+class TestJsonLinesOutput(testtools.TestCase):
+
+    def run_case(self, test):
+        out = StringIO()
+        res = results.JsonLinesResult(out)
+        res.startTestRun()
+        test.run(res)
+        res.stopTestRun()
+        return [json.loads(line) for line in out.getvalue().splitlines()]
+
+    def test_pass(self):
+        test = tests.get_case('pass')
+        events = self.run_case(test)
+        self.assertEqual(['startTestRun', 'startTest', 'stopTest',
+                          'stopTestRun'],
+                         [e['event'] for e in events])
+        stop = events[2]
+        self.assertEqual((test.id(), 'success'), (stop['id'], stop['status']))
+        self.assertEqual(dict(success=1), events[3]['counts'])
+        self.assertEqual(1, events[3]['tests'])
+
+    def test_fail(self):
+        stop = self.run_case(tests.get_case('fail'))[2]
+        self.assertEqual('failure', stop['status'])
+        self.assertIn('AssertionError', stop['details']['traceback'])
+
+    def test_skip_reason(self):
+        stop = self.run_case(tests.get_case('skip_reason'))[2]
+        self.assertEqual('skip', stop['status'])
+        self.assertEqual('Because', stop['details']['reason'])
+
+    def test_json_details(self):
+        stop = self.run_case(get_timed_case())[2]
+        self.assertEqual(dict(setup=0.5, body=1.25),
+                         stop['details'][results.PHASES_DETAIL_NAME])
+
+
+class TestSubunitResult(testtools.TestCase):
+
+    def test_events(self):
+        out = StringIO()
+        res = results.get_subunit_result(out)
+        res.startTestRun()
+        tests.get_case('pass').run(res)
+        tests.get_case('fail').run(res)
+        res.stopTestRun()
+        summary = testtools.StreamSummary()
+        summary.startTestRun()
+        subunit.ByteStreamToStreamResult(StringIO(out.getvalue())).run(
+            summary)
+        summary.stopTestRun()
+        self.assertEqual(2, summary.testsRun)
+        # Subunit v2 doesn't distinguish errors from failures
+        self.assertEqual(1, len(summary.errors))
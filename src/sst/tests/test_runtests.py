@@ -18,6 +18,11 @@
 #
 
 from cStringIO import StringIO
+from xml.dom import minidom
+import json
+import os
+import signal
+import time
 
 import testtools
 
@@ -25,6 +30,7 @@ from sst import (
     browsers,
     runtests,
     tests,
+    xvfbdisplay,
 )
 
 
@@ -78,6 +84,18 @@ Don't look at me !
         self.assertEqual(['t.test_foo'],
                          self.run_tests(['t.t'], excludes=['to']))
 
+    def test_discovery_index(self):
+        self.assertEqual(['t.bar', 't.test_foo', 't.too'],
+                         self.run_tests(None, discovery_index_file='index'))
+        self.assertTrue(os.path.isfile('index'))
+        # The next run reuses the index
+        self.assertEqual(['t.bar', 't.test_foo', 't.too'],
+                         self.run_tests(None, discovery_index_file='index'))
+
+    def test_discovery_threads(self):
+        self.assertEqual(['t.bar', 't.test_foo', 't.too'],
+                         self.run_tests(None, discovery_threads=4))
+
 
 class TestRunBrowserFactory(testtools.TestCase):
 
@@ -187,3 +205,187 @@ class TestMultiFail(unittest.TestCase):
     def test_multi_fail_for_xml(self):
         self.assertEqual(2,
             self.run_tests(['test_fail_.*'], report_format='xml'))
+
+
+class TestRunTestsEventStreams(tests.ImportingLocalFilesTest):
+
+    def setUp(self):
+        super(TestRunTestsEventStreams, self).setUp()
+        tests.write_tree_from_desc('''dir: t
+file: t/__init__.py
+from sst import loaders
+discover = loaders.discoverRegularTests
+
+file: t/test_pass.py
+import unittest
+class TestPass(unittest.TestCase):
+    def test_pass(self):
+        pass
+''')
+
+    def run_tests(self, report_format):
+        runtests.runtests(None, '.', StringIO(), test_dir='t',
+                          browser_factory=browsers.FirefoxFactory(),
+                          report_format=report_format)
+
+    def test_jsonl(self):
+        self.run_tests('jsonl')
+        with open('results.jsonl') as f:
+            events = [json.loads(line) for line in f]
+        self.assertEqual('stopTestRun', events[-1]['event'])
+        self.assertEqual(dict(success=1), events[-1]['counts'])
+
+    def test_subunit(self):
+        self.run_tests('subunit')
+        self.assertGreater(os.path.getsize('results.subunit'), 0)
+
+
+class TestRunTestsTerminated(tests.ImportingLocalFilesTest):
+
+    def setUp(self):
+        super(TestRunTestsTerminated, self).setUp()
+        tests.write_tree_from_desc('''dir: t
+file: t/__init__.py
+from sst import loaders
+discover = loaders.discoverRegularTests
+
+file: t/test_terminated.py
+import os
+import signal
+import unittest
+class TestTerminated(unittest.TestCase):
+    def test_1(self):
+        pass
+    def test_2(self):
+        os.kill(os.getpid(), signal.SIGTERM)
+    def test_3(self):
+        pass
+''')
+
+    def test_xml_report_is_completed(self):
+        out = StringIO()
+        previous_handler = signal.getsignal(signal.SIGTERM)
+        runtests.runtests(None, '.', out, test_dir='t',
+                          browser_factory=browsers.FirefoxFactory(),
+                          report_format='xml')
+        self.assertIn('Test run interrupted', out.getvalue())
+        self.assertIs(previous_handler, signal.getsignal(signal.SIGTERM))
+        doc = minidom.parse('results.xml')
+        testcases = doc.getElementsByTagName('testcase')
+        self.assertEqual(['test_1'],
+                         [t.getAttribute('name') for t in testcases])
+        testsuite = doc.documentElement
+        self.assertEqual('2', testsuite.getAttribute('tests'))
+
+
+class TestRunTestsConcurrentlyTerminated(tests.ImportingLocalFilesTest):
+
+    def setUp(self):
+        super(TestRunTestsConcurrentlyTerminated, self).setUp()
+        tests.write_tree_from_desc('''dir: t
+file: t/__init__.py
+from sst import loaders
+discover = loaders.discoverRegularTests
+
+file: t/test_terminated.py
+import os
+import signal
+import time
+import unittest
+class TestTerminated(unittest.TestCase):
+    def test_1(self):
+        # Terminate the main process
+        os.kill(os.getppid(), signal.SIGTERM)
+        time.sleep(30)
+    def test_2(self):
+        time.sleep(30)
+    def test_3(self):
+        pass
+    def test_4(self):
+        pass
+''')
+
+    def test_workers_are_stopped(self):
+        out = StringIO()
+        previous_handler = signal.getsignal(signal.SIGTERM)
+        start = time.time()
+        runtests.runtests(None, '.', out, test_dir='t',
+                          browser_factory=browsers.FirefoxFactory(),
+                          concurrency_num=2, report_format='xml')
+        self.assertLess(time.time() - start, 10)
+        self.assertIn('Test run interrupted', out.getvalue())
+        self.assertIs(previous_handler, signal.getsignal(signal.SIGTERM))
+        doc = minidom.parse('results.xml')
+        names = [t.getAttribute('name')
+                 for t in doc.getElementsByTagName('testcase')]
+        # The workers were killed (possibly before starting their first test)
+        # and not respawned to run the remaining tests
+        self.assertIn('test_1', names)
+        self.assertNotIn('test_3', names)
+        self.assertNotIn('test_4', names)
+
+
+class FakeXvfb(object):
+    """An Xvfb that doesn't start any server but sets DISPLAY."""
+
+    def __init__(self, width, height):
+        self.orig_display = os.environ.get('DISPLAY')
+
+    def start(self):
+        os.environ['DISPLAY'] = ':%d' % (os.getpid(),)
+
+    def stop(self):
+        with open('stopped', 'a') as f:
+            f.write(os.environ['DISPLAY'] + '\n')
+        if self.orig_display is None:
+            del os.environ['DISPLAY']
+        else:
+            os.environ['DISPLAY'] = self.orig_display
+
+
+class TestRunTestsHeadless(tests.ImportingLocalFilesTest):
+
+    def setUp(self):
+        super(TestRunTestsHeadless, self).setUp()
+        self.patch(xvfbdisplay, 'Xvfb', FakeXvfb)
+        tests.write_tree_from_desc('''dir: t
+file: t/__init__.py
+from sst import loaders
+discover = loaders.discoverRegularTests
+
+file: t/test_display.py
+import os
+import unittest
+class Test(unittest.TestCase):
+    def record_display(self):
+        with open('displays', 'a') as f:
+            f.write(os.environ['DISPLAY'] + '\\n')
+    def test_1(self):
+        self.record_display()
+    def test_2(self):
+        self.record_display()
+''')
+
+    def run_tests(self, concurrency_num):
+        out = StringIO()
+        failures = runtests.runtests(
+            ['^t'], 'no results directory used', out,
+            browser_factory=browsers.FirefoxFactory(),
+            concurrency_num=concurrency_num, xserver_headless=True)
+        self.assertEqual(0, failures)
+        with open('displays') as f:
+            displays = f.read().splitlines()
+        with open('stopped') as f:
+            stopped = f.read().splitlines()
+        return displays, stopped
+
+    def test_single_display(self):
+        displays, stopped = self.run_tests(1)
+        self.assertEqual([':%d' % (os.getpid(),)] * 2, displays)
+        self.assertEqual(displays[:1], stopped)
+
+    def test_display_per_worker(self):
+        displays, stopped = self.run_tests(2)
+        self.assertEqual(2, len(set(displays)))
+        self.assertNotIn(':%d' % (os.getpid(),), displays)
+        self.assertEqual(sorted(displays), sorted(stopped))
@@ -22,12 +22,16 @@ from cStringIO import StringIO
 import os
 import sys
 
+import mock
 import testtools
 
 from testtools import matchers
+from testtools.testresult import doubles
 
 from sst import (
+    browsers,
     cases,
+    results,
     tests,
 )
 
@@ -101,3 +105,101 @@ class TestScreenShotsAndPageDump(testtools.TestCase):
         self.run_failing_test(test)
         # No screenshot required, no files, not even a directory
         self.assertFalse(os.path.exists('results'))
+
+
+class TestDataRows(testtools.TestCase):
+
+    def setUp(self):
+        super(TestDataRows, self).setUp()
+        tests.set_cwd_to_tmp(self)
+        tests.write_tree_from_desc('''file: foo.csv
+'name'^'count'^'enabled'
+foo^1^true
+bar^2^False
+baz^3^[4]
+''')
+
+    def test_rows_are_loaded_lazily(self):
+        rows = cases.get_data_rows('foo.csv')
+        self.assertEqual([1, 2, 3], [row.row_num for row in rows])
+        self.assertEqual(dict(_row_num=2, name='bar', count=2, enabled=False),
+                         rows[1].load())
+        self.assertEqual(dict(_row_num=3, name='baz', count=3, enabled=[4]),
+                         rows[2].load())
+
+    def test_get_data(self):
+        self.assertEqual([dict(_row_num=1, name='foo', count=1, enabled=True),
+                          dict(_row_num=2, name='bar', count=2, enabled=False),
+                          dict(_row_num=3, name='baz', count=3, enabled=[4])],
+                         cases.get_data('foo.csv'))
+
+    def test_test_case_with_row(self):
+        row = cases.get_data_rows('foo.csv')[0]
+        test = cases.SSTScriptTestCase('.', 'foo.py', row)
+        self.assertIs(row, test.data_row)
+        self.assertEqual({}, test.context)
+
+    def assertSelected(self, expected, spec):
+        rows = cases.get_data_rows('foo.csv', cases.get_row_selector(spec))
+        self.assertEqual(expected, [row.row_num for row in rows])
+
+    def test_slice_selector(self):
+        self.assertSelected([2, 3], '1:')
+        self.assertSelected([1, 2], ':-1')
+        self.assertSelected([1, 3], '::2')
+
+    def test_shard_selector(self):
+        self.assertSelected([1, 3], '1/2')
+        self.assertSelected([2], '2/2')
+
+    def test_invalid_selector(self):
+        for spec in ('1', '0/2', '3/2', 'a:b', '1:2:3:4', '::0', 'a/b'):
+            self.assertRaises(ValueError, cases.get_row_selector, spec)
+
+
+class TestPhaseTimings(testtools.TestCase):
+
+    def setUp(self):
+        super(TestPhaseTimings, self).setUp()
+        tests.set_cwd_to_tmp(self)
+        with open('script.py', 'w') as f:
+            f.write('pass\n')
+
+    def run_script(self, pool):
+
+        class PooledScript(cases.SSTScriptTestCase):
+
+            # The pool provides mock browsers
+            browser_pool = pool
+
+        test = PooledScript('.', 'script.py')
+        result = doubles.ExtendedTestResult()
+        test.run(result)
+        outcome, _, details = result._events[1]
+        return outcome, results.get_phase_timings(details)
+
+    def test_phases(self):
+        outcome, timings = self.run_script(
+            mock.Mock(spec=browsers.BrowserPool))
+        self.assertEqual('addSuccess', outcome)
+        self.assertEqual(
+            ['compile', 'setup', 'browser_start', 'body', 'cleanup'],
+            [phase for phase, seconds in timings])
+
+    def test_browser_not_started(self):
+        pool = mock.Mock(spec=browsers.BrowserPool)
+        pool.checkout.side_effect = RuntimeError('No browser')
+        outcome, timings = self.run_script(pool)
+        self.assertEqual('addError', outcome)
+        self.assertEqual(['compile', 'setup', 'browser_start', 'cleanup'],
+                         [phase for phase, seconds in timings])
+
+    def test_failing_body(self):
+        with open('script.py', 'w') as f:
+            f.write('assert False\n')
+        outcome, timings = self.run_script(
+            mock.Mock(spec=browsers.BrowserPool))
+        self.assertEqual('addFailure', outcome)
+        self.assertEqual(
+            ['compile', 'setup', 'browser_start', 'body', 'cleanup'],
+            [phase for phase, seconds in timings])
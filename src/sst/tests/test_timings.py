@@ -0,0 +1,117 @@
+#
+#   Copyright (c) 2013 Canonical Ltd.
+#
+#   This file is part of: SST (selenium-simple-test)
+#   https://launchpad.net/selenium-simple-test
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+from cStringIO import StringIO
+import datetime
+import os
+
+import testtools
+
+from sst import (
+    browsers,
+    runtests,
+    tests,
+    timings,
+)
+
+
+class TestTimingHistory(testtools.TestCase):
+
+    def setUp(self):
+        super(TestTimingHistory, self).setUp()
+        tests.set_cwd_to_tmp(self)
+
+    def test_load_without_file(self):
+        history = timings.TimingHistory('timings.json')
+        history.load()
+        self.assertEqual({}, history.durations)
+
+    def test_load_invalid_file(self):
+        with open('timings.json', 'w') as f:
+            f.write('not json')
+        history = timings.TimingHistory('timings.json')
+        history.load()
+        self.assertEqual({}, history.durations)
+
+    def test_save_and_load(self):
+        history = timings.TimingHistory(os.path.join('results', 't.json'))
+        history.update('t.test_it', 2.5)
+        history.save()
+        loaded = timings.TimingHistory(os.path.join('results', 't.json'))
+        loaded.load()
+        self.assertEqual({'t.test_it': 2.5}, loaded.durations)
+
+    def test_default_duration(self):
+        history = timings.TimingHistory()
+        self.assertEqual(timings.DEFAULT_DURATION, history.default_duration())
+        for i, duration in enumerate([1.0, 30.0, 4.0]):
+            history.update('t%d' % (i,), duration)
+        self.assertEqual(4.0, history.default_duration())
+
+    def test_get_durations(self):
+        history = timings.TimingHistory()
+        history.update('sst.tests.Test.test_pass', 3.0)
+        history.update('sst.tests.Test.test_error', 7.0)
+        durations = history.get_durations()
+        self.assertEqual(3.0, durations(tests.get_case('pass')))
+        # Unknown tests get the default duration
+        self.assertEqual(7.0, durations(tests.get_case('fail')))
+
+
+class TestTimingRecorder(testtools.TestCase):
+
+    def test_records_durations(self):
+        history = timings.TimingHistory()
+        recorder = timings.TimingRecorder(history)
+        start = datetime.datetime(2013, 1, 1)
+        test = tests.get_case('pass')
+        recorder.startTestRun()
+        for elapsed in (1, 3):
+            recorder.time(start)
+            recorder.startTest(test)
+            recorder.time(start + datetime.timedelta(seconds=elapsed))
+            recorder.stopTest(test)
+        recorder.stopTestRun()
+        # Tests with the same id are averaged
+        self.assertEqual({'sst.tests.Test.test_pass': 2.0}, history.durations)
+
+
+class TestRunTestsTimings(tests.ImportingLocalFilesTest):
+
+    def test_timings_file_updated(self):
+        tests.write_tree_from_desc('''dir: t
+file: t/__init__.py
+from sst import loaders
+discover = loaders.discoverRegularTests
+
+file: t/test_timed.py
+import unittest
+class Test(unittest.TestCase):
+    def test_pass(self):
+        pass
+''')
+        runtests.runtests(
+            ['^t'], 'no results directory used', StringIO(),
+            concurrency_num=2,
+            browser_factory=browsers.FirefoxFactory(),
+            timings_file='timings.json')
+        history = timings.TimingHistory('timings.json')
+        history.load()
+        self.assertEqual(['t.test_timed.Test.test_pass'],
+                         history.durations.keys())
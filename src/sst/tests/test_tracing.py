@@ -0,0 +1,198 @@
+#
+#   Copyright (c) 2013 Canonical Ltd.
+#
+#   This file is part of: SST (selenium-simple-test)
+#   https://launchpad.net/selenium-simple-test
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+import json
+
+import mock
+import testtools
+from testtools import content
+from testtools.testresult import doubles
+
+from selenium.webdriver.remote import remote_connection
+from sst import (
+    browsers,
+    cases,
+    tests,
+    tracing,
+)
+
+
+class TestCommandTracer(testtools.TestCase):
+
+    def test_histogram(self):
+        tracer = tracing.CommandTracer()
+        tracer.command('click', 0, 0.5, 10, 20)
+        tracer.command('click', 1, 0.25, 10, 30)
+        tracer.command('get', 2, 1.0, 40, 5)
+        self.assertEqual(
+            {'click': dict(calls=2, time=0.75, sent=20, received=50),
+             'get': dict(calls=1, time=1.0, sent=40, received=5)},
+            tracer.histogram)
+        self.assertEqual([], tracer.events)
+
+    def test_events(self):
+        tracer = tracing.CommandTracer(keep_events=True)
+        tracer.start_test('t.foo')
+        tracer.command('click', 2.5, 0.5, 10, 20)
+        event = tracer.events[0]
+        self.assertEqual(
+            ('click', 'webdriver', 'X', 2500000, 500000),
+            (event['name'], event['cat'], event['ph'], event['ts'],
+             event['dur']))
+        self.assertEqual(dict(test='t.foo', sent=10, received=20),
+                         event['args'])
+        test_event, command_event = tracer.test_events()
+        self.assertEqual(('t.foo', 'test'),
+                         (test_event['name'], test_event['cat']))
+        self.assertIs(event, command_event)
+
+    def test_start_test(self):
+        tracer = tracing.CommandTracer(keep_events=True)
+        tracer.command('click', 0, 0.5, 10, 20)
+        tracer.start_test('t.foo')
+        self.assertEqual({}, tracer.histogram)
+        self.assertEqual([], tracer.events)
+
+
+class TestPayloadSize(testtools.TestCase):
+
+    def test_string(self):
+        self.assertEqual(5, tracing.payload_size('Title'))
+
+    def test_structure(self):
+        self.assertEqual(len('ELEMENT') + len('1') + len('2'),
+                         tracing.payload_size([{'ELEMENT': '1'}, 2, None]))
+
+
+class TestTracedConnection(testtools.TestCase):
+
+    def setUp(self):
+        super(TestTracedConnection, self).setUp()
+        self.connection = remote_connection.RemoteConnection(
+            'http://127.0.0.1:4444/wd/hub')
+        # Fake the HTTP layer, the sizes are measured on top of it
+        self.request = mock.Mock(
+            return_value={'status': 0, 'value': 'Title'})
+        self.patch(remote_connection.RemoteConnection, '_request',
+                   lambda connection, method, url, body=None: self.request(
+                       method, url, body))
+        self.original_execute = remote_connection.RemoteConnection.execute
+        self.original_request = remote_connection.RemoteConnection._request
+        tracing.enable()
+        self.addCleanup(tracing.disable)
+
+    def test_commands_are_recorded(self):
+        response = self.connection.execute('getTitle',
+                                           {'sessionId': 'session'})
+        self.assertEqual({'status': 0, 'value': 'Title'}, response)
+        stats = tracing.get_test_histogram()['getTitle']
+        # getTitle is a GET, there is no body to send
+        self.assertEqual((1, 0, len('Title')),
+                         (stats['calls'], stats['sent'], stats['received']))
+
+    def test_sent_body(self):
+        self.connection.execute('get', {'sessionId': 'session',
+                                        'url': 'http://example.com'})
+        sent_body = self.request.call_args[0][2]
+        stats = tracing.get_test_histogram()['get']
+        self.assertEqual(len(sent_body), stats['sent'])
+
+    def test_failing_command(self):
+        self.request.side_effect = IOError('Connection refused')
+        self.assertRaises(IOError, self.connection.execute, 'getTitle',
+                          {'sessionId': 'session'})
+        stats = tracing.get_test_histogram()['getTitle']
+        self.assertEqual((1, 0), (stats['calls'], stats['received']))
+
+    def test_disable(self):
+        tracing.disable()
+        self.assertEqual(self.original_execute,
+                         remote_connection.RemoteConnection.execute)
+        self.assertEqual(self.original_request,
+                         remote_connection.RemoteConnection._request)
+        self.connection.execute('getTitle', {'sessionId': 'session'})
+        self.assertEqual({}, tracing.get_test_histogram())
+
+
+class TestTracedTestCase(testtools.TestCase):
+
+    def run_traced(self, keep_events):
+        tracing.enable(keep_events)
+        self.addCleanup(tracing.disable)
+        connection = remote_connection.RemoteConnection(
+            'http://127.0.0.1:4444/wd/hub')
+        connection._request = mock.Mock(return_value={'status': 0})
+
+        class Traced(cases.SSTTestCase):
+
+            browser_pool = mock.Mock(spec=browsers.BrowserPool)
+
+            def test_it(self):
+                connection.execute('getTitle', {'sessionId': 'session'})
+
+        result = doubles.ExtendedTestResult()
+        Traced('test_it').run(result)
+        outcome, test, details = result._events[1]
+        self.assertEqual('addSuccess', outcome)
+        return test, details
+
+    def test_histogram_detail(self):
+        test, details = self.run_traced(False)
+        histogram = json.loads(
+            ''.join(details[tracing.DETAIL_NAME].iter_bytes()))
+        self.assertEqual(1, histogram['getTitle']['calls'])
+        self.assertNotIn(tracing.EVENTS_DETAIL_NAME, details)
+
+    def test_events_detail(self):
+        test, details = self.run_traced(True)
+        events = json.loads(
+            ''.join(details[tracing.EVENTS_DETAIL_NAME].iter_bytes()))
+        self.assertEqual([test.id(), 'getTitle'],
+                         [e['name'] for e in events])
+
+
+class TestTraceResult(testtools.TestCase):
+
+    def setUp(self):
+        super(TestTraceResult, self).setUp()
+        tests.set_cwd_to_tmp(self)
+
+    def add_success(self, result, events):
+        test = mock.Mock()
+        result.startTest(test)
+        result.addSuccess(test, details={
+            tracing.EVENTS_DETAIL_NAME: content.json_content(events)})
+        result.stopTest(test)
+
+    def test_trace_file(self):
+        result = tracing.TraceResult('results/trace.json')
+        result.startTestRun()
+        first = tracing.trace_event('t.foo', 'test', 1, 2, tid=1)
+        second = tracing.trace_event('t.bar', 'test', 3, 1, tid=1)
+        self.add_success(result, [first])
+        self.add_success(result, [second])
+        # Tests without events are ignored
+        test = mock.Mock()
+        result.startTest(test)
+        result.addSuccess(test)
+        result.stopTest(test)
+        result.stopTestRun()
+        with open('results/trace.json') as f:
+            trace = json.load(f)
+        self.assertEqual([first, second], trace['traceEvents'])
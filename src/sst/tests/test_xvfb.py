@@ -27,10 +27,32 @@ import testtools
 
 from sst import (
     cases,
+    tests,
     xvfbdisplay,
 )
 
 
+fake_xvfb = '''#!%s
+import os
+import socket
+import sys
+import time
+
+args = sys.argv[1:]
+if '-displayfd' in args:
+    if os.path.exists('no-displayfd'):
+        sys.exit(1)
+    fd = int(args[args.index('-displayfd') + 1])
+    os.write(fd, '42\\n')
+else:
+    display = args[0]
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.bind(os.path.join('sockets', 'X' + display[1:]))
+    sock.listen(1)
+time.sleep(60)
+''' % (sys.executable,)
+
+
 class TestXvfb(testtools.TestCase):
 
     def test_start(self):
@@ -49,6 +71,45 @@ class TestXvfb(testtools.TestCase):
         self.assertEquals(orig, os.environ['DISPLAY'])
 
 
+class TestXvfbStartup(testtools.TestCase):
+    """Start a fake Xvfb to check how the display is allocated."""
+
+    def setUp(self):
+        super(TestXvfbStartup, self).setUp()
+        tests.set_cwd_to_tmp(self)
+        with open('Xvfb', 'w') as f:
+            f.write(fake_xvfb)
+        os.chmod('Xvfb', 0755)
+        os.mkdir('sockets')
+        self.xvfb = xvfbdisplay.Xvfb()
+        self.xvfb.command = os.path.abspath('Xvfb')
+        self.xvfb.socket_dir = os.path.abspath('sockets')
+        self.xvfb.start_timeout = 10
+        self.addCleanup(self.xvfb.stop)
+
+    def test_displayfd(self):
+        self.xvfb.start()
+        self.assertEqual(42, self.xvfb.vdisplay_num)
+        self.assertEqual(':42', os.environ['DISPLAY'])
+        self.assertIsNone(self.xvfb.proc.poll())
+
+    def test_without_displayfd(self):
+        open('no-displayfd', 'w').close()
+        self.xvfb.start()
+        self.assertTrue(os.path.exists(
+            os.path.join('sockets', 'X%d' % (self.xvfb.vdisplay_num,))))
+        self.assertEqual(':%d' % (self.xvfb.vdisplay_num,),
+                         os.environ['DISPLAY'])
+        self.assertIsNone(self.xvfb.proc.poll())
+
+    def test_stop(self):
+        self.xvfb.start()
+        proc = self.xvfb.proc
+        self.xvfb.stop()
+        self.assertIsNotNone(proc.poll())
+        self.assertIsNone(self.xvfb.proc)
+
+
 class Headless(cases.SSTTestCase):
     """A specialized test class for tests around xvfb."""
 
@@ -0,0 +1,125 @@
+#
+#   Copyright (c) 2013 Canonical Ltd.
+#
+#   This file is part of: SST (selenium-simple-test)
+#   https://launchpad.net/selenium-simple-test
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+"""Test durations recorded across runs.
+
+The durations of the previous runs are used to balance the tests between the
+concurrent workers.
+"""
+
+import json
+import logging
+import os
+
+import testtools
+
+
+logger = logging.getLogger('SST')
+
+
+# The duration (in seconds) assumed for a test when nothing is known
+DEFAULT_DURATION = 10.0
+
+
+class TimingHistory(object):
+    """The durations of the tests in the previous runs, keyed by test id."""
+
+    def __init__(self, path=None):
+        """Create a timing history.
+
+        :param path: The file where the durations are persisted.
+        """
+        super(TimingHistory, self).__init__()
+        self.path = path
+        self.durations = {}
+
+    def load(self):
+        """Load the durations persisted by a previous run if any."""
+        try:
+            with open(self.path) as f:
+                durations = json.load(f)
+        except IOError:
+            # No previous run
+            return
+        except ValueError:
+            logger.warning('Ignoring invalid timing history: %s' % self.path)
+            return
+        self.durations.update(durations)
+
+    def save(self):
+        """Persist the durations for the next runs."""
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        # Don't leave a truncated file behind if we're interrupted
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.durations, f, indent=1, sort_keys=True)
+        os.rename(tmp, self.path)
+
+    def update(self, test_id, duration):
+        self.durations[test_id] = duration
+
+    def default_duration(self):
+        """The duration assumed for tests that never ran.
+
+        This is the median of the known durations so unknown tests are
+        neither scheduled first nor last.
+        """
+        if not self.durations:
+            return DEFAULT_DURATION
+        known = sorted(self.durations.values())
+        return known[len(known) // 2]
+
+    def get_durations(self):
+        """Return a callable giving the expected duration of a test."""
+        default = self.default_duration()
+
+        def duration(test):
+            return self.durations.get(test.id(), default)
+        return duration
+
+
+class TimingRecorder(testtools.TestResult):
+    """A TestResult updating a timing history with the tests durations.
+
+    The duration of tests sharing the same id (scripts with csv data files)
+    are averaged.
+    """
+
+    def __init__(self, history):
+        super(TimingRecorder, self).__init__()
+        self.history = history
+        self.run_durations = {}
+
+    def startTest(self, test):
+        super(TimingRecorder, self).startTest(test)
+        self.start_time = self._now()
+
+    def stopTest(self, test):
+        elapsed = self._now() - self.start_time
+        elapsed = (elapsed.days * 86400.0 + elapsed.seconds +
+                   elapsed.microseconds / 1000000.0)
+        self.run_durations.setdefault(test.id(), []).append(elapsed)
+        super(TimingRecorder, self).stopTest(test)
+
+    def stopTestRun(self):
+        for test_id, durations in self.run_durations.items():
+            self.history.update(test_id, sum(durations) / len(durations))
+        return super(TimingRecorder, self).stopTestRun()
@@ -0,0 +1,307 @@
+#
+#   Copyright (c) 2013 Canonical Ltd.
+#
+#   This file is part of: SST (selenium-simple-test)
+#   https://launchpad.net/selenium-simple-test
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+"""Tracing of the WebDriver commands sent to the browsers.
+
+Every action issues one or more WebDriver commands, each being a round trip
+to the driver or the grid. When enabled, the commands sent by the browsers
+the factories create are logged with their latency and the size of their
+payloads.
+
+A histogram of the commands of each test is attached to its result as a
+detail. The commands can also be recorded as events that `TraceResult`
+gathers from all the processes and saves in the Chrome trace format (see
+chrome://tracing).
+"""
+
+import functools
+import json
+import logging
+import os
+import thread
+import threading
+import time
+
+import testtools
+import testtools.content
+
+from selenium.webdriver.remote import remote_connection
+
+
+logger = logging.getLogger('SST')
+
+
+# The name of the test detail holding the commands histogram of the test
+DETAIL_NAME = 'WebDriver commands'
+# The name of the test detail holding the trace events of the test
+EVENTS_DETAIL_NAME = 'WebDriver trace'
+
+
+class CommandTracer(object):
+    """Record the WebDriver commands sent during the current test.
+
+    The browsers can be started in another thread (see
+    `browsers.BrowserFactory.prelaunch`) so the commands are recorded under a
+    lock.
+    """
+
+    def __init__(self, keep_events=False):
+        """Create a command tracer.
+
+        :param keep_events: Whether each command is recorded as a trace
+            event on top of the histogram.
+        """
+        super(CommandTracer, self).__init__()
+        self.keep_events = keep_events
+        self.lock = threading.Lock()
+        self.start_test()
+
+    def start_test(self, test_id=None):
+        with self.lock:
+            self.test_id = test_id
+            self.start = time.time()
+            self.histogram = {}
+            self.events = []
+
+    def command(self, name, start, elapsed, sent, received):
+        """Record a command.
+
+        :param name: The WebDriver command name.
+        :param start: When the command was sent (seconds since the epoch).
+        :param elapsed: How long the command took (in seconds).
+        :param sent: The size of the command payload (in bytes).
+        :param received: The approximate size of the response payload (in
+            bytes, see `payload_size`).
+        """
+        logger.debug('WebDriver %s: %.1f ms, %d bytes sent, %d received',
+                     name, 1000 * elapsed, sent, received)
+        with self.lock:
+            add_stats(self.histogram, name,
+                      dict(calls=1, time=elapsed, sent=sent,
+                           received=received))
+            if self.keep_events:
+                self.events.append(
+                    trace_event(name, 'webdriver', start, elapsed,
+                                tid=thread.get_ident(),
+                                args=dict(test=self.test_id, sent=sent,
+                                          received=received)))
+
+    def test_events(self):
+        """Return the events of the current test, including the test one."""
+        with self.lock:
+            test_event = trace_event(self.test_id, 'test', self.start,
+                                     time.time() - self.start,
+                                     tid=thread.get_ident())
+            return [test_event] + self.events
+
+
+def add_stats(stats, name, added):
+    """Add the `added` counters to the ones of `name` in `stats`."""
+    current = stats.setdefault(name, dict(calls=0, time=0.0, sent=0,
+                                          received=0))
+    for key, value in added.items():
+        current[key] += value
+
+
+def trace_event(name, category, start, elapsed, tid, args=None):
+    """Return a complete event in the Chrome trace format.
+
+    :param start: When the event started (seconds since the epoch).
+    :param elapsed: How long the event lasted (in seconds).
+    """
+    event = dict(name=name, cat=category, ph='X', ts=int(start * 1000000),
+                 dur=int(elapsed * 1000000), pid=os.getpid(), tid=tid)
+    if args is not None:
+        event['args'] = args
+    return event
+
+
+def payload_size(value):
+    """Return the approximate size of a decoded json payload (in bytes).
+
+    The strings (where the large payloads like screenshots or page sources
+    are) are counted as is, the payload is not encoded again to measure it.
+    """
+    if isinstance(value, basestring):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(len(key) + payload_size(item)
+                   for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return sum(payload_size(item) for item in value)
+    if value is None:
+        return 0
+    return len(str(value))
+
+
+# The tracer of the current process, None when tracing is disabled
+_tracer = None
+# The original RemoteConnection.execute and _request, restored by disable()
+_original_execute = None
+_original_request = None
+# The bytes sent for the command running in each thread
+_sent = threading.local()
+
+
+def is_enabled():
+    return _tracer is not None
+
+
+def enable(keep_events=False):
+    """Start tracing the WebDriver commands.
+
+    All the browsers created by the factories in `sst.browsers` (local or
+    remote) send their commands through a `RemoteConnection` which is
+    wrapped here.
+
+    :param keep_events: Whether the commands are also recorded as trace
+        events.
+    """
+    global _tracer, _original_execute, _original_request
+    if _tracer is not None:
+        return
+    _tracer = CommandTracer(keep_events)
+    execute = remote_connection.RemoteConnection.execute
+    _original_execute = execute
+    request = remote_connection.RemoteConnection._request
+    _original_request = request
+
+    @functools.wraps(execute)
+    def traced_execute(self, command, params):
+        if _tracer is None:
+            return execute(self, command, params)
+        _sent.bytes = 0
+        start = time.time()
+        response = None
+        try:
+            response = execute(self, command, params)
+            return response
+        finally:
+            elapsed = time.time() - start
+            if response is None:
+                received = 0
+            else:
+                received = payload_size(response.get('value'))
+            _tracer.command(command, start, elapsed, _sent.bytes, received)
+
+    # The request body is the json encoded by selenium, measuring it there
+    # avoids encoding the command parameters again
+    @functools.wraps(request)
+    def traced_request(self, method, url, body=None):
+        if body and method in ('POST', 'PUT'):
+            _sent.bytes = getattr(_sent, 'bytes', 0) + len(body)
+        return request(self, method, url, body)
+    remote_connection.RemoteConnection.execute = traced_execute
+    remote_connection.RemoteConnection._request = traced_request
+
+
+def disable():
+    """Stop tracing the WebDriver commands."""
+    global _tracer, _original_execute, _original_request
+    if _tracer is None:
+        return
+    remote_connection.RemoteConnection.execute = _original_execute
+    remote_connection.RemoteConnection._request = _original_request
+    _original_execute = None
+    _original_request = None
+    _tracer = None
+
+
+def start_test(test_id):
+    """Start recording the commands of a new test."""
+    if _tracer is not None:
+        _tracer.start_test(test_id)
+
+
+def get_test_histogram():
+    """Return the commands histogram of the current test."""
+    if _tracer is None:
+        return {}
+    return _tracer.histogram
+
+
+def add_trace_details(test):
+    """Attach the commands of the current test to it."""
+    if _tracer is None:
+        return
+    histogram = get_test_histogram()
+    if histogram:
+        test.addDetail(DETAIL_NAME,
+                       testtools.content.json_content(histogram))
+    if _tracer.keep_events:
+        test.addDetail(EVENTS_DETAIL_NAME,
+                       testtools.content.json_content(_tracer.test_events()))
+
+
+class TraceResult(testtools.TestResult):
+    """A TestResult gathering the trace events of the tests.
+
+    The events are saved in the Chrome trace format at the end of the run.
+    """
+
+    def __init__(self, path):
+        """Create a trace result.
+
+        :param path: The file the trace is saved to.
+        """
+        super(TraceResult, self).__init__()
+        self.path = path
+        self.events = []
+
+    def _record(self, details):
+        if not details or EVENTS_DETAIL_NAME not in details:
+            return
+        content = details[EVENTS_DETAIL_NAME]
+        self.events.extend(json.loads(''.join(content.iter_bytes())))
+
+    def addSuccess(self, test, details=None):
+        self._record(details)
+        super(TraceResult, self).addSuccess(test, details=details)
+
+    def addFailure(self, test, err=None, details=None):
+        self._record(details)
+        super(TraceResult, self).addFailure(test, err, details=details)
+
+    def addError(self, test, err=None, details=None):
+        self._record(details)
+        super(TraceResult, self).addError(test, err, details=details)
+
+    def addSkip(self, test, reason=None, details=None):
+        self._record(details)
+        super(TraceResult, self).addSkip(test, reason, details=details)
+
+    def addExpectedFailure(self, test, err=None, details=None):
+        self._record(details)
+        super(TraceResult, self).addExpectedFailure(test, err,
+                                                    details=details)
+
+    def addUnexpectedSuccess(self, test, details=None):
+        self._record(details)
+        super(TraceResult, self).addUnexpectedSuccess(test, details=details)
+
+    def stopTestRun(self):
+        self.save()
+        return super(TraceResult, self).stopTestRun()
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        with open(self.path, 'w') as f:
+            json.dump(dict(traceEvents=self.events, displayTimeUnit='ms'), f)
@@ -22,15 +22,25 @@
 #   inspired by PyVirtualDisplay: http://pypi.python.org/pypi/PyVirtualDisplay
 #
 
+import errno
 import os
 import fnmatch
 import random
+import select
+import socket
 import subprocess
 import time
 
 
 class Xvfb(object):
 
+    # The Xvfb executable
+    command = 'Xvfb'
+    # Where the X servers listen for local connections
+    socket_dir = '/tmp/.X11-unix'
+    # How long (in seconds) the server has to accept connections
+    start_timeout = 30
+
     def __init__(self, width=1024, height=768, colordepth=24):
         self.width = width
         self.height = height
@@ -43,22 +53,118 @@ class Xvfb(object):
             self.old_display_num = 0
 
     def start(self):
-        self.vdisplay_num = self.search_for_free_display()
-        self.xvfb_cmd = [
-            'Xvfb', ':%d' % (self.vdisplay_num,), '-screen', '0',
-            '%dx%dx%d' % (self.width, self.height, self.colordepth)]
-        self.proc = subprocess.Popen(self.xvfb_cmd,
-                                     stdout=open(os.devnull),
-                                     stderr=open(os.devnull),)
-        time.sleep(0.1)  # give Xvfb time to start
+        """Start the server and redirect DISPLAY to it.
+
+        This returns once the server accepts connections.
+        """
+        self.vdisplay_num = self._start_with_displayfd()
+        if self.vdisplay_num is None:
+            # Older servers don't support -displayfd
+            self.vdisplay_num = self._start_on_free_display()
         self._redirect_display(self.vdisplay_num)
 
     def stop(self):
         self._redirect_display(self.old_display_num)
         if self.proc is not None:
-            self.proc.terminate()
-            self.proc.wait()
-            self.proc = None
+            self._kill()
+
+    def _kill(self):
+        self.proc.terminate()
+        self.proc.wait()
+        if self.proc.stdout is not None:
+            self.proc.stdout.close()
+        self.proc = None
+
+    def _spawn(self, display_args, stdout=None):
+        self.xvfb_cmd = [self.command] + display_args + [
+            '-screen', '0',
+            '%dx%dx%d' % (self.width, self.height, self.colordepth)]
+        if stdout is None:
+            stdout = open(os.devnull)
+        # The server should not hold the pipes of the test workers (among
+        # others), hence close_fds.
+        self.proc = subprocess.Popen(self.xvfb_cmd,
+                                     stdout=stdout,
+                                     stderr=open(os.devnull),
+                                     close_fds=True)
+
+    def _start_with_displayfd(self):
+        """Let the server pick a free display.
+
+        The server writes the display number on its stdout once it accepts
+        connections, this avoids races with the other servers starting.
+
+        :returns: The display number or None if the server doesn't support
+            -displayfd.
+        """
+        self._spawn(['-displayfd', '1'], stdout=subprocess.PIPE)
+        # The pipe is kept open until the server stops so it never gets a
+        # SIGPIPE.
+        output = self._read_until_eol(self.proc.stdout.fileno())
+        if not output:
+            # The server exited without reporting a display
+            self._kill()
+            return None
+        return int(output)
+
+    def _read_until_eol(self, fd):
+        deadline = time.time() + self.start_timeout
+        output = ''
+        while not output.endswith('\n'):
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                self._fail_to_start()
+            readable, _, _ = select.select([fd], [], [], remaining)
+            if not readable:
+                continue
+            data = os.read(fd, 64)
+            if not data:
+                # EOF, the server is gone
+                break
+            output += data
+        return output.strip()
+
+    def _start_on_free_display(self, max_attempts=10):
+        """Start the server on the first free display we can find.
+
+        Another server can claim the same display in the mean time, we then
+        try another one.
+        """
+        for attempt in range(max_attempts):
+            display_num = self.search_for_free_display()
+            self._spawn([':%d' % (display_num,)])
+            if self._wait_for_connections(display_num):
+                return display_num
+            # The server exited, most probably because the display was taken
+            self._kill()
+        raise RuntimeError('Cannot find a free display for Xvfb')
+
+    def _wait_for_connections(self, display_num):
+        """Wait for the server to accept connections.
+
+        :returns: False if the server exited.
+        """
+        path = os.path.join(self.socket_dir, 'X%d' % (display_num,))
+        deadline = time.time() + self.start_timeout
+        while time.time() < deadline:
+            if self.proc.poll() is not None:
+                return False
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.connect(path)
+                return True
+            except socket.error as e:
+                if e.errno not in (errno.ENOENT, errno.ECONNREFUSED):
+                    raise
+            finally:
+                sock.close()
+            time.sleep(0.01)
+        self._fail_to_start()
+
+    def _fail_to_start(self):
+        self._kill()
+        raise RuntimeError('Xvfb did not accept connections after %s seconds'
+                           % (self.start_timeout,))
 
     def search_for_free_display(self):
         ls = map(lambda x: int(x.split('X')[1].split('-')[0]),